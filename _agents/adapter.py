@@ -1,6 +1,8 @@
-import re
+import time
+import asyncio
+import inspect
 from dataclasses import dataclass
-from typing import Optional, Callable
+from typing import Callable, Iterator, Optional
 from agents.stream_events import StreamEvent
 from agents import (
     AgentUpdatedStreamEvent,
@@ -13,10 +15,21 @@ from _agents.events import (
     AgentChangedEvent,
     MessageDeltaEvent,
     NewMessageEvent,
+    ThinkDeltaEvent,
     ToolCalledEvent,
     ToolCallOutputEvent,
     EventName,
 )
+from _agents.think import ThinkParser, split_think
+from metrics import (
+    chat_cancelled_tokens_total,
+    chat_cancelled_total,
+    chat_output_tokens,
+    chat_tokens_per_second,
+    chat_ttft_seconds,
+    stream_events_total,
+    tool_call_seconds,
+)
 from openai.types.responses import ResponseTextDeltaEvent
 
 
@@ -25,80 +38,256 @@ class StreamEventAdapter:
     event_iterator: AsyncIterator
     handlers: dict[EventName, Callable]
 
-    def __init__(self, event_interator: AsyncIterator) -> None:
+    def __init__(
+        self,
+        event_interator: AsyncIterator,
+        record: bool = False,
+        on_cancel: Optional[Callable[[], None]] = None,
+    ) -> None:
         self.event_iterator = event_interator
         self.handlers = {}
-        # pre-compiled regex patterns to improve performance
-        self._think_pattern = re.compile(r"<think>(.*?)</think>", re.DOTALL)
-        self._think_remove_pattern = re.compile(r"<think>.*?</think>", re.DOTALL)
+        # processed events are kept here when recording, e.g. for the response cache
+        self.recorded: Optional[list[BaseEvent]] = [] if record else None
+        # splits streamed text into reasoning and answer as it arrives
+        self._think_parser = ThinkParser()
+        # the runner starts streaming when the adapter is created
+        self.started_at = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.output_chars = 0
+        self._tool_calls: dict[str, tuple[str, float]] = {}
+        # stops the producer of the events, e.g. `RunResultStreaming.cancel`
+        self.on_cancel = on_cancel
+        self.completed = False
+        self.cancelled = False
+        self.current_agent: Optional[str] = None
+        # deltas of the message being written, not yet in a NewMessageEvent
+        self._content: list[str] = []
+        self._thinking: list[str] = []
 
     def register_handler(self, event_name: EventName, handler: Callable) -> None:
         self.handlers[event_name] = handler
 
-    def _handle_agent_updated(
-        self, event: AgentUpdatedStreamEvent
-    ) -> Optional[BaseEvent]:
+    def _handle_agent_updated(self, event: AgentUpdatedStreamEvent) -> BaseEvent:
         return AgentChangedEvent(current_agent=event.new_agent.name)
 
     def _handle_raw_response(
         self, event: RawResponsesStreamEvent
-    ) -> Optional[BaseEvent]:
-        if not isinstance(event.data, ResponseTextDeltaEvent):
-            return None
-        return MessageDeltaEvent(delta=event.data.delta)
+    ) -> Iterator[BaseEvent]:
+        if isinstance(event.data, ResponseTextDeltaEvent):
+            yield from self._think_parser.feed(event.data.delta)
 
-    def _handle_run_item(self, event: RunItemStreamEvent) -> Optional[BaseEvent]:
+    def _handle_run_item(self, event: RunItemStreamEvent) -> Iterator[BaseEvent]:
         match event.name:
             case "handoff_occured":
-                return AgentChangedEvent(current_agent=event.item.target_agent.name)
+                yield AgentChangedEvent(current_agent=event.item.target_agent.name)
             case "message_output_created":
-                content = event.item.raw_item.content[0].text
-                # 使用预编译的正则表达式提高性能
-                cleaned_text = self._think_remove_pattern.sub("", content)
-                think_match = self._think_pattern.search(content)
-                think = think_match.group(1) if think_match else None
-                return NewMessageEvent(
-                    content=cleaned_text,
-                    think=think,
-                    agent=event.item.agent.name,
-                )
+                # the end of the streamed text is observed before the message
+                # is built from it
+                yield from self._think_parser.flush()
+                yield self._new_message(event)
             case "tool_called":
-                return ToolCalledEvent(
+                yield ToolCalledEvent(
                     args=event.item.raw_item.arguments,
                     tool_name=event.item.raw_item.name,
                     tool_call_id=event.item.raw_item.call_id,
                 )
             case "tool_output":
-                return ToolCallOutputEvent(
+                yield ToolCallOutputEvent(
                     output=event.item.raw_item.get("output"),
                     call_id=event.item.raw_item.get("call_id"),
                 )
-            case _:
-                return None
 
-    def handle_event(self, event: Optional[BaseEvent]):
+    def _new_message(self, event: RunItemStreamEvent) -> NewMessageEvent:
+        if self._content or self._thinking:
+            content = "".join(self._content)
+            think = "".join(self._thinking) or None
+        else:
+            # nothing was streamed, e.g. a model that does not stream deltas
+            content, think = split_think(event.item.raw_item.content[0].text)
+        return NewMessageEvent(
+            content=content, think=think, agent=event.item.agent.name
+        )
+
+    def _observe(self, event: BaseEvent) -> None:
+        stream_events_total.inc(event=event.name.value)
+        match event:
+            case MessageDeltaEvent() | ThinkDeltaEvent():
+                if self.first_token_at is None:
+                    self.first_token_at = time.perf_counter()
+                    chat_ttft_seconds.observe(self.first_token_at - self.started_at)
+                self.output_chars += len(event.delta)
+                if isinstance(event, ThinkDeltaEvent):
+                    self._thinking.append(event.delta)
+                else:
+                    self._content.append(event.delta)
+            case NewMessageEvent():
+                self._content.clear()
+                self._thinking.clear()
+            case AgentChangedEvent():
+                self.current_agent = event.current_agent
+            case ToolCalledEvent():
+                self._tool_calls[event.tool_call_id] = (
+                    event.tool_name,
+                    time.perf_counter(),
+                )
+            case ToolCallOutputEvent():
+                call = self._tool_calls.pop(event.call_id, None)
+                if call is not None:
+                    tool_call_seconds.observe(
+                        time.perf_counter() - call[1], tool=call[0]
+                    )
+
+    def _observe_end(self) -> None:
+        chat_output_tokens.observe(self.output_chars / 4)
+        if self.first_token_at is None:
+            return
+        elapsed = time.perf_counter() - self.first_token_at
+        if elapsed > 0:
+            # same four characters per token estimate as the history window
+            chat_tokens_per_second.observe(self.output_chars / 4 / elapsed)
+
+    def cancel(self, reason: str = "disconnect") -> None:
+        """Stop the run, a no-op once it completed or was cancelled."""
+        if self.completed or self.cancelled:
+            return
+        self.cancelled = True
+        if self.on_cancel is not None:
+            self.on_cancel()
+        chat_cancelled_total.inc(reason=reason)
+        # same four characters per token estimate as the history window
+        generated = self.output_chars / 4
+        chat_cancelled_tokens_total.inc(generated, kind="wasted")
+        # what was not generated, guessed from the length of completed answers
+        completed = chat_output_tokens.count()
+        if completed:
+            expected = chat_output_tokens.sum() / completed
+            chat_cancelled_tokens_total.inc(max(expected - generated, 0), kind="saved")
+
+    def partial_message(self, default_agent: str) -> Optional[NewMessageEvent]:
+        """The message the run was writing when it was cancelled, if any."""
+        if not self._content and not self._thinking:
+            return None
+        return NewMessageEvent(
+            content="".join(self._content),
+            think="".join(self._thinking) or None,
+            agent=self.current_agent or default_agent,
+        )
+
+    async def handle_event(self, event: Optional[BaseEvent]):
         if event is None:
             return
+        self._observe(event)
         handler = self.handlers.get(event.name)
         if handler is None:
             return
-        handler(event)
+        # handlers may be plain callables or coroutine functions
+        result = handler(event)
+        if inspect.isawaitable(result):
+            await result
 
-    def process_event(self, event: StreamEvent) -> Optional[BaseEvent]:
-        processed_event = None
+    def _convert(self, event: StreamEvent) -> Iterator[BaseEvent]:
         match event:
             case AgentUpdatedStreamEvent():
-                processed_event = self._handle_agent_updated(event)
+                yield self._handle_agent_updated(event)
             case RawResponsesStreamEvent():
-                processed_event = self._handle_raw_response(event)
+                yield from self._handle_raw_response(event)
             case RunItemStreamEvent():
-                processed_event = self._handle_run_item(event)
-        self.handle_event(processed_event)
-        return processed_event
+                yield from self._handle_run_item(event)
+            case BaseEvent():
+                # already processed, e.g. replayed from the response cache
+                yield event
+
+    async def process_event(self, event: StreamEvent) -> list[BaseEvent]:
+        """Events for one runner event, each handled before the next is built."""
+        processed_events = []
+        for processed_event in self._convert(event):
+            await self.handle_event(processed_event)
+            processed_events.append(processed_event)
+        return processed_events
 
-    async def stream_events(self):
+    async def events(self) -> AsyncIterator[BaseEvent]:
         async for event in self.event_iterator:
-            processed_event = self.process_event(event)
-            if processed_event is None:
+            if self.cancelled:
+                break
+            for processed_event in await self.process_event(event):
+                if self.recorded is not None:
+                    self.recorded.append(processed_event)
+                yield processed_event
+        if not self.cancelled:
+            self.completed = True
+            self._observe_end()
+
+
+async def wait_for_disconnect(receive: Callable) -> None:
+    """Return once the client of an ASGI request has disconnected."""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+DeltaEvent = MessageDeltaEvent | ThinkDeltaEvent
+
+
+def _merge_deltas(deltas: list[DeltaEvent]) -> DeltaEvent:
+    if len(deltas) == 1:
+        return deltas[0]
+    return type(deltas[0])(
+        delta="".join(d.delta for d in deltas), timestamp=deltas[0].timestamp
+    )
+
+
+async def coalesce_deltas(
+    events: AsyncIterator[BaseEvent],
+    window: Optional[float] = None,
+    max_bytes: Optional[int] = None,
+) -> AsyncIterator[BaseEvent]:
+    """
+    Merge consecutive MessageDeltaEvents, and consecutive ThinkDeltaEvents.
+
+    Buffered deltas are emitted once `window` seconds have passed since the first
+    one arrived, once they reach `max_bytes`, or before any other event.
+    """
+    loop = asyncio.get_running_loop()
+    iterator = events.__aiter__()
+    pending: list[DeltaEvent] = []
+    size = 0
+    deadline = None
+    next_event = None
+    try:
+        while True:
+            if next_event is None:
+                next_event = asyncio.ensure_future(iterator.__anext__())
+            if deadline is not None:
+                timeout = max(deadline - loop.time(), 0)
+                done, _ = await asyncio.wait({next_event}, timeout=timeout)
+                if not done:
+                    # window elapsed while the model is quiet, flush what we have
+                    yield _merge_deltas(pending)
+                    pending, size, deadline = [], 0, None
+                    continue
+            try:
+                event = await next_event
+            except StopAsyncIteration:
+                break
+            finally:
+                if next_event.done():
+                    next_event = None
+            if pending and type(event) is not type(pending[0]):
+                yield _merge_deltas(pending)
+                pending, size, deadline = [], 0, None
+            if isinstance(event, (MessageDeltaEvent, ThinkDeltaEvent)):
+                pending.append(event)
+                size += len(event.delta.encode())
+                if max_bytes is not None and size >= max_bytes:
+                    yield _merge_deltas(pending)
+                    pending, size, deadline = [], 0, None
+                elif deadline is None and window is not None:
+                    deadline = loop.time() + window
                 continue
-            yield processed_event.serialize()
+            yield event
+        if pending:
+            yield _merge_deltas(pending)
+    finally:
+        if next_event is not None:
+            next_event.cancel()
@@ -1,7 +1,7 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional
 from uuid import UUID
-from services.conversation import ConversationService
+from services.conversation import AsyncConversationService
 
 
 class AgentContext(BaseModel):
@@ -12,10 +12,10 @@ class AgentContext(BaseModel):
 
 
 class ConversationStore:
-    def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+    async def get(self, conversation_id: str) -> Optional["ConversationState"]:
         pass
 
-    def save(self, conversation_id: str, state: Dict[str, Any]):
+    async def save(self, conversation_id: str, state: "ConversationState"):
         pass
 
 
@@ -31,16 +31,15 @@ class ConversationState(BaseModel):
 
 
 class SQLConversationStore(ConversationStore):
-    def get(self, conversation_id: UUID) -> Optional[ConversationState]:
-        conversation = ConversationService.get_conversation(conversation_id)
-        if not conversation:
+    """State store backed by the conversation table and the in-process state cache."""
+
+    async def get(self, conversation_id: UUID) -> Optional[ConversationState]:
+        state = await AsyncConversationService.get_state(conversation_id)
+        if state is None:
             return None
-        return conversation.state
-
-    def save(self, conversation_id: UUID, state: ConversationState):
-        conversation = ConversationService.get_conversation(conversation_id)
-        if not conversation:
-            return
-        ConversationService.update_conversation(
-            conversation_id=conversation_id, state=state.model_dump()
+        return ConversationState(**state)
+
+    async def save(self, conversation_id: UUID, state: ConversationState):
+        await AsyncConversationService.update_conversation_state(
+            conversation_id=conversation_id, state=state.to_dict()
         )
@@ -0,0 +1,73 @@
+import hashlib
+import importlib
+import math
+import re
+from abc import ABC, abstractmethod
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:  # optional, only needed for history retrieval
+    np = None
+
+# latin words and numbers, or single CJK characters
+TOKEN_PATTERN = re.compile(r"[^\W぀-ヿ㐀-鿿]+|[぀-ヿ㐀-鿿]")
+CJK_PATTERN = re.compile(r"[぀-ヿ㐀-鿿]")
+
+
+class Embedder(ABC):
+    """Turns texts into L2-normalised float32 vectors of `dim` dimensions."""
+
+    dim: int
+
+    @abstractmethod
+    def embed(self, texts: list[str]) -> "np.ndarray":
+        """One row per text, in order."""
+
+
+def tokenize(text: str) -> list[str]:
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    # CJK text has no spaces, neighbouring characters stand in for words
+    cjk = [t for t in tokens if CJK_PATTERN.fullmatch(t)]
+    return tokens + [a + b for a, b in zip(cjk, cjk[1:])]
+
+
+class HashingEmbedder(Embedder):
+    """
+    Feature hashing of word and CJK bigram counts.
+
+    Deterministic and local: it needs no model and no network, which makes it
+    the default for tests and small deployments. It matches shared words, not
+    meaning, plug in a model based embedder for that.
+    """
+
+    def __init__(self, dim: int = 384) -> None:
+        self.dim = dim
+
+    def _bucket(self, token: str) -> tuple[int, float]:
+        digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        return value % self.dim, 1.0 if value >> 63 else -1.0
+
+    def embed(self, texts: list[str]) -> "np.ndarray":
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token, count in Counter(tokenize(text)).items():
+                index, sign = self._bucket(token)
+                vectors[row, index] += sign * (1 + math.log(count))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+def get_embedder(name: str, dim: int) -> Embedder:
+    """`hashing`, or `package.module:attr` naming an Embedder class or factory."""
+    if name == "hashing":
+        return HashingEmbedder(dim)
+    module_name, _, attr = name.partition(":")
+    if not attr:
+        raise ValueError(f"unknown embedder: {name}")
+    factory = getattr(importlib.import_module(module_name), attr)
+    embedder = factory()
+    if not isinstance(embedder, Embedder):
+        raise ValueError(f"{name} did not return an Embedder")
+    return embedder
@@ -0,0 +1,113 @@
+import json
+from typing import Union
+from _agents.events import BaseEvent, EventName
+
+try:
+    import msgpack
+except ImportError:  # optional, only needed for the msgpack wire format
+    msgpack = None
+
+# one letter event codes used by the compact encodings
+EVENT_CODES: dict[EventName, str] = {
+    EventName.AGENT_CHANGED_EVENT: "a",
+    EventName.MESSAGE_DELTA_EVENT: "d",
+    EventName.THINK_DELTA_EVENT: "r",
+    EventName.NEW_MESSAGE_EVENT: "m",
+    EventName.TOOL_CALLED_EVENT: "t",
+    EventName.TOOL_CALL_OUTPUT_EVENT: "o",
+    EventName.RUN_STARTED_EVENT: "s",
+    EventName.RUN_ENDED_EVENT: "f",
+    EventName.EVENTS_DROPPED_EVENT: "g",
+}
+
+SHORT_KEYS: dict[str, str] = {
+    "name": "e",
+    "timestamp": "ts",
+    "current_agent": "a",
+    "agent": "a",
+    "delta": "d",
+    "content": "c",
+    "think": "k",
+    "tool_name": "n",
+    "tool_call_id": "i",
+    "call_id": "i",
+    "args": "p",
+    "output": "o",
+}
+
+
+def compact_dict(event: BaseEvent) -> dict:
+    """Short-key representation of an event, None fields are dropped."""
+    data = {}
+    for key, value in event.__dict__.items():
+        if value is None:
+            continue
+        if key == "name":
+            value = EVENT_CODES.get(value, value)
+        elif key == "timestamp":
+            value = round(value, 3)
+        data[SHORT_KEYS.get(key, key)] = value
+    return data
+
+
+class StreamEncoder:
+    """Turns adapter events into response body chunks."""
+
+    name = "ndjson"
+    media_type = "application/x-ndjson"
+
+    def encode(self, event: BaseEvent) -> Union[str, bytes]:
+        return event.serialize()
+
+    def encode_at(self, event: BaseEvent, offset: int) -> Union[str, bytes]:
+        """Chunk of the event at `offset` of a run's event log."""
+        return self.encode(event)
+
+
+class CompactEncoder(StreamEncoder):
+    name = "compact"
+    media_type = "application/x-ndjson"
+
+    def encode(self, event: BaseEvent) -> str:
+        return (
+            json.dumps(compact_dict(event), ensure_ascii=False, separators=(",", ":"))
+            + "\n"
+        )
+
+
+class MsgpackEncoder(StreamEncoder):
+    # msgpack objects are self-delimiting, frames are simply concatenated
+    name = "msgpack"
+    media_type = "application/x-msgpack"
+
+    def encode(self, event: BaseEvent) -> bytes:
+        return msgpack.packb(compact_dict(event))
+
+
+class SSEEncoder(StreamEncoder):
+    # the id of an event is the offset to resume after it, so a reconnecting
+    # EventSource sends it back as Last-Event-ID
+    name = "sse"
+    media_type = "text/event-stream"
+
+    def encode(self, event: BaseEvent) -> str:
+        return f"data: {event.model_dump_json()}\n\n"
+
+    def encode_at(self, event: BaseEvent, offset: int) -> str:
+        return f"id: {offset + 1}\n" + self.encode(event)
+
+
+ENCODERS: dict[str, type[StreamEncoder]] = {
+    "ndjson": StreamEncoder,
+    "compact": CompactEncoder,
+    "msgpack": MsgpackEncoder,
+    "sse": SSEEncoder,
+}
+
+
+def get_encoder(name: str) -> StreamEncoder:
+    if name not in ENCODERS:
+        raise ValueError(f"unknown stream encoding: {name}")
+    if name == "msgpack" and msgpack is None:
+        raise ValueError("msgpack encoding requires the msgpack package")
+    return ENCODERS[name]()
@@ -6,13 +6,17 @@ from enum import Enum
 class EventName(str, Enum):
     AGENT_CHANGED_EVENT = "AgentChangedEvent"
     MESSAGE_DELTA_EVENT = "MessageDeltaEvent"
+    THINK_DELTA_EVENT = "ThinkDeltaEvent"
     NEW_MESSAGE_EVENT = "NewMessageEvent"
     TOOL_CALLED_EVENT = "ToolCalledEvent"
     TOOL_CALL_OUTPUT_EVENT = "ToolCallOutputEvent"
+    RUN_STARTED_EVENT = "RunStartedEvent"
+    RUN_ENDED_EVENT = "RunEndedEvent"
+    EVENTS_DROPPED_EVENT = "EventsDroppedEvent"
 
 
 class BaseEvent(BaseModel):
-    timestamp: float = Field(default=time.time())
+    timestamp: float = Field(default_factory=time.time)
 
     def serialize(self) -> str:
         return self.model_dump_json() + "\n"
@@ -28,6 +32,13 @@ class MessageDeltaEvent(BaseEvent):
     delta: str
 
 
+class ThinkDeltaEvent(BaseEvent):
+    """Streamed reasoning, the text between <think> tags."""
+
+    name: EventName = EventName.THINK_DELTA_EVENT
+    delta: str
+
+
 class NewMessageEvent(BaseEvent):
     name: EventName = EventName.NEW_MESSAGE_EVENT
     content: str
@@ -46,3 +57,53 @@ class ToolCallOutputEvent(BaseEvent):
     name: EventName = EventName.TOOL_CALL_OUTPUT_EVENT
     output: str
     call_id: str
+
+
+class RunStartedEvent(BaseEvent):
+    """A turn started, sent to the viewers of the conversation."""
+
+    name: EventName = EventName.RUN_STARTED_EVENT
+    run_id: str
+    message: str
+
+
+class RunEndedEvent(BaseEvent):
+    """
+    A turn ended, `saved` is false when it could not be written to the database.
+
+    `error` names the exception of a turn that failed.
+    """
+
+    name: EventName = EventName.RUN_ENDED_EVENT
+    run_id: str
+    cancelled: bool
+    saved: bool = True
+    error: str | None = None
+
+
+class EventsDroppedEvent(BaseEvent):
+    """A viewer fell behind and missed `count` events here."""
+
+    name: EventName = EventName.EVENTS_DROPPED_EVENT
+    count: int
+
+
+EVENT_TYPES: dict[EventName, type[BaseEvent]] = {
+    cls.model_fields["name"].default: cls
+    for cls in (
+        AgentChangedEvent,
+        MessageDeltaEvent,
+        ThinkDeltaEvent,
+        NewMessageEvent,
+        ToolCalledEvent,
+        ToolCallOutputEvent,
+        RunStartedEvent,
+        RunEndedEvent,
+        EventsDroppedEvent,
+    )
+}
+
+
+def parse_event(data: dict) -> BaseEvent:
+    """Rebuild an event from its `model_dump`."""
+    return EVENT_TYPES[EventName(data["name"])].model_validate(data)
@@ -0,0 +1,74 @@
+from typing import Optional
+from uuid import UUID
+from agents import RunContextWrapper, function_tool
+from config import settings
+from _agents.context import AgentContext
+from services.file import AsyncFileService
+from services.ingest import AsyncFileChunkService
+
+
+async def _get_file(wrapper: RunContextWrapper[AgentContext], file_id: Optional[str]):
+    file_id = file_id or wrapper.context.current_file_id
+    if not file_id:
+        return None, {"error": "no file id given and no current file is set"}
+    try:
+        file = await AsyncFileService.get_file(UUID(file_id))
+    except ValueError:
+        file = None
+    if file is None or file.is_deleted:
+        return None, {"error": f"file not found: {file_id}"}
+    return file, None
+
+
+@function_tool(
+    name_override="read_file_chunks",
+    description_override=(
+        "read the text of the current file (or of file_id) in chunks, "
+        "start is the first chunk number, pass next_start to continue reading"
+    ),
+)
+async def read_file_chunks(
+    wrapper: RunContextWrapper[AgentContext],
+    start: int = 0,
+    limit: int = 3,
+    file_id: Optional[str] = None,
+) -> dict:
+    file, error = await _get_file(wrapper, file_id)
+    if error:
+        return error
+    limit = max(1, min(limit, settings.FILE_TOOL_MAX_CHUNKS))
+    chunks = await AsyncFileChunkService.get_chunks(file.id, max(start, 0), limit)
+    total = await AsyncFileChunkService.count_chunks(file.id)
+    next_start = chunks[-1].seq + 1 if chunks else None
+    if next_start is not None and next_start >= total:
+        next_start = None
+    return {
+        "file_name": file.name,
+        "total_chunks": total,
+        "chunks": [chunk.to_dict() for chunk in chunks],
+        "next_start": next_start,
+    }
+
+
+@function_tool(
+    name_override="search_file",
+    description_override=(
+        "search the text of the current file (or of file_id) "
+        "and return the chunks most relevant to the query"
+    ),
+)
+async def search_file(
+    wrapper: RunContextWrapper[AgentContext],
+    query: str,
+    limit: int = 3,
+    file_id: Optional[str] = None,
+) -> dict:
+    file, error = await _get_file(wrapper, file_id)
+    if error:
+        return error
+    limit = max(1, min(limit, settings.FILE_TOOL_MAX_CHUNKS))
+    chunks = await AsyncFileChunkService.search_chunks(file.id, query, limit)
+    return {
+        "file_name": file.name,
+        "chunks": [chunk.to_dict() for chunk in chunks],
+    }
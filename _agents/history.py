@@ -0,0 +1,218 @@
+import asyncio
+from typing import Optional, Callable, Awaitable
+from uuid import UUID
+from agents import Agent, Runner
+from loguru import logger
+from _agents.models import qwen_max_latest
+from _agents.events import BaseEvent, ToolCalledEvent, ToolCallOutputEvent
+from _agents.retrieval import history_retriever
+from config import settings
+from models.message import Message
+from services.conversation import AsyncConversationService
+from services.message import AsyncMessageService
+
+SUMMARY_INSTRUCTIONS = """
+You maintain a running summary of a conversation between a user and an assistant.
+Merge the previous summary with the new messages into one concise summary.
+Keep facts, decisions, file ids and open questions; drop greetings and filler.
+Reply with the summary only.
+"""
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+# page size of the reverse keyset scan when only a token budget is set
+WINDOW_PAGE_SIZE = 50
+
+summary_agent = Agent(
+    name="Summary Agent",
+    instructions=SUMMARY_INSTRUCTIONS,
+    model=qwen_max_latest,
+)
+
+Summarizer = Callable[[Optional[str], list[Message]], Awaitable[str]]
+
+# conversations with a summary refresh in flight
+_refreshing: set[UUID] = set()
+_refresh_tasks: set[asyncio.Task] = set()
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Cheap token estimate, roughly four characters per token."""
+    if not text:
+        return 1
+    return len(text) // 4 + 1
+
+
+def estimate_message_tokens(message: Message) -> int:
+    tokens = estimate_tokens(message.content)
+    for item in message.tool_items or []:
+        tokens += estimate_tokens(item.get("arguments") or item.get("output"))
+    return tokens
+
+
+def get_tool_items(events: list[BaseEvent]) -> list[dict]:
+    """
+    Responses input items for the tool calls among `events`.
+
+    Calls without an output are left out, the model API rejects a call that
+    is not answered.
+    """
+    answered = {
+        event.call_id for event in events if isinstance(event, ToolCallOutputEvent)
+    }
+    items = []
+    for event in events:
+        if isinstance(event, ToolCalledEvent) and event.tool_call_id in answered:
+            items.append(
+                {
+                    "type": "function_call",
+                    "call_id": event.tool_call_id,
+                    "name": event.tool_name,
+                    "arguments": event.args,
+                }
+            )
+        elif isinstance(event, ToolCallOutputEvent):
+            items.append(
+                {
+                    "type": "function_call_output",
+                    "call_id": event.call_id,
+                    "output": event.output,
+                }
+            )
+    return items
+
+
+async def summarize_messages(previous: Optional[str], messages: list[Message]) -> str:
+    lines = [f"{message.role}: {message.content}" for message in messages]
+    prompt = (
+        f"Previous summary:\n{previous or '(none)'}\n\nNew messages:\n"
+        + "\n".join(lines)
+    )
+    result = await Runner.run(summary_agent, prompt)
+    return str(result.final_output)
+
+
+async def load_window(
+    conversation_id: UUID,
+    max_messages: Optional[int] = None,
+    token_budget: Optional[int] = None,
+) -> tuple[list[Message], bool]:
+    """
+    Load the newest messages of a conversation that fit the window.
+
+    Returns the messages oldest first and whether older messages were left out.
+    The newest message is always included even if it alone exceeds the budget.
+    """
+    window: list[Message] = []
+    tokens = 0
+    before = None
+    while True:
+        limit = WINDOW_PAGE_SIZE
+        if max_messages is not None:
+            limit = min(limit, max_messages - len(window) + 1)
+        page = await AsyncMessageService.get_recent_messages(
+            conversation_id, limit=limit, before=before
+        )
+        for message in page:
+            if max_messages is not None and len(window) >= max_messages:
+                return window[::-1], True
+            tokens += estimate_message_tokens(message)
+            if token_budget is not None and window and tokens > token_budget:
+                return window[::-1], True
+            window.append(message)
+        if len(page) < limit:
+            return window[::-1], False
+        before = (page[-1].created_at, page[-1].id)
+
+
+async def refresh_summary(
+    conversation_id: UUID,
+    window_start: Message,
+    summarize: Summarizer = summarize_messages,
+) -> None:
+    """Fold messages older than the window into the stored rolling summary."""
+    conversation = await AsyncConversationService.get_conversation(conversation_id)
+    if conversation is None:
+        return
+    messages = await AsyncMessageService.get_messages_between(
+        conversation_id,
+        after=conversation.summarized_until,
+        before=(window_start.created_at, window_start.id),
+        limit=settings.HISTORY_SUMMARY_BATCH_SIZE,
+    )
+    if not messages:
+        return
+    summary = await summarize(conversation.summary, messages)
+    await AsyncConversationService.update_summary(
+        conversation_id, summary=summary, summarized_until=messages[-1].created_at
+    )
+
+
+def schedule_summary_refresh(conversation_id: UUID, window_start: Message) -> None:
+    if conversation_id in _refreshing:
+        return
+    _refreshing.add(conversation_id)
+
+    async def run():
+        try:
+            await refresh_summary(conversation_id, window_start)
+        except Exception:
+            logger.exception(f"summary refresh failed, conversation: {conversation_id}")
+        finally:
+            _refreshing.discard(conversation_id)
+
+    task = asyncio.create_task(run())
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+
+
+def fits_window(items: list[dict]) -> bool:
+    """Whether runner input that has grown since `load_history` still fits the window."""
+    max_messages = settings.HISTORY_MAX_MESSAGES
+    token_budget = settings.HISTORY_TOKEN_BUDGET
+    # summaries and retrieved messages are not part of the window
+    items = [item for item in items if item.get("role") != "system"]
+    if max_messages is not None:
+        messages = sum(1 for item in items if "role" in item)
+        if messages > max_messages:
+            return False
+    if token_budget is not None:
+        tokens = sum(
+            estimate_tokens(
+                item.get("content") or item.get("arguments") or item.get("output")
+            )
+            for item in items
+        )
+        if tokens > token_budget:
+            return False
+    return True
+
+
+async def load_history(conversation_id: UUID) -> list[dict]:
+    """Build the runner input for a conversation according to the history settings."""
+    max_messages = settings.HISTORY_MAX_MESSAGES
+    token_budget = settings.HISTORY_TOKEN_BUDGET
+    if max_messages is None and token_budget is None:
+        messages = await AsyncMessageService.get_messages_by_conversation_id(
+            conversation_id=conversation_id
+        )
+        return [item for message in messages for item in message.input_items()]
+
+    window, truncated = await load_window(
+        conversation_id, max_messages=max_messages, token_budget=token_budget
+    )
+    items = [item for message in window for item in message.input_items()]
+    if not truncated:
+        return items
+
+    if window:
+        # summarise in the background so this turn does not wait for the llm
+        schedule_summary_refresh(conversation_id, window[0])
+        history_retriever.schedule_index(conversation_id, window[0])
+    # the summary is only needed, and only read, once the window cuts history
+    conversation = await AsyncConversationService.get_conversation(conversation_id)
+    if conversation is not None and conversation.summary:
+        items.insert(
+            0, {"role": "system", "content": SUMMARY_PREFIX + conversation.summary}
+        )
+    return items
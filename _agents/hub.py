@@ -0,0 +1,221 @@
+"""
+Fan-out of live run events to the viewers of a conversation.
+
+Runs publish their events to the hub, every subscriber of the conversation
+gets them through its own bounded buffer, one run serves all viewers. A
+subscriber that falls behind has events dropped, marked by an
+EventsDroppedEvent where the gap is, or is closed, depending on the policy.
+
+Without a broker the hub only reaches subscribers in its own process. With
+one, events go through the broker and every worker's hub delivers them to
+its subscribers, the publishing worker's included.
+"""
+
+import asyncio
+import importlib
+import json
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import AsyncIterator, Callable, Optional
+from uuid import UUID
+from loguru import logger
+from config import settings
+from _agents.events import BaseEvent, EventsDroppedEvent, parse_event
+from metrics import hub_events_dropped_total, hub_subscribers_closed_total
+
+CHANNEL_PREFIX = "conversation:"
+
+SLOW_POLICIES = ("drop", "close")
+
+BrokerCallback = Callable[[str, bytes], None]
+
+
+class Broker(ABC):
+    """
+    Carries hub messages between workers.
+
+    Every message published on a channel reaches every callback subscribed
+    to it, in every process, in publish order.
+    """
+
+    @abstractmethod
+    async def publish(self, channel: str, message: bytes) -> None:
+        """Send `message` to the subscribers of `channel`."""
+
+    @abstractmethod
+    async def subscribe(self, channel: str, callback: BrokerCallback) -> None:
+        """Call `callback` with every message published on `channel`."""
+
+    @abstractmethod
+    async def unsubscribe(self, channel: str, callback: BrokerCallback) -> None:
+        """Stop calling `callback` for `channel`."""
+
+
+class LocalBroker(Broker):
+    """In-process stand-in, hubs sharing one behave like workers sharing a broker."""
+
+    def __init__(self) -> None:
+        self._callbacks: dict[str, list[BrokerCallback]] = {}
+
+    async def publish(self, channel: str, message: bytes) -> None:
+        for callback in list(self._callbacks.get(channel, ())):
+            callback(channel, message)
+
+    async def subscribe(self, channel: str, callback: BrokerCallback) -> None:
+        self._callbacks.setdefault(channel, []).append(callback)
+
+    async def unsubscribe(self, channel: str, callback: BrokerCallback) -> None:
+        callbacks = self._callbacks.get(channel, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+        if not callbacks:
+            self._callbacks.pop(channel, None)
+
+
+def get_broker(name: str) -> Optional[Broker]:
+    """None for an empty name, or `package.module:attr` naming a Broker class or factory."""
+    if not name:
+        return None
+    module_name, _, attr = name.partition(":")
+    if not attr:
+        raise ValueError(f"unknown broker: {name}")
+    factory = getattr(importlib.import_module(module_name), attr)
+    broker = factory()
+    if not isinstance(broker, Broker):
+        raise ValueError(f"{name} did not return a Broker")
+    return broker
+
+
+class Subscription:
+    def __init__(
+        self, conversation_id: UUID, maxsize: int, slow_policy: str = "drop"
+    ) -> None:
+        if slow_policy not in SLOW_POLICIES:
+            raise ValueError(f"unknown slow subscriber policy: {slow_policy}")
+        self.conversation_id = conversation_id
+        self.maxsize = maxsize
+        self.slow_policy = slow_policy
+        self.closed = False
+        # events dropped since the last one delivered
+        self.dropped = 0
+        self._events: deque[BaseEvent] = deque()
+        self._waiter: Optional[asyncio.Event] = None
+
+    def put(self, event: BaseEvent) -> None:
+        if self.closed:
+            return
+        if len(self._events) >= self.maxsize:
+            if self.slow_policy == "close":
+                hub_subscribers_closed_total.inc()
+                # it reconnects and starts over, the backlog is of no use
+                self._events.clear()
+                self.close()
+                return
+            self.dropped += 1
+            hub_events_dropped_total.inc()
+            return
+        if self.dropped:
+            self._events.append(EventsDroppedEvent(count=self.dropped))
+            self.dropped = 0
+        self._events.append(event)
+        self._wake()
+
+    def close(self) -> None:
+        self.closed = True
+        self._wake()
+
+    def _wake(self) -> None:
+        if self._waiter is not None:
+            self._waiter.set()
+            self._waiter = None
+
+    async def __aiter__(self) -> AsyncIterator[BaseEvent]:
+        while True:
+            if self._events:
+                yield self._events.popleft()
+                continue
+            if self.closed:
+                return
+            if self._waiter is None:
+                self._waiter = asyncio.Event()
+            await self._waiter.wait()
+
+
+class EventHub:
+    def __init__(
+        self,
+        queue_size: int = 1000,
+        slow_policy: str = "drop",
+        broker: Optional[Broker] = None,
+    ) -> None:
+        if slow_policy not in SLOW_POLICIES:
+            raise ValueError(f"unknown slow subscriber policy: {slow_policy}")
+        self.queue_size = queue_size
+        self.slow_policy = slow_policy
+        self.broker = broker
+        self._subscriptions: dict[UUID, set[Subscription]] = {}
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(s) for s in self._subscriptions.values())
+
+    async def subscribe(self, conversation_id: UUID) -> Subscription:
+        subscription = Subscription(conversation_id, self.queue_size, self.slow_policy)
+        subscriptions = self._subscriptions.get(conversation_id)
+        if subscriptions is None:
+            subscriptions = self._subscriptions[conversation_id] = set()
+            if self.broker is not None:
+                await self.broker.subscribe(
+                    CHANNEL_PREFIX + str(conversation_id), self._receive
+                )
+        subscriptions.add(subscription)
+        return subscription
+
+    async def unsubscribe(self, subscription: Subscription) -> None:
+        subscription.close()
+        conversation_id = subscription.conversation_id
+        subscriptions = self._subscriptions.get(conversation_id)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        if subscriptions:
+            return
+        del self._subscriptions[conversation_id]
+        if self.broker is not None:
+            await self.broker.unsubscribe(
+                CHANNEL_PREFIX + str(conversation_id), self._receive
+            )
+
+    async def publish(self, conversation_id: UUID, event: BaseEvent) -> None:
+        if self.broker is None:
+            self._deliver(conversation_id, event)
+            return
+        try:
+            await self.broker.publish(
+                CHANNEL_PREFIX + str(conversation_id), event.model_dump_json().encode()
+            )
+        except Exception:
+            # viewers are best effort, the run and its own client go on
+            logger.exception(f"publishing to conversation {conversation_id} failed")
+
+    def close(self) -> None:
+        """End every subscription, on shutdown."""
+        for subscriptions in self._subscriptions.values():
+            for subscription in subscriptions:
+                subscription.close()
+
+    def _receive(self, channel: str, message: bytes) -> None:
+        conversation_id = UUID(channel.removeprefix(CHANNEL_PREFIX))
+        if conversation_id in self._subscriptions:
+            self._deliver(conversation_id, parse_event(json.loads(message)))
+
+    def _deliver(self, conversation_id: UUID, event: BaseEvent) -> None:
+        for subscription in self._subscriptions.get(conversation_id, ()):
+            subscription.put(event)
+
+
+event_hub = EventHub(
+    queue_size=settings.HUB_QUEUE_SIZE,
+    slow_policy=settings.HUB_SLOW_POLICY,
+    broker=get_broker(settings.HUB_BROKER),
+)
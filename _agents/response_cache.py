@@ -0,0 +1,84 @@
+"""
+Cache of whole agent turns.
+
+A turn is keyed by the agent, its instructions and model, the normalised
+runner input and the agent context. A cached turn is replayed through the
+StreamEventAdapter, so handlers, metrics and encoders see the same events
+as on a live run. Only turns whose tool calls do not change anything are
+stored.
+"""
+
+import hashlib
+import json
+import re
+import time
+from typing import AsyncIterator, Optional
+from agents import Agent
+from config import settings
+from services.cache import DiskCache, TieredCache, TTLCache
+from _agents.events import BaseEvent, ToolCalledEvent, parse_event
+
+# tools that only read, a turn calling anything else is not cached
+READ_ONLY_TOOLS = {"get_context", "read_file_chunks", "search_file"}
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def get_cache_key(
+    agent: Agent, model: str, history: list[dict], context: dict
+) -> Optional[str]:
+    """Key of a turn, None when its agent builds instructions dynamically."""
+    if agent.instructions is not None and not isinstance(agent.instructions, str):
+        return None
+    instructions = hashlib.sha256((agent.instructions or "").encode()).hexdigest()
+    # tool call items have no role and are kept whole
+    messages = [
+        [item["role"], _normalize(str(item.get("content", "")))]
+        if "role" in item
+        else item
+        for item in history
+    ]
+    key = json.dumps(
+        [agent.name, instructions, model, messages, context],
+        ensure_ascii=False,
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def is_cacheable(events: list[BaseEvent]) -> bool:
+    return all(
+        event.tool_name in READ_ONLY_TOOLS
+        for event in events
+        if isinstance(event, ToolCalledEvent)
+    )
+
+
+def dump_turn(events: list[BaseEvent], last_agent: str) -> dict:
+    return {
+        "events": [event.model_dump(mode="json") for event in events],
+        "last_agent": last_agent,
+    }
+
+
+async def replay_events(turn: dict) -> AsyncIterator[BaseEvent]:
+    """The stored events of a turn, stamped with the current time."""
+    for data in turn["events"]:
+        yield parse_event(dict(data, timestamp=time.time()))
+
+
+response_cache = TieredCache(
+    TTLCache(
+        maxsize=settings.RESPONSE_CACHE_MEMORY_SIZE, ttl=settings.RESPONSE_CACHE_TTL
+    ),
+    DiskCache(
+        settings.RESPONSE_CACHE_PATH,
+        ttl=settings.RESPONSE_CACHE_TTL,
+        max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+    )
+    if settings.RESPONSE_CACHE_PATH
+    else None,
+)
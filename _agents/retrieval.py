@@ -0,0 +1,157 @@
+import asyncio
+import functools
+import os
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+import anyio
+from loguru import logger
+from config import settings
+from models.message import Message
+from services.message import AsyncMessageService
+from _agents.embedding import Embedder, get_embedder, np
+from _agents.vector_index import VectorIndex
+
+RETRIEVAL_PREFIX = "Relevant earlier messages:\n"
+
+# messages embedded per index step
+INDEX_BATCH_SIZE = 200
+
+
+class HistoryRetriever:
+    """
+    Semantic recall of messages that fell out of the history window.
+
+    Messages older than the window are embedded in the background as the
+    window moves on, one group per conversation in the vector index. Each turn
+    the most similar of them are added to the runner input.
+    """
+
+    def __init__(
+        self,
+        index_dir: str,
+        embedder: str = "hashing",
+        dim: int = 384,
+        top_k: int = 0,
+        min_score: float = 0.2,
+    ) -> None:
+        self.index_dir = index_dir
+        self.embedder_name = embedder
+        self.dim = dim
+        self.top_k = top_k
+        self.min_score = min_score
+        self._embedder: Optional[Embedder] = None
+        self._index: Optional[VectorIndex] = None
+        self._indexing: set[UUID] = set()
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.top_k > 0 and np is not None
+
+    @property
+    def embedder(self) -> Embedder:
+        if self._embedder is None:
+            self._embedder = get_embedder(self.embedder_name, self.dim)
+        return self._embedder
+
+    @property
+    def index(self) -> VectorIndex:
+        # opened on first use, the files are memory-mapped rather than read
+        if self._index is None:
+            self._index = VectorIndex(
+                os.path.join(self.index_dir, "messages"), self.embedder.dim
+            )
+        return self._index
+
+    async def index_until(self, conversation_id: UUID, window_start: Message) -> int:
+        """Embed the messages of a conversation older than `window_start`."""
+        indexed = 0
+        while True:
+            watermark = self.index.get_watermark(conversation_id)
+            after = datetime.fromisoformat(watermark[0]) if watermark else None
+            messages = await AsyncMessageService.get_messages_between(
+                conversation_id,
+                after=after,
+                before=(window_start.created_at, window_start.id),
+                limit=INDEX_BATCH_SIZE,
+            )
+            if not messages:
+                return indexed
+            vectors = await anyio.to_thread.run_sync(
+                self.embedder.embed, [message.content for message in messages]
+            )
+            last = messages[-1]
+            await anyio.to_thread.run_sync(
+                functools.partial(
+                    self.index.add,
+                    [message.id for message in messages],
+                    conversation_id,
+                    vectors,
+                    watermark=[last.created_at.isoformat(), str(last.id)],
+                )
+            )
+            indexed += len(messages)
+            if len(messages) < INDEX_BATCH_SIZE:
+                return indexed
+
+    def schedule_index(self, conversation_id: UUID, window_start: Message) -> None:
+        if not self.enabled or conversation_id in self._indexing:
+            return
+        self._indexing.add(conversation_id)
+
+        async def run():
+            try:
+                await self.index_until(conversation_id, window_start)
+            except Exception:
+                logger.exception(
+                    f"history indexing failed, conversation: {conversation_id}"
+                )
+            finally:
+                self._indexing.discard(conversation_id)
+
+        task = asyncio.create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def retrieve(
+        self, conversation_id: UUID, query: str, k: Optional[int] = None
+    ) -> list[Message]:
+        """The indexed messages most similar to `query`, oldest first."""
+        if not self.enabled or not query.strip():
+            return []
+        if self.index.get_watermark(conversation_id) is None:
+            return []
+
+        def search():
+            vector = self.embedder.embed([query])[0]
+            return self.index.search(vector, k or self.top_k, group=conversation_id)
+
+        hits = await anyio.to_thread.run_sync(search)
+        ids = [key for key, score in hits if score >= self.min_score]
+        if not ids:
+            return []
+        return await AsyncMessageService.get_messages_by_ids(ids)
+
+    async def add_relevant_history(
+        self, conversation_id: UUID, query: str, history: list[dict]
+    ) -> list[dict]:
+        """Insert the retrieved messages after the leading system items of `history`."""
+        messages = await self.retrieve(conversation_id, query)
+        if not messages:
+            return history
+        lines = [f"{message.role}: {message.content}" for message in messages]
+        item = {"role": "system", "content": RETRIEVAL_PREFIX + "\n".join(lines)}
+        position = 0
+        while position < len(history) and history[position].get("role") == "system":
+            position += 1
+        return history[:position] + [item] + history[position:]
+
+
+history_retriever = HistoryRetriever(
+    settings.EMBEDDING_INDEX_DIR,
+    embedder=settings.EMBEDDER,
+    dim=settings.EMBEDDING_DIM,
+    top_k=settings.RETRIEVAL_TOP_K,
+    min_score=settings.RETRIEVAL_MIN_SCORE,
+)
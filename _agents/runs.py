@@ -0,0 +1,291 @@
+"""
+Event logs of agent runs, for clients that reconnect.
+
+A chat run writes its events to a RunLog instead of straight into the
+response, the response is one reader of the log. A client whose connection
+dropped reattaches with the run id and the number of events it received and
+gets the rest, the run is not started again. The latest events are kept in
+a ring buffer, older ones are spilled to a file.
+
+A run that has had no reader for `resume_timeout` seconds is cancelled, a
+finished log stays readable for `ttl` seconds after its last reader left.
+"""
+
+import asyncio
+import json
+from collections import deque
+from pathlib import Path
+from typing import AsyncIterator, Callable, Optional
+from uuid import uuid4
+import anyio
+from config import settings
+from _agents.adapter import wait_for_disconnect
+from _agents.events import BaseEvent, parse_event
+
+# spilled events read per thread hop when a reader catches up from disk
+SPILL_READ_BATCH = 256
+# evicted events written per thread hop
+SPILL_WRITE_BATCH = 256
+
+
+class RunLog:
+    def __init__(
+        self, run_id: str, buffer_size: int, spill_path: Optional[Path] = None
+    ) -> None:
+        self.run_id = run_id
+        self.buffer_size = buffer_size
+        self.spill_path = spill_path
+        self.closed = False
+        # dropped from the registry, readers stop and the spill file is gone
+        self.discarded = False
+        self.readers = 0
+        # stops the run, called when it is abandoned
+        self.on_cancel: Optional[Callable[[], None]] = None
+        self.task: Optional[asyncio.Task] = None
+        self._events: deque[BaseEvent] = deque()
+        # offset of the first buffered event
+        self._first = 0
+        # file positions of the spilled events, by offset
+        self._positions: list[int] = []
+        # evicted events not on disk yet, they follow the spilled ones
+        self._spilling: list[BaseEvent] = []
+        self._spiller: Optional[asyncio.Task] = None
+        self._file = None
+        self._waiter: Optional[asyncio.Event] = None
+
+    def __len__(self) -> int:
+        return self._first + len(self._events)
+
+    @property
+    def available_from(self) -> int:
+        """Lowest offset that can still be read."""
+        return 0 if self.spill_path is not None else self._first
+
+    def append(self, event: BaseEvent) -> None:
+        if len(self._events) >= self.buffer_size:
+            self._evict()
+        self._events.append(event)
+        self._wake()
+
+    def close(self) -> None:
+        """No more events, readers end once they have read everything."""
+        self.closed = True
+        self._wake()
+
+    def discard(self) -> None:
+        self.discarded = True
+        self.closed = True
+        self._wake()
+        if self._spiller is None or self._spiller.done():
+            # otherwise the spiller removes the file once its write is done
+            self._remove_spill()
+
+    def _remove_spill(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.spill_path is not None:
+            self.spill_path.unlink(missing_ok=True)
+
+    def _wake(self) -> None:
+        if self._waiter is not None:
+            self._waiter.set()
+            self._waiter = None
+
+    def _evict(self) -> None:
+        event = self._events.popleft()
+        if self.spill_path is not None:
+            # written in a thread, the event loop does not wait for the disk
+            self._spilling.append(event)
+            if self._spiller is None or self._spiller.done():
+                self._spiller = asyncio.ensure_future(self._spill())
+        self._first += 1
+
+    async def _spill(self) -> None:
+        while self._spilling and not self.discarded:
+            batch = self._spilling[:SPILL_WRITE_BATCH]
+            positions = await anyio.to_thread.run_sync(self._write_spilled, batch)
+            # readers find them on disk from here on
+            self._positions.extend(positions)
+            del self._spilling[: len(batch)]
+        if self.discarded:
+            self._remove_spill()
+
+    def _write_spilled(self, events: list[BaseEvent]) -> list[int]:
+        if self._file is None:
+            self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.spill_path, "ab")
+        positions = []
+        for event in events:
+            positions.append(self._file.tell())
+            self._file.write(event.serialize().encode())
+        self._file.flush()
+        return positions
+
+    def _read_spilled(self, start: int, stop: int) -> list[BaseEvent]:
+        with open(self.spill_path, "rb") as f:
+            f.seek(self._positions[start])
+            return [parse_event(json.loads(f.readline())) for _ in range(stop - start)]
+
+    async def read(self, offset: int = 0) -> AsyncIterator[tuple[int, BaseEvent]]:
+        """Events from `offset` on with their offsets, until the log is closed."""
+        while True:
+            if self.discarded:
+                return
+            if offset < self._first:
+                if self.spill_path is None:
+                    # the reader fell behind a buffer that does not spill,
+                    # reattaching at this offset is answered with 410
+                    return
+                spilled = len(self._positions)
+                if offset < spilled:
+                    stop = min(spilled, offset + SPILL_READ_BATCH)
+                    try:
+                        events = await anyio.to_thread.run_sync(
+                            self._read_spilled, offset, stop
+                        )
+                    except FileNotFoundError:
+                        if self.discarded:
+                            return
+                        raise
+                else:
+                    events = self._spilling[offset - spilled :]
+                for event in events:
+                    if self.discarded:
+                        return
+                    yield offset, event
+                    offset += 1
+                continue
+            if offset < len(self):
+                yield offset, self._events[offset - self._first]
+                offset += 1
+                continue
+            if self.closed:
+                return
+            if self._waiter is None:
+                self._waiter = asyncio.Event()
+            await self._waiter.wait()
+
+
+class RunRegistry:
+    """Run logs of this process by run id."""
+
+    def __init__(
+        self,
+        buffer_size: int = 1000,
+        spill_dir: Optional[str] = None,
+        resume_timeout: float = 15,
+        ttl: float = 300,
+    ) -> None:
+        self.buffer_size = buffer_size
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self.resume_timeout = resume_timeout
+        self.ttl = ttl
+        self._runs: dict[str, RunLog] = {}
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+
+    def __len__(self) -> int:
+        return len(self._runs)
+
+    def create(self, on_cancel: Optional[Callable[[], None]] = None) -> RunLog:
+        run_id = uuid4().hex
+        spill_path = None
+        if self.spill_dir is not None:
+            spill_path = self.spill_dir / f"{run_id}.ndjson"
+        run = RunLog(run_id, self.buffer_size, spill_path)
+        run.on_cancel = on_cancel
+        self._runs[run_id] = run
+        return run
+
+    def get(self, run_id: str) -> Optional[RunLog]:
+        return self._runs.get(run_id)
+
+    def finish(self, run: RunLog) -> None:
+        run.close()
+        if run.readers == 0:
+            self._set_timer(run, self.ttl, self._remove)
+
+    async def stream(
+        self, run: RunLog, offset: int = 0, receive: Optional[Callable] = None
+    ) -> AsyncIterator[tuple[int, BaseEvent]]:
+        """
+        Read `run` as one of its readers.
+
+        With the ASGI `receive` of the request the reader leaves as soon as
+        the client disconnects, not only once the response is torn down.
+        """
+        self._cancel_timer(run)
+        run.readers += 1
+        left = False
+
+        def leave(*_) -> None:
+            nonlocal left
+            if not left:
+                left = True
+                self._leave(run)
+
+        watcher = None
+        if receive is not None:
+            watcher = asyncio.ensure_future(wait_for_disconnect(receive))
+            watcher.add_done_callback(leave)
+        try:
+            async for item in run.read(offset):
+                yield item
+        finally:
+            if watcher is not None:
+                watcher.remove_done_callback(leave)
+                watcher.cancel()
+            leave()
+
+    def close(self) -> None:
+        """Drop every log, on shutdown."""
+        for handle in self._timers.values():
+            handle.cancel()
+        self._timers.clear()
+        for run in self._runs.values():
+            run.discard()
+        self._runs.clear()
+
+    def _leave(self, run: RunLog) -> None:
+        run.readers -= 1
+        if run.readers > 0:
+            return
+        if run.closed:
+            self._set_timer(run, self.ttl, self._remove)
+        else:
+            self._set_timer(run, self.resume_timeout, self._abandon)
+
+    def _abandon(self, run: RunLog) -> None:
+        if not run.closed and run.on_cancel is not None:
+            run.on_cancel()
+
+    def _remove(self, run: RunLog) -> None:
+        if self._runs.pop(run.run_id, None) is not None:
+            run.discard()
+
+    def _set_timer(
+        self, run: RunLog, delay: float, callback: Callable[[RunLog], None]
+    ) -> None:
+        self._cancel_timer(run)
+        if delay <= 0:
+            callback(run)
+            return
+        loop = asyncio.get_running_loop()
+        self._timers[run.run_id] = loop.call_later(delay, self._fire, run, callback)
+
+    def _fire(self, run: RunLog, callback: Callable[[RunLog], None]) -> None:
+        self._timers.pop(run.run_id, None)
+        callback(run)
+
+    def _cancel_timer(self, run: RunLog) -> None:
+        handle = self._timers.pop(run.run_id, None)
+        if handle is not None:
+            handle.cancel()
+
+
+run_registry = RunRegistry(
+    buffer_size=settings.RUN_BUFFER_SIZE,
+    spill_dir=settings.RUN_LOG_DIR or None,
+    resume_timeout=settings.RUN_RESUME_TIMEOUT,
+    ttl=settings.RUN_LOG_TTL,
+)
@@ -0,0 +1,201 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Hashable, Optional
+from config import settings
+from metrics import scheduler_rejected_total, scheduler_wait_seconds
+
+
+class SchedulerFull(Exception):
+    """Raised when a run can not get a slot, the caller should answer 429."""
+
+
+class SchedulerClosed(Exception):
+    """Raised once the server is shutting down, the caller should answer 503."""
+
+
+@dataclass
+class RunSlot:
+    scheduler: "RunScheduler"
+    model: str
+    conversation_id: Optional[Hashable] = None
+    released: bool = field(default=False)
+
+    def release(self) -> None:
+        if self.released:
+            return
+        self.released = True
+        self.scheduler._release(self)
+
+
+class RunScheduler:
+    """
+    Admission control in front of the agent runner.
+
+    A run holds its conversation's lock, one slot of its model and one global
+    slot. At most `max_waiting` runs may wait for those, further runs are
+    rejected at once, and a run that waited `wait_timeout` seconds gives up.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 32,
+        model_concurrency: int = 32,
+        max_waiting: int = 64,
+        wait_timeout: Optional[float] = 30,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.model_concurrency = model_concurrency
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._models: dict[str, asyncio.Semaphore] = {}
+        self._conversations: dict[Hashable, asyncio.Lock] = {}
+        self._conversation_users: dict[Hashable, int] = {}
+        self.running = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.closed = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def _update_idle(self) -> None:
+        if self.running or self.waiting:
+            self._idle.clear()
+        else:
+            self._idle.set()
+
+    def _model_semaphore(self, model: str) -> asyncio.Semaphore:
+        if model not in self._models:
+            self._models[model] = asyncio.Semaphore(self.model_concurrency)
+        return self._models[model]
+
+    def _conversation_lock(self, conversation_id: Hashable) -> asyncio.Lock:
+        if conversation_id not in self._conversations:
+            self._conversations[conversation_id] = asyncio.Lock()
+        self._conversation_users[conversation_id] = (
+            self._conversation_users.get(conversation_id, 0) + 1
+        )
+        return self._conversations[conversation_id]
+
+    def _drop_conversation(self, conversation_id: Hashable) -> None:
+        users = self._conversation_users[conversation_id] - 1
+        if users:
+            self._conversation_users[conversation_id] = users
+            return
+        del self._conversation_users[conversation_id]
+        del self._conversations[conversation_id]
+
+    def _can_start_now(self, model: str, conversation_id: Optional[Hashable]) -> bool:
+        if self._global.locked() or self._model_semaphore(model).locked():
+            return False
+        lock = self._conversations.get(conversation_id)
+        return lock is None or not lock.locked()
+
+    async def acquire(
+        self, model: str, conversation_id: Optional[Hashable] = None
+    ) -> RunSlot:
+        if self.closed:
+            scheduler_rejected_total.inc(reason="closed")
+            raise SchedulerClosed("server is shutting down")
+        if self.waiting >= self.max_waiting and not self._can_start_now(
+            model, conversation_id
+        ):
+            self.rejected += 1
+            scheduler_rejected_total.inc(reason="queue_full")
+            raise SchedulerFull("too many queued runs")
+
+        started = time.monotonic()
+        lock = None
+        locked = False
+        holds: list[asyncio.Semaphore] = []
+        self.waiting += 1
+        self._update_idle()
+        try:
+            async with asyncio.timeout(self.wait_timeout):
+                # conversation first, turns of one conversation never interleave
+                if conversation_id is not None:
+                    lock = self._conversation_lock(conversation_id)
+                    await lock.acquire()
+                    locked = True
+                for semaphore in (self._model_semaphore(model), self._global):
+                    await semaphore.acquire()
+                    holds.append(semaphore)
+            # counted as running before it stops waiting, drain never sees a gap
+            self.running += 1
+        except BaseException as e:
+            for semaphore in holds:
+                semaphore.release()
+            if lock is not None:
+                if locked:
+                    lock.release()
+                self._drop_conversation(conversation_id)
+            if isinstance(e, TimeoutError):
+                self.rejected += 1
+                scheduler_rejected_total.inc(reason="timeout")
+                raise SchedulerFull("timed out waiting for a run slot") from e
+            raise
+        finally:
+            self.waiting -= 1
+            self._update_idle()
+
+        waited = time.monotonic() - started
+        self.waits += 1
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        scheduler_wait_seconds.observe(waited)
+        return RunSlot(scheduler=self, model=model, conversation_id=conversation_id)
+
+    def _release(self, slot: RunSlot) -> None:
+        self.running -= 1
+        self._update_idle()
+        self._global.release()
+        self._model_semaphore(slot.model).release()
+        if slot.conversation_id is not None:
+            self._conversations[slot.conversation_id].release()
+            self._drop_conversation(slot.conversation_id)
+
+    def start(self) -> None:
+        self.closed = False
+
+    def close(self) -> None:
+        """Reject new runs, the admitted ones keep going."""
+        self.closed = True
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until no run holds or waits for a slot, False on timeout."""
+        try:
+            async with asyncio.timeout(timeout):
+                await self._idle.wait()
+        except TimeoutError:
+            return False
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "closed": self.closed,
+            "running": self.running,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_waiting": self.max_waiting,
+            "rejected": self.rejected,
+            "wait_seconds_avg": self.wait_seconds_total / self.waits
+            if self.waits
+            else 0.0,
+            "wait_seconds_max": self.wait_seconds_max,
+            "models": {
+                model: self.model_concurrency - semaphore._value
+                for model, semaphore in self._models.items()
+            },
+        }
+
+
+scheduler = RunScheduler(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    model_concurrency=settings.LLM_MODEL_CONCURRENCY,
+    max_waiting=settings.LLM_MAX_WAITING,
+    wait_timeout=settings.LLM_WAIT_TIMEOUT,
+)
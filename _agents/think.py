@@ -0,0 +1,74 @@
+"""
+Incremental splitting of model output into reasoning and answer.
+
+Models that reason inline wrap it in `<think>...</think>`. The parser is
+fed the text deltas as they stream and classifies every piece in a single
+pass, a tag cut across two deltas is held back until the next delta
+completes or rules it out.
+"""
+
+from typing import Optional
+from _agents.events import BaseEvent, MessageDeltaEvent, ThinkDeltaEvent
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+def _tag_prefix_length(text: str, tag: str) -> int:
+    """Length of the longest end of `text` that is the start of `tag`."""
+    # tags contain a single "<", only the last one can start a cut off tag
+    start = text.rfind("<", max(len(text) - len(tag) + 1, 0))
+    if start >= 0 and tag.startswith(text[start:]):
+        return len(text) - start
+    return 0
+
+
+class ThinkParser:
+    def __init__(self) -> None:
+        self.in_think = False
+        self._pending = ""
+
+    def feed(self, delta: str) -> list[BaseEvent]:
+        """Think and message delta events for the next piece of text."""
+        text = self._pending + delta
+        self._pending = ""
+        events = []
+        while text:
+            tag = THINK_CLOSE if self.in_think else THINK_OPEN
+            index = text.find(tag)
+            if index >= 0:
+                if index:
+                    events.append(self._event(text[:index]))
+                text = text[index + len(tag) :]
+                self.in_think = not self.in_think
+                continue
+            keep = _tag_prefix_length(text, tag)
+            if keep:
+                self._pending = text[-keep:]
+                text = text[:-keep]
+            if text:
+                events.append(self._event(text))
+            break
+        return events
+
+    def flush(self) -> list[BaseEvent]:
+        """End of the message, a held back fragment was not a tag after all."""
+        text = self._pending
+        events = [self._event(text)] if text else []
+        self._pending = ""
+        self.in_think = False
+        return events
+
+    def _event(self, text: str) -> BaseEvent:
+        if self.in_think:
+            return ThinkDeltaEvent(delta=text)
+        return MessageDeltaEvent(delta=text)
+
+
+def split_think(text: str) -> tuple[str, Optional[str]]:
+    """Answer and reasoning of a complete text, for messages that were not streamed."""
+    parser = ThinkParser()
+    content, think = [], []
+    for event in parser.feed(text) + parser.flush():
+        (think if isinstance(event, ThinkDeltaEvent) else content).append(event.delta)
+    return "".join(content), "".join(think) or None
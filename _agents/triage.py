@@ -1,12 +1,14 @@
 from agents import Agent, RunContextWrapper, function_tool
 from _agents.models import qwen_max_latest
 from _agents.context import AgentContext
+from _agents.file_tools import read_file_chunks, search_file
 
 INSTRUCTIONS = """
 You are a helpful assistant.
-Before answering questions, you must use the get_context tool to get conversation context information.
+Before answering questions, you must know the conversation context: use the get_context tool unless its result is already in the conversation and set_current_file_id has not been called since.
 If you can't solve the user's request, please transfer the request to the appropriate assistant.
 If the user gives you a file ID, you need to use the set_current_file_id tool to set it to the current conversation context.
+To answer questions about the current file, use search_file to find the relevant parts, or read_file_chunks to read it in order.
 """
 
 
@@ -32,5 +34,5 @@ triage_agent = Agent[AgentContext](
     name="Triage Agent",
     instructions=INSTRUCTIONS,
     model=qwen_max_latest,
-    tools=[get_context, set_current_file_id],
+    tools=[get_context, set_current_file_id, read_file_chunks, search_file],
 )
@@ -0,0 +1,242 @@
+"""
+Vector index over message embeddings.
+
+Vectors, keys and groups live in `.npy` files that are memory-mapped, so
+opening an index costs no parsing and only touched pages are read. Rows
+beyond `count` in `meta.json` are spare capacity. Small indexes are searched
+exhaustively; once an index has `ivf_min_size` rows a k-means coarse
+quantiser is trained and searches only scan the `nprobe` closest lists.
+"""
+
+import json
+import os
+import threading
+import uuid
+from typing import Optional
+
+try:
+    import numpy as np
+except ImportError:  # optional, only needed for history retrieval
+    np = None
+
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_SIZE = 65536
+
+
+def _uuid_array(values: list[uuid.UUID]) -> "np.ndarray":
+    """UUIDs as (n, 2) uint64, comparable with vectorised operations."""
+    return np.array(
+        [(u.int >> 64, u.int & 0xFFFFFFFFFFFFFFFF) for u in values], dtype=np.uint64
+    ).reshape(-1, 2)
+
+
+def _to_uuid(row: "np.ndarray") -> uuid.UUID:
+    return uuid.UUID(int=(int(row[0]) << 64) | int(row[1]))
+
+
+class VectorIndex:
+    def __init__(
+        self,
+        path: str,
+        dim: int,
+        nprobe: int = 8,
+        ivf_min_size: int = 4096,
+    ) -> None:
+        self.path = path
+        self.dim = dim
+        self.nprobe = nprobe
+        self.ivf_min_size = ivf_min_size
+        self.count = 0
+        # per group, the (created_at, key) of the newest indexed row
+        self.watermarks: dict[str, list[str]] = {}
+        self.trained_size = 0
+        self.vectors = self.keys = self.groups = self.lists = None
+        self.centroids = None
+        self._lock = threading.RLock()
+        self._training = False
+        self._load()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self) -> None:
+        if not os.path.isfile(self._file("meta.json")):
+            return
+        with open(self._file("meta.json")) as f:
+            meta = json.load(f)
+        if meta["dim"] != self.dim:
+            raise ValueError(
+                f"index at {self.path} has dim {meta['dim']}, expected {self.dim}"
+            )
+        self.count = meta["count"]
+        self.watermarks = meta.get("watermarks", {})
+        self.trained_size = meta.get("trained_size", 0)
+        self.vectors = np.load(self._file("vectors.npy"), mmap_mode="r+")
+        self.keys = np.load(self._file("keys.npy"), mmap_mode="r+")
+        self.groups = np.load(self._file("groups.npy"), mmap_mode="r+")
+        self.lists = np.load(self._file("lists.npy"), mmap_mode="r+")
+        if self.trained_size:
+            self.centroids = np.load(self._file("centroids.npy"))
+
+    def _save_meta(self) -> None:
+        meta = {
+            "dim": self.dim,
+            "count": self.count,
+            "watermarks": self.watermarks,
+            "trained_size": self.trained_size,
+        }
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._file("meta.json"))
+
+    def _grow(self, needed: int) -> None:
+        capacity = 0 if self.vectors is None else self.vectors.shape[0]
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+        os.makedirs(self.path, exist_ok=True)
+        shapes = {
+            "vectors": ((capacity, self.dim), np.float32),
+            "keys": ((capacity, 2), np.uint64),
+            "groups": ((capacity, 2), np.uint64),
+            "lists": ((capacity,), np.int32),
+        }
+        for name, (shape, dtype) in shapes.items():
+            tmp = self._file(f"{name}.tmp.npy")
+            array = np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=shape)
+            old = getattr(self, name)
+            if old is not None and self.count:
+                array[: self.count] = old[: self.count]
+            array.flush()
+            del array
+            os.replace(tmp, self._file(f"{name}.npy"))
+            setattr(self, name, np.load(self._file(f"{name}.npy"), mmap_mode="r+"))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def get_watermark(self, group: uuid.UUID) -> Optional[list[str]]:
+        return self.watermarks.get(str(group))
+
+    def add(
+        self,
+        keys: list[uuid.UUID],
+        group: uuid.UUID,
+        vectors: "np.ndarray",
+        watermark: Optional[list[str]] = None,
+    ) -> None:
+        """Append rows of one group, `watermark` marks how far the group is indexed."""
+        with self._lock:
+            n = len(keys)
+            if n:
+                self._grow(self.count + n)
+                rows = slice(self.count, self.count + n)
+                self.vectors[rows] = vectors
+                self.keys[rows] = _uuid_array(keys)
+                self.groups[rows] = _uuid_array([group])
+                self.lists[rows] = (
+                    self._assign(vectors) if self.centroids is not None else -1
+                )
+                for array in (self.vectors, self.keys, self.groups, self.lists):
+                    array.flush()
+                self.count += n
+            if watermark is not None:
+                self.watermarks[str(group)] = watermark
+            # rows are flushed before the count that makes them visible
+            self._save_meta()
+            should_train = (
+                not self._training
+                and self.count >= self.ivf_min_size
+                and self.count >= 2 * self.trained_size
+            )
+        if should_train:
+            self.train()
+
+    def _assign(
+        self, vectors: "np.ndarray", centroids: Optional["np.ndarray"] = None
+    ) -> "np.ndarray":
+        centroids = self.centroids if centroids is None else centroids
+        return np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+
+    def train(self, nlist: Optional[int] = None) -> None:
+        """
+        Fit the coarse quantiser (spherical k-means) and assign every row to a list.
+
+        The rows indexed so far are clustered without holding the lock, rows
+        never change once written, so searches and adds go on meanwhile. The
+        new lists are swapped in at the end, rows added during training are
+        assigned then.
+        """
+        with self._lock:
+            if not self.count or self._training:
+                return
+            self._training = True
+            count, data = self.count, self.vectors
+        try:
+            centroids, lists = self._fit(data[:count], nlist)
+            with self._lock:
+                added = slice(count, self.count)
+                self.lists[:count] = lists
+                self.lists[added] = self._assign(self.vectors[added], centroids)
+                self.lists.flush()
+                self.centroids = centroids
+                np.save(self._file("centroids.npy"), self.centroids)
+                self.trained_size = self.count
+                self._save_meta()
+        finally:
+            self._training = False
+
+    def _fit(
+        self, data: "np.ndarray", nlist: Optional[int] = None
+    ) -> tuple["np.ndarray", "np.ndarray"]:
+        """Centroids for `data` and the list of every row."""
+        count = len(data)
+        nlist = nlist or max(1, int(np.sqrt(count)))
+        rng = np.random.default_rng(0)
+        sample = data
+        if count > KMEANS_SAMPLE_SIZE:
+            sample = data[rng.choice(count, KMEANS_SAMPLE_SIZE, replace=False)]
+        centroids = np.array(
+            sample[rng.choice(len(sample), min(nlist, len(sample)), replace=False)]
+        )
+        for _ in range(KMEANS_ITERATIONS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for i in range(len(centroids)):
+                members = sample[assignment == i]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[i] = centroid / max(np.linalg.norm(centroid), 1e-12)
+        centroids = centroids.astype(np.float32)
+        lists = np.empty(count, dtype=np.int32)
+        for start in range(0, count, KMEANS_SAMPLE_SIZE):
+            end = min(start + KMEANS_SAMPLE_SIZE, count)
+            lists[start:end] = self._assign(data[start:end], centroids)
+        return centroids, lists
+
+    def search(
+        self,
+        query: "np.ndarray",
+        k: int = 5,
+        group: Optional[uuid.UUID] = None,
+    ) -> list[tuple[uuid.UUID, float]]:
+        """Top `k` (key, cosine similarity) pairs, best first."""
+        with self._lock:
+            if not self.count:
+                return []
+            rows = np.arange(self.count)
+            if group is not None:
+                target = _uuid_array([group])[0]
+                groups = self.groups[: self.count]
+                rows = rows[(groups[:, 0] == target[0]) & (groups[:, 1] == target[1])]
+            if self.centroids is not None and len(rows) > k:
+                probe = np.argsort(-(self.centroids @ query))[: self.nprobe]
+                probed = rows[np.isin(self.lists[rows], probe)]
+                # too few candidates in the probed lists, scan the group instead
+                if len(probed) >= k:
+                    rows = probed
+            if not len(rows):
+                return []
+            scores = self.vectors[rows] @ query
+            top = np.argsort(-scores)[:k]
+            return [(_to_uuid(self.keys[rows[i]]), float(scores[i])) for i in top]
@@ -1,19 +1,50 @@
+import time
 import asyncio
-from fastapi import APIRouter
+from fastapi import (
+    APIRouter,
+    HTTPException,
+    Query,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+)
 from fastapi.responses import StreamingResponse
-from typing import List, Dict, Any
-from schemas.chat import ChatRequest
+from typing import Any, AsyncIterator, Callable, Dict, List, Literal, Optional, Union
+from uuid import UUID
+from pydantic import ValidationError
+from schemas.chat import ChatRequest, ChatTurn
 from agents import (
     Agent,
     Runner,
 )
 from _agents.context import ConversationState, SQLConversationStore, AgentContext
 from _agents.triage import triage_agent
-from _agents.events import EventName, NewMessageEvent
-from services.conversation import ConversationService
-from services.message import MessageService
+from _agents.events import EventName, NewMessageEvent, RunEndedEvent, RunStartedEvent
+from _agents.hub import event_hub
+from models.message import Message
+from services.message import AsyncMessageService
+from services.persistence import PersistenceFailed, persistence_queue
 from loguru import logger
-from _agents.adapter import StreamEventAdapter
+from _agents.adapter import StreamEventAdapter, coalesce_deltas
+from _agents.history import fits_window, get_tool_items, load_history
+from _agents.retrieval import history_retriever
+from _agents.encoding import StreamEncoder, get_encoder
+from _agents.runs import RunLog, run_registry
+from _agents.scheduler import SchedulerClosed, SchedulerFull, RunSlot, scheduler
+from _agents.response_cache import (
+    dump_turn,
+    get_cache_key,
+    is_cacheable,
+    replay_events,
+    response_cache,
+)
+from config import settings
+from metrics import (
+    chat_run_resumes_total,
+    chat_stage_seconds,
+    response_cache_requests_total,
+    stream_encode_seconds,
+)
 
 router = APIRouter(prefix="/chat")
 
@@ -29,6 +60,12 @@ def _get_agent_by_name(name: str):
     return agents.get(name, triage_agent)
 
 
+def _get_model_name(agent: Agent) -> str:
+    """Key the scheduler limits a run by."""
+    model = agent.model
+    return getattr(model, "model", None) or str(model or "default")
+
+
 def _get_guardrail_name(g) -> str:
     """Extract a friendly guardrail name."""
     name_attr = getattr(g, "name", None)
@@ -71,41 +108,482 @@ async def get_agents() -> List[Dict[str, Any]]:
     return _build_agents_list()
 
 
-@router.post("/streaming")
-async def streamable_chat_endpoint(req: ChatRequest):
-    conversation = ConversationService.get_conversation(req.conversation_id)
+@router.get("/scheduler")
+async def get_scheduler_stats() -> Dict[str, Any]:
+    return scheduler.stats()
 
-    state = ConversationState(**conversation.state)
-    if req.file_id:
-        state.context.current_file_id = req.file_id
-        ConversationService.update_conversation(conversation.id, state=state.to_dict())
 
-    current_agent = _get_agent_by_name(state.current_agent)
+def _get_coalesce(
+    coalesce: bool, coalesce_ms: Optional[int], coalesce_bytes: Optional[int]
+) -> tuple[Optional[float], Optional[int]]:
+    """Coalescing window in seconds and size a turn asked for."""
+    if not coalesce:
+        return None, None
+    if coalesce_ms is None:
+        coalesce_ms = settings.STREAM_COALESCE_MS
+    return coalesce_ms / 1000, coalesce_bytes or settings.STREAM_COALESCE_BYTES
 
-    MessageService.create_message(
-        role="user",
-        content=req.message,
-        file_id=req.file_id,
-        conversation_id=conversation.id,
-    )
-    messages = MessageService.get_messages_by_conversation_id(
-        conversation_id=conversation.id
+
+async def _acquire_slot(agent: Agent, conversation_id: UUID) -> RunSlot:
+    try:
+        with chat_stage_seconds.time(stage="schedule"):
+            return await scheduler.acquire(
+                _get_model_name(agent), conversation_id=conversation_id
+            )
+    except SchedulerFull as e:
+        raise HTTPException(
+            status_code=429, detail=str(e), headers={"Retry-After": "1"}
+        )
+    except SchedulerClosed as e:
+        # another worker or instance can take it
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": "1"}
+        )
+
+
+async def _get_cached_turn(
+    agent: Agent, history: list[dict], state: ConversationState
+) -> tuple[Optional[str], Optional[dict]]:
+    """Response cache key of the turn and the cached turn, if any."""
+    if not settings.RESPONSE_CACHE_ENABLED:
+        return None, None
+    cache_key = get_cache_key(
+        agent, _get_model_name(agent), history, state.context.model_dump()
     )
+    if cache_key is None:
+        return None, None
+    cached_turn = await response_cache.get(cache_key)
+    response_cache_requests_total.inc(result="miss" if cached_turn is None else "hit")
+    return cache_key, cached_turn
+
+
+def _start_run(
+    conversation_id: UUID,
+    state: ConversationState,
+    current_agent: Agent,
+    history: list[dict],
+    slot: RunSlot,
+    message: str,
+    cache_key: Optional[str] = None,
+    cached_turn: Optional[dict] = None,
+    coalesce_window: Optional[float] = None,
+    coalesce_bytes: Optional[int] = None,
+    on_message: Optional[Callable[[Message], None]] = None,
+    on_end: Optional[Callable[[RunEndedEvent], None]] = None,
+) -> tuple[RunLog, StreamEventAdapter]:
+    """
+    Run a turn in the background, its events go to a run log and the hub.
 
-    def handle_new_message_event(event: NewMessageEvent):
-        MessageService.create_message(
-            role="assistant",
+    The slot is released once the turn is persisted; `on_message` is called
+    with every assistant message queued for writing, `on_end` once the turn
+    is written or failed to be.
+    """
+    # tool calls of the turn, stored with the message that follows them so
+    # the next turns see their results instead of calling the tools again
+    tool_events = []
+
+    async def save_message(**fields):
+        # written behind the stream, the next chunk does not wait for the commit
+        message = await persistence_queue.put_message(
+            role="assistant", conversation_id=conversation_id, **fields
+        )
+        if on_message is not None:
+            on_message(message)
+
+    async def handle_new_message_event(event: NewMessageEvent):
+        tool_items = get_tool_items(tool_events) or None
+        tool_events.clear()
+        await save_message(
             content=event.content,
             think=event.think,
-            conversation_id=conversation.id,
+            agent=event.agent,
+            tool_items=tool_items,
+        )
+
+    if cached_turn is not None:
+        # replayed through the adapter, the same handlers persist the turn
+        result = None
+        adapter = StreamEventAdapter(event_interator=replay_events(cached_turn))
+    else:
+        result = Runner.run_streamed(current_agent, history, context=state.context)
+        adapter = StreamEventAdapter(
+            event_interator=result.stream_events(),
+            record=cache_key is not None,
+            on_cancel=result.cancel,
+        )
+
+    adapter.register_handler(EventName.NEW_MESSAGE_EVENT, handle_new_message_event)
+    adapter.register_handler(EventName.TOOL_CALLED_EVENT, tool_events.append)
+    adapter.register_handler(EventName.TOOL_CALL_OUTPUT_EVENT, tool_events.append)
+
+    async def save_partial_message():
+        # the client is gone, keep what it has seen so far
+        event = adapter.partial_message(current_agent.name)
+        tool_items = get_tool_items(tool_events) or None
+        if event is None and tool_items is None:
+            return
+        await save_message(
+            content=event.content if event else "",
+            think=event.think if event else None,
+            agent=event.agent if event else current_agent.name,
+            tool_items=tool_items,
+            truncated=True,
+        )
+
+    async def finish(error: Optional[str]):
+        # a failed turn is not saved whole, whatever made it to the database
+        saved = error is None
+        try:
+            if adapter.cancelled:
+                await save_partial_message()
+            await persistence_queue.flush(conversation_id)
+        except PersistenceFailed:
+            logger.error(f"run {run.run_id} was not saved")
+            saved = False
+        event = RunEndedEvent(
+            run_id=run.run_id, cancelled=adapter.cancelled, saved=saved, error=error
         )
+        if on_end is not None:
+            on_end(event)
+        # the last event of the log, every reader sees how the turn ended
+        run.append(event)
+        await event_hub.publish(conversation_id, event)
+
+    # the run is not tied to the response, a client that lost its connection
+    # reattaches to the run log instead of starting another run
+    run = run_registry.create(on_cancel=adapter.cancel)
+
+    async def run_turn():
+        started = time.perf_counter()
+        error = None
+        events = adapter.events()
+        if coalesce_window is not None or coalesce_bytes is not None:
+            events = coalesce_deltas(
+                events, window=coalesce_window, max_bytes=coalesce_bytes
+            )
+        try:
+            await event_hub.publish(
+                conversation_id, RunStartedEvent(run_id=run.run_id, message=message)
+            )
+            async for event in events:
+                run.append(event)
+                await event_hub.publish(conversation_id, event)
+            if adapter.cancelled:
+                # a cut off turn leaves the conversation with the agent it started with
+                return
+            if result is None:
+                state.current_agent = cached_turn["last_agent"]
+            else:
+                state.current_agent = result.last_agent.name
+                if cache_key is not None and is_cacheable(adapter.recorded):
+                    await response_cache.set(
+                        cache_key, dump_turn(adapter.recorded, state.current_agent)
+                    )
+            await persistence_queue.put_state(conversation_id, state.to_dict())
+        except Exception as e:
+            logger.exception(f"run {run.run_id} failed")
+            error = type(e).__name__
+        finally:
+            # readers only see the end once this turn is in the database
+            try:
+                await asyncio.shield(finish(error))
+            finally:
+                slot.release()
+                chat_stage_seconds.observe(
+                    time.perf_counter() - started, stage="stream"
+                )
+                run_registry.finish(run)
+
+    run.task = asyncio.create_task(run_turn())
+    return run, adapter
 
-    result = Runner.run_streamed(
-        current_agent, [message.dict() for message in messages], context=state.context
+
+@router.post("/streaming")
+async def streamable_chat_endpoint(req: ChatRequest, request: Request):
+    try:
+        encoder = get_encoder(req.encoding)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    coalesce_window, coalesce_bytes = _get_coalesce(
+        req.coalesce, req.coalesce_ms, req.coalesce_bytes
     )
 
-    adapter = StreamEventAdapter(event_interator=result.stream_events())
+    conversation_id = req.conversation_id
+    state = await conversation_store.get(conversation_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
 
-    adapter.register_handler(EventName.NEW_MESSAGE_EVENT, handle_new_message_event)
+    slot = await _acquire_slot(_get_agent_by_name(state.current_agent), conversation_id)
+    try:
+        with chat_stage_seconds.time(stage="prepare"):
+            # the previous turn may have changed the state while this one waited
+            state = await conversation_store.get(conversation_id)
+            if state is None:
+                raise HTTPException(status_code=404, detail="Conversation not found")
+            if req.file_id:
+                state.context.current_file_id = str(req.file_id)
+                await conversation_store.save(conversation_id, state)
+            current_agent = _get_agent_by_name(state.current_agent)
+
+            await AsyncMessageService.create_message(
+                role="user",
+                content=req.message,
+                file_id=req.file_id,
+                conversation_id=conversation_id,
+            )
+            history = await load_history(conversation_id)
+            history = await history_retriever.add_relevant_history(
+                conversation_id, req.message, history
+            )
+            cache_key, cached_turn = await _get_cached_turn(
+                current_agent, history, state
+            )
+    except BaseException:
+        slot.release()
+        raise
+
+    run, _ = _start_run(
+        conversation_id,
+        state,
+        current_agent,
+        history,
+        slot,
+        req.message,
+        cache_key=cache_key,
+        cached_turn=cached_turn,
+        coalesce_window=coalesce_window,
+        coalesce_bytes=coalesce_bytes,
+    )
+    headers = {"X-Run-Id": run.run_id}
+    if cache_key is not None:
+        headers["X-Cache"] = "miss" if cached_turn is None else "hit"
+    return StreamingResponse(
+        _stream_run(run, 0, encoder, request.receive),
+        media_type=encoder.media_type,
+        headers=headers,
+    )
+
+
+@router.get("/streaming/{run_id}")
+async def resume_streaming_endpoint(
+    run_id: str,
+    request: Request,
+    offset: int = Query(default=0, ge=0),
+    encoding: Literal["ndjson", "compact", "msgpack", "sse"] = "ndjson",
+):
+    """Reattach to a run, from `offset` or the SSE Last-Event-ID."""
+    try:
+        encoder = get_encoder(encoding)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id is not None:
+        try:
+            offset = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    run = run_registry.get(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    if offset > len(run):
+        raise HTTPException(status_code=400, detail=f"Run has only {len(run)} events")
+    if offset < run.available_from:
+        raise HTTPException(
+            status_code=410,
+            detail=f"Events before offset {run.available_from} are gone",
+        )
+    chat_run_resumes_total.inc()
+    return StreamingResponse(
+        _stream_run(run, offset, encoder, request.receive),
+        media_type=encoder.media_type,
+        headers={"X-Run-Id": run_id},
+    )
+
+
+async def _stream_run(
+    run: RunLog, offset: int, encoder: StreamEncoder, receive: Callable
+) -> AsyncIterator[Union[str, bytes]]:
+    async for index, event in run_registry.stream(run, offset, receive=receive):
+        started = time.perf_counter()
+        chunk = encoder.encode_at(event, index)
+        stream_encode_seconds.observe(
+            time.perf_counter() - started, encoding=encoder.name
+        )
+        yield chunk
 
-    return StreamingResponse(adapter.stream_events(), media_type="application/x-ndjson")
+
+class ChatSession:
+    """
+    A conversation held open by a WebSocket client.
+
+    State and history are loaded once, when the socket connects, and kept
+    current by the session's own turns. A turn reads the database only when
+    the history outgrows the window and has to be rebuilt. Changes other
+    clients make to the conversation meanwhile are not seen.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        conversation_id: UUID,
+        state: ConversationState,
+        history: list[dict],
+    ) -> None:
+        self.websocket = websocket
+        self.conversation_id = conversation_id
+        self.state = state
+        self.history = history
+        self.adapter: Optional[StreamEventAdapter] = None
+        self._turn: Optional[asyncio.Task] = None
+        # the history holds messages that did not make it to the database
+        self._stale = False
+        self._cancel_requested = False
+
+    async def send_error(self, status_code: int, detail: Any) -> None:
+        await self.websocket.send_json(
+            {"type": "error", "status": status_code, "data": detail}
+        )
+
+    async def handle(self, data: Any) -> None:
+        match data:
+            case {"type": "message"}:
+                if self._turn is not None and not self._turn.done():
+                    await self.send_error(409, "A turn is already running")
+                    return
+                try:
+                    turn = ChatTurn.model_validate(data)
+                except ValidationError as e:
+                    await self.send_error(422, e.errors(include_url=False))
+                    return
+                self._cancel_requested = False
+                self._turn = asyncio.create_task(self._run_turn(turn))
+            case {"type": "cancel"}:
+                if self.adapter is not None:
+                    self.adapter.cancel(reason="client")
+                elif self._turn is not None and not self._turn.done():
+                    # still preparing, the run is cancelled as soon as it starts
+                    self._cancel_requested = True
+            case _:
+                await self.send_error(400, "Unknown message type")
+
+    async def close(self) -> None:
+        """The socket is gone, its run is left to the run log like a dropped stream."""
+        if self._turn is not None:
+            self._turn.cancel()
+            await asyncio.gather(self._turn, return_exceptions=True)
+
+    def _add_message(self, message: Message) -> None:
+        self.history.extend(message.input_items())
+
+    def _end_turn(self, event: RunEndedEvent) -> None:
+        if not event.saved:
+            self._stale = True
+
+    async def _run_turn(self, turn: ChatTurn) -> None:
+        current_agent = _get_agent_by_name(self.state.current_agent)
+        try:
+            slot = await _acquire_slot(current_agent, self.conversation_id)
+        except HTTPException as e:
+            await self.send_error(e.status_code, e.detail)
+            return
+        try:
+            with chat_stage_seconds.time(stage="prepare"):
+                if turn.file_id:
+                    self.state.context.current_file_id = str(turn.file_id)
+                    await persistence_queue.put_state(
+                        self.conversation_id, self.state.to_dict()
+                    )
+                message = await persistence_queue.put_message(
+                    role="user",
+                    content=turn.message,
+                    file_id=turn.file_id,
+                    conversation_id=self.conversation_id,
+                )
+                self._add_message(message)
+                if self._stale or not fits_window(self.history):
+                    # rebuilt like a new connection, with the rolling summary
+                    await persistence_queue.flush(self.conversation_id)
+                    self.history = await load_history(self.conversation_id)
+                    self._stale = False
+                history = await history_retriever.add_relevant_history(
+                    self.conversation_id, turn.message, list(self.history)
+                )
+                cache_key, cached_turn = await _get_cached_turn(
+                    current_agent, history, self.state
+                )
+            coalesce_window, coalesce_bytes = _get_coalesce(
+                turn.coalesce, turn.coalesce_ms, turn.coalesce_bytes
+            )
+            run, self.adapter = _start_run(
+                self.conversation_id,
+                self.state,
+                current_agent,
+                history,
+                slot,
+                turn.message,
+                cache_key=cache_key,
+                cached_turn=cached_turn,
+                coalesce_window=coalesce_window,
+                coalesce_bytes=coalesce_bytes,
+                on_message=self._add_message,
+                on_end=self._end_turn,
+            )
+        except Exception:
+            # the turn never started, the client still gets an answer
+            slot.release()
+            logger.exception(f"turn of conversation {self.conversation_id} failed")
+            # the message may or may not have been written
+            self._stale = True
+            await self.send_error(500, "Internal server error")
+            return
+        except BaseException:
+            slot.release()
+            raise
+        if self._cancel_requested:
+            self.adapter.cancel(reason="client")
+        try:
+            await self.websocket.send_json({"type": "run", "run_id": run.run_id})
+            async for _, event in run_registry.stream(run):
+                await self.websocket.send_text(event.model_dump_json())
+            await self.websocket.send_json(
+                {
+                    "type": "done",
+                    "run_id": run.run_id,
+                    "cancelled": self.adapter.cancelled,
+                    "saved": not self._stale,
+                }
+            )
+        finally:
+            self.adapter = None
+
+
+@router.websocket("/ws")
+async def chat_websocket(websocket: WebSocket, conversation_id: UUID):
+    """
+    Chat over one socket, turn after turn.
+
+    The client sends `{"type": "message", "message": ...}` (plus the optional
+    ChatTurn fields) to start a turn and `{"type": "cancel"}` to stop it. The
+    server answers with `{"type": "run", "run_id"}`, the events of the turn as
+    JSON and `{"type": "done"}`, or `{"type": "error"}`.
+    """
+    state = await conversation_store.get(conversation_id)
+    if state is None:
+        await websocket.close(code=1008, reason="Conversation not found")
+        return
+    await websocket.accept()
+    session = ChatSession(
+        websocket, conversation_id, state, await load_history(conversation_id)
+    )
+    try:
+        while True:
+            try:
+                data = await websocket.receive_json()
+            except ValueError:
+                await session.send_error(400, "Invalid JSON")
+                continue
+            await session.handle(data)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await session.close()
@@ -1,11 +1,16 @@
-from fastapi import APIRouter, Query
+import asyncio
+from fastapi import APIRouter, Query, HTTPException
+from fastapi.responses import StreamingResponse
 from uuid import UUID
-from services.conversation import ConversationService
+from services.conversation import AsyncConversationService
 from _agents.context import AgentContext
-from typing import Optional
+from _agents.encoding import get_encoder
+from _agents.hub import event_hub
+from typing import Literal, Optional
 from datetime import timezone
 
 from schemas.conversation import NewConversationResponse, ConversationFilter
+from services.pagination import KEYSET_SORT_FIELDS
 
 router = APIRouter(prefix="/conversation")
 
@@ -17,7 +22,7 @@ async def new_conversation():
         "context": ctx.model_dump(),
         "current_agent": None,
     }
-    conversation = ConversationService.create_conversation(
+    conversation = await AsyncConversationService.create_conversation(
         "New Conversation", state=state
     )
     return NewConversationResponse(id=str(conversation.id), name=conversation.name)
@@ -30,16 +35,42 @@ async def get_conversations(
     sort_field: Optional[str] = Query(None),
     sort_order: Optional[str] = Query("desc"),
     q: Optional[str] = Query(None),
+    after: Optional[str] = Query(None),
+    before: Optional[str] = Query(None),
+    with_total: bool = Query(False),
 ):
     filter_obj = ConversationFilter(q=q) if q else None
-    conversations = ConversationService.get_conversations(
-        filter=filter_obj,
-        sort_field=sort_field or "updated_at",
-        sort_order=sort_order,
-        page=page,
-        per_page=per_page,
-    )
-    total = ConversationService.get_conversations_count(filter=filter_obj)
+    sort_field = sort_field or "updated_at"
+    next_cursor, prev_cursor = None, None
+    use_cursor = after is not None or before is not None or page == 1
+    if use_cursor and sort_field in KEYSET_SORT_FIELDS:
+        try:
+            result = await AsyncConversationService.get_conversations_page(
+                filter=filter_obj,
+                sort_field=sort_field,
+                sort_order=sort_order,
+                after=after,
+                before=before,
+                limit=per_page,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        conversations = result.items
+        next_cursor, prev_cursor = result.next_cursor, result.prev_cursor
+    else:
+        # offset paging stays for page numbers and non timestamp sorts
+        conversations = await AsyncConversationService.get_conversations(
+            filter=filter_obj,
+            sort_field=sort_field,
+            sort_order=sort_order,
+            page=page,
+            per_page=per_page,
+        )
+    total = None
+    if with_total:
+        total = await AsyncConversationService.get_conversations_count(
+            filter=filter_obj, cached=True
+        )
 
     return {
         "conversations": [
@@ -58,20 +89,44 @@ async def get_conversations(
         "total": total,
         "page": page,
         "per_page": per_page,
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor,
     }
 
 
 @router.delete("/{conversation_id}")
 async def delete_conversation(conversation_id: UUID):
     try:
-        ConversationService.delete_conversation(conversation_id)
+        await AsyncConversationService.delete_conversation(conversation_id)
         return {"message": "Conversation deleted successfully"}
     except ValueError as e:
-        from fastapi import HTTPException
-
         raise HTTPException(status_code=404, detail=str(e))
 
 
 @router.get("/{conversation_id}")
 async def get_conversation(conversation_id: UUID):
-    return ConversationService.get_conversation(conversation_id)
+    return await AsyncConversationService.get_conversation(conversation_id)
+
+
+@router.get("/{conversation_id}/events")
+async def get_conversation_events(
+    conversation_id: UUID,
+    encoding: Literal["ndjson", "compact", "msgpack", "sse"] = "ndjson",
+):
+    """Live events of every turn of the conversation, whoever started it."""
+    try:
+        encoder = get_encoder(encoding)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if await AsyncConversationService.get_conversation(conversation_id) is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    subscription = await event_hub.subscribe(conversation_id)
+
+    async def stream():
+        try:
+            async for event in subscription:
+                yield encoder.encode(event)
+        finally:
+            await asyncio.shield(event_hub.unsubscribe(subscription))
+
+    return StreamingResponse(stream(), media_type=encoder.media_type)
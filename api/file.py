@@ -0,0 +1,76 @@
+import os
+from typing import Optional
+from uuid import UUID
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse
+from config import settings
+from services.file import AsyncFileService
+from services.storage import FileTooLarge
+
+router = APIRouter(prefix="/file")
+
+
+@router.post("/upload")
+async def upload_file(
+    request: Request,
+    name: str = Query(..., min_length=1),
+    sha256: Optional[str] = Query(None, pattern="^[0-9a-f]{64}$"),
+):
+    """
+    Store the raw request body, it is streamed to disk as it arrives.
+
+    Clients that pass the content's `sha256` skip the body when it is stored
+    already, a repeat upload then only adds a file row.
+    """
+    name = os.path.basename(name)
+    content_type = request.headers.get("content-type", "application/octet-stream")
+    if sha256:
+        file = await AsyncFileService.link_file(name, content_type, sha256)
+        if file is not None:
+            return file.dump()
+    try:
+        file = await AsyncFileService.store_file(
+            name,
+            content_type,
+            request.stream(),
+            max_size=settings.FILE_MAX_SIZE,
+        )
+    except FileTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return file.dump()
+
+
+@router.get("/{file_id}")
+async def get_file(file_id: UUID):
+    file = await AsyncFileService.get_file(file_id)
+    if file is None or file.is_deleted:
+        raise HTTPException(status_code=404, detail="File not found")
+    return file.dump()
+
+
+@router.get("/{file_id}/download")
+async def download_file(file_id: UUID):
+    file = await AsyncFileService.get_file(file_id)
+    if file is None or file.is_deleted or not os.path.isfile(file.path):
+        raise HTTPException(status_code=404, detail="File not found")
+    headers = {}
+    if file.sha256:
+        headers["etag"] = f'"{file.sha256}"'
+    # Range, If-Range and 416 are handled by FileResponse
+    response = FileResponse(
+        file.path,
+        media_type=file.content_type,
+        filename=file.name,
+        headers=headers,
+    )
+    response.chunk_size = settings.FILE_CHUNK_SIZE
+    return response
+
+
+@router.delete("/{file_id}")
+async def delete_file(file_id: UUID):
+    try:
+        await AsyncFileService.soft_delete_file(file_id)
+        return {"message": "File deleted successfully"}
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
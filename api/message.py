@@ -1,20 +1,145 @@
-from fastapi import APIRouter
+import json
+from fastapi import APIRouter, Query, HTTPException, Request
 from uuid import UUID
-from services.message import MessageService
-from services.file import FileService
+from typing import AsyncIterator, Optional
+from config import settings
+from schemas.message import MessageFilter
+from services.conversation import AsyncConversationService
+from services.message import AsyncMessageService
+from services.file import AsyncFileService
+from services.search import SearchService
 
 
 router = APIRouter(prefix="/message")
 
 
 @router.get("/list")
-async def get_messages(conversation_id: UUID):
-    messages = MessageService.get_messages_by_conversation_id(conversation_id)
+async def get_messages(
+    conversation_id: UUID,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    after: Optional[str] = Query(None),
+    before: Optional[str] = Query(None),
+    sort_order: Optional[str] = Query("asc"),
+):
+    next_cursor, prev_cursor = None, None
+    if limit is None:
+        messages = await AsyncMessageService.get_messages_by_conversation_id(
+            conversation_id
+        )
+    else:
+        try:
+            result = await AsyncMessageService.get_messages_page(
+                filter=MessageFilter(conversation_id=conversation_id),
+                sort_order=sort_order,
+                after=after,
+                before=before,
+                limit=limit,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        messages = result.items
+        next_cursor, prev_cursor = result.next_cursor, result.prev_cursor
     file_ids = [m.file_id for m in messages]
-    files = FileService.get_files_by_file_ids(file_ids=file_ids)
+    files = await AsyncFileService.get_files_by_file_ids(file_ids=file_ids)
     file_id_mapping = {f.id: {"file_id": f.id, "filename": f.name} for f in files}
     data = []
     for message in messages:
         m = message.model_dump()
         data.append({**m, "file": file_id_mapping.get(message.file_id)})
-    return data
+    if limit is None:
+        return data
+    # paginated requests get the cursors next to the page
+    return {"messages": data, "next_cursor": next_cursor, "prev_cursor": prev_cursor}
+
+
+@router.get("/search")
+async def search_messages(
+    q: str = Query(..., min_length=1),
+    conversation_id: Optional[UUID] = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+):
+    hits = await SearchService.search_messages(
+        q, conversation_id=conversation_id, limit=limit
+    )
+    return {"hits": hits}
+
+
+async def _read_ndjson(
+    chunks: AsyncIterator[bytes], max_line: int
+) -> AsyncIterator[tuple[int, dict]]:
+    """(line number, object) per non-empty line, only one line is buffered."""
+    buffer = b""
+    line_no = 0
+
+    def parse(line: bytes) -> dict:
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"line {line_no}: invalid JSON: {e}")
+        if not isinstance(data, dict):
+            raise ValueError(f"line {line_no}: expected an object")
+        return data
+
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            if line.strip():
+                yield line_no, parse(line)
+        if len(buffer) > max_line:
+            raise ValueError(f"line {line_no + 1}: longer than {max_line} bytes")
+    if buffer.strip():
+        line_no += 1
+        yield line_no, parse(buffer)
+
+
+async def _import_batch(batch: list[dict], lines: str, known: set[UUID]) -> int:
+    try:
+        conversation_ids = {UUID(str(m.get("conversation_id"))) for m in batch}
+        missing = conversation_ids - known
+        if missing:
+            known |= await AsyncConversationService.get_existing_ids(list(missing))
+            missing -= known
+        if missing:
+            raise ValueError(f"Conversation not found Id:{missing.pop()}")
+        return await AsyncMessageService.create_messages(batch)
+    except ValueError as e:
+        raise ValueError(f"lines {lines}: {e}")
+
+
+@router.post("/import")
+async def import_messages(
+    request: Request, conversation_id: Optional[UUID] = Query(None)
+):
+    """
+    Insert messages from an NDJSON body, one message object per line.
+
+    Lines are parsed as they arrive and inserted in transactions of
+    MESSAGE_IMPORT_BATCH_SIZE rows, so memory stays flat however large the
+    body. `conversation_id` applies to lines that do not name one. A bad
+    line stops the import, the batches before it stay imported.
+    """
+    imported = 0
+    known: set[UUID] = set()
+    batch: list[dict] = []
+    first_line = 1
+    try:
+        async for line_no, data in _read_ndjson(
+            request.stream(), settings.MESSAGE_IMPORT_MAX_LINE
+        ):
+            if conversation_id and data.get("conversation_id") is None:
+                data["conversation_id"] = conversation_id
+            if not batch:
+                first_line = line_no
+            batch.append(data)
+            if len(batch) >= settings.MESSAGE_IMPORT_BATCH_SIZE:
+                imported += await _import_batch(batch, f"{first_line}-{line_no}", known)
+                batch = []
+        if batch:
+            imported += await _import_batch(batch, f"{first_line}-{line_no}", known)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400, detail=f"{e} ({imported} messages imported)"
+        )
+    return {"imported": imported}
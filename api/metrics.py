@@ -0,0 +1,53 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from _agents.hub import event_hub
+from _agents.runs import run_registry
+from _agents.scheduler import scheduler
+from database import get_pool_stats
+from metrics import registry
+from services.persistence import persistence_queue
+
+router = APIRouter()
+
+registry.gauge(
+    "scheduler_running", "Agent runs holding a slot.", lambda: scheduler.running
+)
+registry.gauge(
+    "scheduler_waiting", "Agent runs waiting for a slot.", lambda: scheduler.waiting
+)
+registry.gauge(
+    "persistence_queue_size",
+    "Rows waiting in the write-behind queue.",
+    lambda: persistence_queue.size,
+)
+registry.gauge(
+    "run_logs",
+    "Run event logs kept for reconnecting clients.",
+    lambda: len(run_registry),
+)
+registry.gauge(
+    "hub_subscribers",
+    "Viewers subscribed to conversation events.",
+    lambda: event_hub.subscriber_count,
+)
+
+for field, documentation in (
+    ("size", "Connections kept open by the pool."),
+    ("checked_out", "Connections in use."),
+    ("overflow", "Connections open beyond the pool size."),
+):
+    registry.gauge(
+        f"db_pool_{field}",
+        documentation,
+        lambda field=field: {
+            (kind,): stats[field] for kind, stats in get_pool_stats().items()
+        },
+        ("kind",),
+    )
+
+
+@router.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,50 @@
+"""
+Compare two benchmark results.
+
+    python -m benchmarks.compare before.json after.json
+
+Prints every measured value present in both files with its relative change.
+"""
+
+import argparse
+import json
+from typing import Iterator
+
+# inputs and bookkeeping rather than measurements
+SKIPPED_KEYS = {"meta", "requests", "errors", "concurrency", "tokens", "seed_seconds"}
+
+
+def flatten(data: dict, prefix: str = "") -> Iterator[tuple[str, float]]:
+    for key, value in data.items():
+        if key in SKIPPED_KEYS:
+            continue
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            yield from flatten(value, path)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, value
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare two benchmark results.")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    print(f"before: {before['meta'].get('commit')}")
+    print(f"after:  {after['meta'].get('commit')}")
+    after_values = dict(flatten(after))
+    for path, old in flatten(before):
+        new = after_values.get(path)
+        if new is None:
+            continue
+        change = f"{(new - old) / old:+.1%}" if old else "n/a"
+        print(f"{path:70} {old:12.6g} {new:12.6g} {change:>8}")
+
+
+if __name__ == "__main__":
+    main()
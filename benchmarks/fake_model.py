@@ -0,0 +1,156 @@
+"""
+A local stand-in for LitellmModel.
+
+Streams a scripted answer as ResponseTextDeltaEvents at a fixed rate, after
+an optional number of tool calls, so the chat path can be measured without
+the network or a real model.
+"""
+
+import asyncio
+import itertools
+import time
+from typing import AsyncIterator, Optional
+from agents.items import ModelResponse, TResponseStreamEvent
+from agents.models.interface import Model
+from agents.usage import Usage
+from openai.types.responses import (
+    Response,
+    ResponseCompletedEvent,
+    ResponseCreatedEvent,
+    ResponseFunctionToolCall,
+    ResponseOutputMessage,
+    ResponseOutputText,
+    ResponseTextDeltaEvent,
+)
+
+DEFAULT_TEXT = "The quick brown fox jumps over the lazy dog. "
+
+
+def _response(output: list) -> Response:
+    return Response(
+        id="fake",
+        created_at=time.time(),
+        model="fake",
+        object="response",
+        output=output,
+        tool_choice="auto",
+        tools=[],
+        parallel_tool_calls=False,
+    )
+
+
+def _tool_outputs_this_turn(input) -> int:
+    """Tool results after the last user message, i.e. calls already made."""
+    if isinstance(input, str):
+        return 0
+    count = 0
+    for item in reversed(input):
+        if isinstance(item, dict) and item.get("role") == "user":
+            break
+        if isinstance(item, dict) and item.get("type") == "function_call_output":
+            count += 1
+    return count
+
+
+class FakeModel(Model):
+    """
+    Answers every turn with `tokens` deltas of `chars_per_token` characters.
+
+    `tokens_per_second` paces the deltas, 0 streams them as fast as the
+    runner consumes them. The first `tool_calls` model calls of a turn call
+    `tool_name` instead of answering.
+    """
+
+    def __init__(
+        self,
+        tokens: int = 50,
+        chars_per_token: int = 4,
+        tokens_per_second: float = 0,
+        tool_calls: int = 0,
+        tool_name: str = "get_context",
+        text: str = DEFAULT_TEXT,
+    ) -> None:
+        self.model = "fake"
+        self.tokens = tokens
+        self.chars_per_token = chars_per_token
+        self.tokens_per_second = tokens_per_second
+        self.tool_calls = tool_calls
+        self.tool_name = tool_name
+        self.text = text
+        self._call_ids = itertools.count()
+
+    def _deltas(self) -> list[str]:
+        size = self.tokens * self.chars_per_token
+        text = (self.text * (size // len(self.text) + 1))[:size]
+        step = self.chars_per_token
+        return [text[i : i + step] for i in range(0, size, step)]
+
+    async def get_response(self, *args, **kwargs) -> ModelResponse:
+        deltas = self._deltas()
+        message = self._message("".join(deltas))
+        return ModelResponse(output=[message], usage=Usage(), response_id="fake")
+
+    def _message(self, text: str) -> ResponseOutputMessage:
+        return ResponseOutputMessage(
+            id="fake",
+            type="message",
+            role="assistant",
+            status="completed",
+            content=[ResponseOutputText(type="output_text", text=text, annotations=[])],
+        )
+
+    async def stream_response(
+        self,
+        system_instructions: Optional[str],
+        input,
+        model_settings,
+        tools,
+        output_schema,
+        handoffs,
+        tracing,
+        **kwargs,
+    ) -> AsyncIterator[TResponseStreamEvent]:
+        sequence = itertools.count()
+        yield ResponseCreatedEvent(
+            type="response.created",
+            response=_response([]),
+            sequence_number=next(sequence),
+        )
+        if _tool_outputs_this_turn(input) < self.tool_calls:
+            call = ResponseFunctionToolCall(
+                type="function_call",
+                id="fake",
+                call_id=f"call_{next(self._call_ids)}",
+                name=self.tool_name,
+                arguments="{}",
+            )
+            yield ResponseCompletedEvent(
+                type="response.completed",
+                response=_response([call]),
+                sequence_number=next(sequence),
+            )
+            return
+
+        deltas = self._deltas()
+        interval = 1 / self.tokens_per_second if self.tokens_per_second else 0
+        started = time.perf_counter()
+        for i, delta in enumerate(deltas):
+            if interval:
+                # paced against the start, sleep overshoot does not accumulate
+                await asyncio.sleep(
+                    max(0, started + i * interval - time.perf_counter())
+                )
+            yield ResponseTextDeltaEvent(
+                type="response.output_text.delta",
+                item_id="fake",
+                output_index=0,
+                content_index=0,
+                delta=delta,
+                logprobs=[],
+                sequence_number=next(sequence),
+            )
+        yield ResponseCompletedEvent(
+            type="response.completed",
+            response=_response([self._message("".join(deltas))]),
+            sequence_number=next(sequence),
+        )
@@ -0,0 +1,428 @@
+"""
+Benchmark of the chat request path against a fake model.
+
+Drives `server.app` in process, without sockets, so the numbers are this
+project's own overhead: routing, the scheduler, history loading, the
+StreamEventAdapter, encoding and the database. Results are printed as JSON
+(or written to --output) to be compared across commits with
+`python -m benchmarks.compare`.
+
+    python -m benchmarks.run --sizes 10,1000,100000 --output bench.json
+
+A fresh SQLite database is created in a temporary directory unless
+DATABASE_URL is set. Other settings, e.g. HISTORY_MAX_MESSAGES, are read from
+the environment as usual.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+SEED_BATCH_SIZE = 5000
+
+
+def _configure_environment(workdir: str) -> None:
+    # settings are read on import, so this runs before any app module is loaded
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir}/bench.db")
+    os.environ.setdefault("LLM_BASE_URL", "http://fake")
+    os.environ.setdefault("LLM_API_KEY", "fake")
+    os.environ.setdefault("LLM_MODEL", "fake")
+    os.environ.setdefault("DEBUG", "false")
+    os.environ.setdefault("FILE_STORAGE_DIR", f"{workdir}/files")
+    os.environ.setdefault("EMBEDDING_INDEX_DIR", f"{workdir}/index")
+    os.environ.setdefault("RESPONSE_CACHE_PATH", "")
+
+
+def percentile(values: list[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile, `q` in [0, 100]."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(values: list[float]) -> dict:
+    return {
+        "p50": percentile(values, 50),
+        "p99": percentile(values, 99),
+        "mean": statistics.fmean(values) if values else None,
+    }
+
+
+def db_seconds() -> float:
+    from metrics import db_session_seconds
+
+    return db_session_seconds.sum(kind="sync") + db_session_seconds.sum(kind="async")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def seed(size: int, conversations: int, extra_conversations: int) -> list[uuid.UUID]:
+    """`conversations` with `size` messages each, plus empty ones for listing."""
+    from sqlalchemy import insert
+    from database import get_session
+    from _agents.context import AgentContext
+    from models.conversation import Conversation
+    from models.message import Message
+
+    start = datetime.now(timezone.utc) - timedelta(days=30)
+    ids = [uuid.uuid4() for _ in range(conversations + extra_conversations)]
+    # what POST /conversation/new stores
+    state = {"context": AgentContext().model_dump(), "current_agent": None}
+    with get_session() as session:
+        session.execute(
+            insert(Conversation),
+            [
+                {
+                    "id": conversation_id,
+                    "name": f"bench {i}",
+                    "state": state,
+                    "created_at": start + timedelta(seconds=i),
+                    "updated_at": start + timedelta(seconds=i),
+                    "is_deleted": False,
+                }
+                for i, conversation_id in enumerate(ids)
+            ],
+        )
+        for conversation_id in ids[:conversations]:
+            for offset in range(0, size, SEED_BATCH_SIZE):
+                rows = []
+                for i in range(offset, min(offset + SEED_BATCH_SIZE, size)):
+                    created_at = start + timedelta(milliseconds=i)
+                    rows.append(
+                        {
+                            "id": uuid.uuid4(),
+                            "conversation_id": conversation_id,
+                            "role": "user" if i % 2 == 0 else "assistant",
+                            "content": f"message {i} about topic {i % 97}",
+                            "agent": None if i % 2 == 0 else "Triage Agent",
+                            "created_at": created_at,
+                            "updated_at": created_at,
+                            "is_deleted": False,
+                        }
+                    )
+                session.execute(insert(Message), rows)
+        session.commit()
+    return ids[:conversations]
+
+
+async def post_streaming(app, body: dict) -> tuple[int, Optional[float], float]:
+    """
+    POST /chat/streaming straight through ASGI: status, time to the first
+    MessageDeltaEvent chunk and total time.
+
+    httpx's ASGITransport buffers the whole body, so it cannot see when the
+    first chunk is sent.
+    """
+    data = json.dumps(body).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/chat/streaming",
+        "raw_path": b"/chat/streaming",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"bench"), (b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+    }
+    done = asyncio.Event()
+    request_sent = False
+    status, first = 0, None
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": data, "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status, first
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            if first is None and b"MessageDeltaEvent" in message.get("body", b""):
+                first = time.perf_counter() - started
+            if not message.get("more_body", False):
+                done.set()
+
+    started = time.perf_counter()
+    try:
+        await app(scope, receive, send)
+    finally:
+        done.set()
+    return status, first, time.perf_counter() - started
+
+
+async def bench_chat(app, conversation_ids: list[uuid.UUID], requests: int) -> dict:
+    """
+    `requests` turns spread over the conversations, one at a time per conversation.
+
+    TTFT is measured from calling the app to the first MessageDeltaEvent chunk.
+    """
+    ttft, latency, errors = [], [], 0
+
+    async def worker(conversation_id: uuid.UUID, turns: int):
+        nonlocal errors
+        for turn in range(turns):
+            body = {"conversation_id": str(conversation_id), "message": f"hi {turn}"}
+            status, first, total = await post_streaming(app, body)
+            if status != 200:
+                errors += 1
+                continue
+            latency.append(total)
+            if first is not None:
+                ttft.append(first)
+
+    per_conversation, rest = divmod(requests, len(conversation_ids))
+    db_before = db_seconds()
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            worker(conversation_id, per_conversation + (i < rest))
+            for i, conversation_id in enumerate(conversation_ids)
+        )
+    )
+    elapsed = time.perf_counter() - started
+    completed = len(latency)
+    return {
+        "requests": completed,
+        "errors": errors,
+        "concurrency": len(conversation_ids),
+        "requests_per_second": completed / elapsed if elapsed else None,
+        "ttft_seconds": summarize(ttft),
+        "latency_seconds": summarize(latency),
+        "db_seconds_per_request": (db_seconds() - db_before) / completed
+        if completed
+        else None,
+    }
+
+
+async def bench_get(client, url: str, params: dict, requests: int) -> dict:
+    latency = []
+    db_before = db_seconds()
+    started = time.perf_counter()
+    for _ in range(requests):
+        request_started = time.perf_counter()
+        r = await client.get(url, params=params)
+        r.raise_for_status()
+        latency.append(time.perf_counter() - request_started)
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "requests_per_second": requests / elapsed if elapsed else None,
+        "latency_seconds": summarize(latency),
+        "db_seconds_per_request": (db_seconds() - db_before) / requests,
+    }
+
+
+async def bench_adapter(tokens: int, repeat: int) -> dict:
+    """
+    Per-token cost of streaming through the adapter and a run log over
+    iterating the raw runner events, per encoder.
+    """
+    from agents.stream_events import RawResponsesStreamEvent
+    from openai.types.responses import ResponseTextDeltaEvent
+    from _agents.adapter import StreamEventAdapter
+    from _agents.encoding import ENCODERS, get_encoder
+    from _agents.runs import RunRegistry
+
+    raw = [
+        RawResponsesStreamEvent(
+            data=ResponseTextDeltaEvent(
+                type="response.output_text.delta",
+                item_id="fake",
+                output_index=0,
+                content_index=0,
+                delta="tok ",
+                logprobs=[],
+                sequence_number=i,
+            )
+        )
+        for i in range(tokens)
+    ]
+
+    async def source():
+        for event in raw:
+            yield event
+
+    async def baseline() -> float:
+        started = time.perf_counter()
+        async for _ in source():
+            pass
+        return time.perf_counter() - started
+
+    async def adapted(encoding: str) -> float:
+        # the path of /chat/streaming: adapter events into a run log, encoded
+        # by its reader
+        registry = RunRegistry(buffer_size=tokens, ttl=0)
+        adapter = StreamEventAdapter(source())
+        run = registry.create(on_cancel=adapter.cancel)
+        encoder = get_encoder(encoding)
+
+        async def produce():
+            async for event in adapter.events():
+                run.append(event)
+            registry.finish(run)
+
+        started = time.perf_counter()
+        producer = asyncio.create_task(produce())
+        async for index, event in registry.stream(run):
+            encoder.encode_at(event, index)
+        await producer
+        return time.perf_counter() - started
+
+    base = min([await baseline() for _ in range(repeat)])
+    result = {"tokens": tokens}
+    for encoding in ENCODERS:
+        try:
+            get_encoder(encoding)
+        except ValueError:
+            # optional dependency missing, e.g. msgpack
+            continue
+        best = min([await adapted(encoding) for _ in range(repeat)])
+        result[encoding] = {"overhead_us_per_token": (best - base) / tokens * 1e6}
+    return result
+
+
+async def run(args: argparse.Namespace) -> dict:
+    import httpx
+    from api.chat import AGENTS
+    from benchmarks.fake_model import FakeModel
+    from config import settings
+    from server import app
+
+    model = FakeModel(
+        tokens=args.tokens,
+        tokens_per_second=args.tokens_per_second,
+        tool_calls=args.tool_calls,
+    )
+    for agent in AGENTS:
+        agent.model = model
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "database": settings.DATABASE_URL.partition(":")[0],
+            "history_max_messages": settings.HISTORY_MAX_MESSAGES,
+            "history_token_budget": settings.HISTORY_TOKEN_BUDGET,
+            "args": vars(args),
+        },
+        "adapter": await bench_adapter(args.adapter_tokens, repeat=5),
+        "sizes": {},
+    }
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=None
+        ) as client:
+            for i, size in enumerate(args.sizes):
+                seed_started = time.perf_counter()
+                # the listing sees the same empty conversations at every size
+                extra = args.conversations if i == 0 else 0
+                conversation_ids = seed(size, args.concurrency, extra)
+                seed_seconds = time.perf_counter() - seed_started
+                print(f"size {size}: seeded in {seed_seconds:.1f}s", file=sys.stderr)
+                target = str(conversation_ids[0])
+                report["sizes"][str(size)] = {
+                    "seed_seconds": seed_seconds,
+                    "message_list": await bench_get(
+                        client,
+                        "/message/list",
+                        {"conversation_id": target, "limit": 50, "sort_order": "desc"},
+                        args.requests,
+                    ),
+                    "conversation_list": await bench_get(
+                        client,
+                        "/conversation/list",
+                        {"per_page": 20, "with_total": "true"},
+                        args.requests,
+                    ),
+                    "chat_streaming": await bench_chat(
+                        app, conversation_ids, args.requests
+                    ),
+                }
+    return report
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--sizes",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=[10, 1000, 100000],
+        help="messages per seeded conversation, comma separated",
+    )
+    parser.add_argument(
+        "--requests", type=int, default=50, help="per endpoint and size"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="conversations chatted with in parallel, each seeded at the size",
+    )
+    parser.add_argument(
+        "--conversations", type=int, default=1000, help="extra empty conversations"
+    )
+    parser.add_argument("--tokens", type=int, default=50, help="tokens per answer")
+    parser.add_argument(
+        "--tokens-per-second",
+        type=float,
+        default=0,
+        help="fake model output rate, 0 for as fast as possible",
+    )
+    parser.add_argument(
+        "--tool-calls", type=int, default=0, help="get_context calls before answering"
+    )
+    parser.add_argument("--adapter-tokens", type=int, default=20000)
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        _configure_environment(workdir)
+        report = asyncio.run(run(args))
+    data = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(data + "\n")
+    else:
+        print(data)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 # config.py
+from typing import Literal, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -10,10 +11,126 @@ class Settings(BaseSettings):
         env_file=".env",
         env_file_encoding="utf-8",
     )
+    # log every SQL statement, independent of DEBUG
+    DB_ECHO: bool = False
+    # per worker connection pool, sizing is ignored for in-memory SQLite;
+    # DB_POOL_TIMEOUT is how long a checkout waits, connections older than
+    # DB_POOL_RECYCLE seconds are replaced (-1 never), DB_POOL_PRE_PING tests
+    # a connection before handing it out
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = False
+    # compiled SQL kept by SQLAlchemy, and prepared statements kept per
+    # connection by the driver (sqlite3 / asyncpg)
+    DB_QUERY_CACHE_SIZE: int = 500
+    DB_STATEMENT_CACHE_SIZE: int = 256
+    # pragmas run on every new SQLite connection; locks held by other workers
+    # are waited for up to SQLITE_BUSY_TIMEOUT ms, SQLITE_CACHE_SIZE is in
+    # pages, or KiB when negative
+    SQLITE_JOURNAL_MODE: str = "wal"
+    SQLITE_SYNCHRONOUS: str = "normal"
+    SQLITE_BUSY_TIMEOUT: int = 5000
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE: int = -64000
+    # create tables and run migrations on app startup, main.py does it once
+    # before starting the workers instead
+    INIT_DB_ON_STARTUP: bool = True
+
+    # production server (main.py); on shutdown active streams get up to
+    # SHUTDOWN_TIMEOUT seconds to finish
+    HOST: str = "0.0.0.0"
+    PORT: int = 8000
+    WORKERS: int = 1
+    SHUTDOWN_TIMEOUT: float = 30
+
     LLM_BASE_URL: str
     LLM_API_KEY: str
     LLM_MODEL: str
     TIMEZONE: str = "Asia/Shanghai"
 
+    # history window sent to the runner, None for both loads the full history
+    HISTORY_MAX_MESSAGES: Optional[int] = None
+    HISTORY_TOKEN_BUDGET: Optional[int] = None
+    # messages folded into the rolling summary per refresh
+    HISTORY_SUMMARY_BATCH_SIZE: int = 200
+
+    # past messages pulled into the prompt by similarity once the window cuts
+    # history, 0 turns retrieval off (needs the retrieval extra)
+    RETRIEVAL_TOP_K: int = 0
+    RETRIEVAL_MIN_SCORE: float = 0.2
+    # "hashing" or "package.module:attr" of an Embedder factory
+    EMBEDDER: str = "hashing"
+    EMBEDDING_DIM: int = 384
+    EMBEDDING_INDEX_DIR: str = "data/index"
+
+    # opt-in cache of whole agent turns, in memory and in a SQLite file
+    # (an empty RESPONSE_CACHE_PATH keeps it in memory only)
+    RESPONSE_CACHE_ENABLED: bool = False
+    RESPONSE_CACHE_TTL: float = 3600
+    RESPONSE_CACHE_MEMORY_SIZE: int = 256
+    RESPONSE_CACHE_PATH: str = "data/response_cache.db"
+    RESPONSE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+
+    # write-behind queue for rows produced while streaming
+    PERSISTENCE_QUEUE_SIZE: int = 1000
+    PERSISTENCE_BATCH_SIZE: int = 100
+
+    # /message/import inserts NDJSON lines in transactions of this many rows,
+    # longer lines are rejected
+    MESSAGE_IMPORT_BATCH_SIZE: int = 1000
+    MESSAGE_IMPORT_MAX_LINE: int = 1024 * 1024
+
+    # delta coalescing window used when a chat request asks for it
+    STREAM_COALESCE_MS: int = 20
+    STREAM_COALESCE_BYTES: int = 256
+
+    # events of a chat run kept for clients that reconnect: the latest
+    # RUN_BUFFER_SIZE in memory, older ones in a file under RUN_LOG_DIR (empty
+    # drops them). A run nobody reads for RUN_RESUME_TIMEOUT seconds is
+    # cancelled, a finished run stays readable for RUN_LOG_TTL seconds
+    RUN_BUFFER_SIZE: int = 1000
+    RUN_LOG_DIR: str = "data/runs"
+    RUN_RESUME_TIMEOUT: float = 15
+    RUN_LOG_TTL: float = 300
+
+    # live events of a conversation's runs for /conversation/{id}/events: each
+    # viewer buffers HUB_QUEUE_SIZE events, one that falls behind has events
+    # dropped ("drop") or is disconnected ("close"). HUB_BROKER is the
+    # "package.module:attr" of a Broker factory that reaches every worker,
+    # empty keeps the events in process
+    HUB_QUEUE_SIZE: int = 1000
+    HUB_SLOW_POLICY: Literal["drop", "close"] = "drop"
+    HUB_BROKER: str = ""
+
+    # seconds a listing total may be served from the in-process count cache
+    COUNT_CACHE_TTL: float = 30
+
+    # in-process conversation state cache
+    STATE_CACHE_SIZE: int = 10000
+    STATE_CACHE_TTL: float = 300
+
+    # concurrent agent runs, in total and per model
+    LLM_MAX_CONCURRENCY: int = 32
+    LLM_MODEL_CONCURRENCY: int = 32
+    # runs allowed to wait for a slot, more are answered with 429
+    LLM_MAX_WAITING: int = 64
+    LLM_WAIT_TIMEOUT: Optional[float] = 30
+
+    # uploaded files, written and read in chunks of FILE_CHUNK_SIZE bytes
+    FILE_STORAGE_DIR: str = "data/files"
+    FILE_CHUNK_SIZE: int = 1024 * 1024
+    FILE_MAX_SIZE: int = 100 * 1024 * 1024
+    # unreferenced blobs are removed after FILE_GC_GRACE seconds, checked
+    # every FILE_GC_INTERVAL seconds
+    FILE_GC_INTERVAL: float = 600
+    FILE_GC_GRACE: float = 3600
+    # text extracted from files is stored in chunks of about this many
+    # characters, the file tools return at most FILE_TOOL_MAX_CHUNKS per call
+    FILE_TEXT_CHUNK_SIZE: int = 2000
+    FILE_TEXT_CHUNK_OVERLAP: int = 200
+    FILE_TOOL_MAX_CHUNKS: int = 5
+
 
 settings = Settings()
@@ -1,24 +1,181 @@
 from sqlmodel import SQLModel, create_engine, Session
-from contextlib import contextmanager
-from typing import Generator
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import Engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.ext.asyncio import create_async_engine
+from contextlib import contextmanager, asynccontextmanager
+from typing import Generator, AsyncGenerator
 
 from config import settings
+from metrics import db_pool_checkout_seconds, db_session_seconds
+from migrations import run_migrations
 
-engine = create_engine(
-    settings.DATABASE_URL,
-    echo=settings.DEBUG,
-    connect_args={"check_same_thread": False},
+# async drivers used for the event-loop friendly engine
+ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+}
+# sync drivers a url may name, switched to the async driver of the database
+SYNC_DRIVERS = {"pysqlite", "psycopg2", "pg8000", "pymysql", "mysqldb"}
+
+
+def get_async_database_url(url: str) -> str:
+    """Map a sync database url to the matching async driver url."""
+    scheme, sep, rest = url.partition("://")
+    backend, _, driver = scheme.partition("+")
+    if driver and driver not in SYNC_DRIVERS:
+        # named explicitly, e.g. postgresql+psycopg which does both
+        return url
+    if backend not in ASYNC_DRIVERS:
+        if driver:
+            raise ValueError(f"no async driver known for {scheme}")
+        return url
+    return f"{backend}+{ASYNC_DRIVERS[backend]}{sep}{rest}"
+
+
+# values accepted for the SQLite pragmas taken from the settings
+SQLITE_JOURNAL_MODES = {"delete", "truncate", "persist", "memory", "wal", "off"}
+SQLITE_SYNCHRONOUS_MODES = {"off", "normal", "full", "extra"}
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool recording how long checkouts wait for a connection."""
+
+    kind = "sync"
+
+    def _do_get(self):
+        with db_pool_checkout_seconds.time(kind=self.kind):
+            return super()._do_get()
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    kind = "async"
+
+    def _do_get(self):
+        with db_pool_checkout_seconds.time(kind=self.kind):
+            return super()._do_get()
+
+
+def get_connect_args(url: str) -> dict:
+    if url.startswith("sqlite"):
+        # sqlite3 (and aiosqlite, which passes it through) cache per connection
+        return {
+            "check_same_thread": False,
+            "cached_statements": settings.DB_STATEMENT_CACHE_SIZE,
+        }
+    if url.startswith("postgresql+asyncpg"):
+        return {"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+    return {}
+
+
+def is_memory_database(url: str) -> bool:
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database in (
+        None,
+        "",
+        ":memory:",
+    )
+
+
+def get_engine_options(url: str, kind: str = "sync") -> dict:
+    options = {
+        "echo": settings.DB_ECHO,
+        "connect_args": get_connect_args(url),
+        "query_cache_size": settings.DB_QUERY_CACHE_SIZE,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+    # in-memory SQLite uses a single-connection pool that takes no sizing
+    if not is_memory_database(url):
+        options["poolclass"] = (
+            TimedAsyncQueuePool if kind == "async" else TimedQueuePool
+        )
+        options["pool_size"] = settings.DB_POOL_SIZE
+        options["max_overflow"] = settings.DB_MAX_OVERFLOW
+        options["pool_timeout"] = settings.DB_POOL_TIMEOUT
+    return options
+
+
+def get_sqlite_pragmas() -> list[str]:
+    journal_mode = settings.SQLITE_JOURNAL_MODE.lower()
+    if journal_mode not in SQLITE_JOURNAL_MODES:
+        raise ValueError(f"unknown SQLITE_JOURNAL_MODE: {settings.SQLITE_JOURNAL_MODE}")
+    synchronous = settings.SQLITE_SYNCHRONOUS.lower()
+    if synchronous not in SQLITE_SYNCHRONOUS_MODES:
+        raise ValueError(f"unknown SQLITE_SYNCHRONOUS: {settings.SQLITE_SYNCHRONOUS}")
+    # several workers share the file: readers do not block the writer in WAL
+    # and a locked database is retried instead of failing at once
+    return [
+        f"PRAGMA journal_mode={journal_mode}",
+        f"PRAGMA synchronous={synchronous}",
+        f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT)}",
+        f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}",
+        f"PRAGMA cache_size={int(settings.SQLITE_CACHE_SIZE)}",
+    ]
+
+
+def configure_engine(engine: Engine) -> Engine:
+    if engine.dialect.name != "sqlite":
+        return engine
+    pragmas = get_sqlite_pragmas()
+
+    def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    return engine
+
+
+def get_pool_stats() -> dict[str, dict[str, int]]:
+    """Connections per engine kind, for pools that keep count."""
+    stats = {}
+    for kind, pool in (("sync", engine.pool), ("async", async_engine.pool)):
+        if isinstance(pool, QueuePool):
+            stats[kind] = {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+            }
+    return stats
+
+
+engine = configure_engine(
+    create_engine(settings.DATABASE_URL, **get_engine_options(settings.DATABASE_URL))
 )
 
+ASYNC_DATABASE_URL = get_async_database_url(settings.DATABASE_URL)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, **get_engine_options(ASYNC_DATABASE_URL, kind="async")
+)
+configure_engine(async_engine.sync_engine)
+
 
 @contextmanager
 def get_session() -> Generator[Session, None, None]:
     session = Session(engine)
-    try:
-        yield session
-    finally:
-        session.close()
+    with db_session_seconds.time(kind="sync"):
+        try:
+            yield session
+        finally:
+            session.close()
+
+
+@asynccontextmanager
+async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    # objects are used after commit by the routers, so keep them loaded
+    session = AsyncSession(async_engine, expire_on_commit=False)
+    with db_session_seconds.time(kind="async"):
+        try:
+            yield session
+        finally:
+            await session.close()
 
 
 def init_db():
+    # new tables come from the models, changes to existing ones from migrations
     SQLModel.metadata.create_all(engine)
+    run_migrations(engine)
@@ -1,5 +1,63 @@
+"""
+Production entry point.
+
+    python main.py --workers 4
+
+The app is imported and migrations run once here, before any worker starts,
+so a broken configuration fails fast and workers do not race on the schema.
+Each worker then opens its own engines and pools. On SIGTERM/SIGINT workers
+stop accepting connections and give active streams up to SHUTDOWN_TIMEOUT
+seconds to finish.
+"""
+
+import argparse
+import os
+import uvicorn
+from loguru import logger
+
+
 def main():
-    print("Hello from openai-agents-api!")
+    from config import settings
+
+    parser = argparse.ArgumentParser(description="Run the API server.")
+    parser.add_argument("--host", default=settings.HOST)
+    parser.add_argument("--port", type=int, default=settings.PORT)
+    parser.add_argument("--workers", type=int, default=settings.WORKERS)
+    args = parser.parse_args()
+
+    # preload: surfaces import and settings errors before the workers spawn
+    import server  # noqa: F401
+    from database import engine, init_db
+
+    init_db()
+    # workers are spawned, not forked, and open their own pools
+    engine.dispose()
+    # read by spawned workers; a single worker runs in this process
+    os.environ["INIT_DB_ON_STARTUP"] = "false"
+    settings.INIT_DB_ON_STARTUP = False
+
+    if args.workers > 1:
+        # the state cache is per process and would go stale across workers
+        if "STATE_CACHE_TTL" not in settings.model_fields_set:
+            os.environ["STATE_CACHE_TTL"] = "0"
+        if settings.RETRIEVAL_TOP_K:
+            logger.warning(
+                "every worker writes the history retrieval index on its own, "
+                "run a single worker or set RETRIEVAL_TOP_K=0"
+            )
+        if not settings.HUB_BROKER:
+            logger.warning(
+                "conversation event viewers only see runs of their own worker, "
+                "set HUB_BROKER to share them"
+            )
+
+    uvicorn.run(
+        "server:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=settings.SHUTDOWN_TIMEOUT,
+    )
 
 
 if __name__ == "__main__":
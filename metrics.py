@@ -0,0 +1,294 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Counters and histograms are plain dicts keyed by label values behind a lock,
+cheap enough to update on every streamed event. Gauges are read from a
+callback when `/metrics` is scraped. Each worker process exposes its own
+values.
+"""
+
+import bisect
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+# seconds, from fast DB reads up to slow model turns
+DEFAULT_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], **extra) -> str:
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(str(v))}"' for n, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    @abstractmethod
+    def samples(self) -> Iterator[str]:
+        """Exposition lines of the current values, without HELP and TYPE."""
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        # inc() runs in other threads too, e.g. the sync database pool
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in sorted(items):
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}{labels} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: per-bucket counts (last one is +Inf), sum
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def sum(self, **labels) -> float:
+        entry = self._values.get(self._key(labels))
+        return entry[1][0] if entry else 0.0
+
+    def samples(self) -> Iterator[str]:
+        # the bucket lists are updated in place, copied with the dict
+        with self._lock:
+            items = [
+                (key, (list(counts), total[0]))
+                for key, (counts, total) in self._values.items()
+            ]
+        for key, (counts, total) in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(
+                    self.label_names, key, le=_format_value(float(bound))
+                )
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Gauge(Metric):
+    """Value read from `callback` at scrape time, a dict maps label values to values."""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], float | dict[tuple[str, ...], float]],
+        labels: tuple[str, ...] = (),
+    ):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+
+    def samples(self) -> Iterator[str]:
+        value = self.callback()
+        if not isinstance(value, dict):
+            value = {(): value}
+        for key, v in sorted(value.items()):
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}{labels} {_format_value(v)}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"duplicate metric: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self._metrics.values()) + "\n"
+
+    def counter(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable,
+        labels: tuple[str, ...] = (),
+    ):
+        return self.register(Gauge(name, documentation, callback, labels))
+
+
+registry = Registry()
+
+db_session_seconds = registry.histogram(
+    "db_session_seconds", "Lifetime of database sessions.", ("kind",)
+)
+db_pool_checkout_seconds = registry.histogram(
+    "db_pool_checkout_seconds",
+    "Time to get a connection from the pool.",
+    ("kind",),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+chat_stage_seconds = registry.histogram(
+    "chat_stage_seconds", "Time spent per stage of a chat turn.", ("stage",)
+)
+chat_ttft_seconds = registry.histogram(
+    "chat_ttft_seconds", "Time from the start of a run to its first text delta."
+)
+chat_tokens_per_second = registry.histogram(
+    "chat_tokens_per_second",
+    "Output tokens per second after the first token.",
+    buckets=(1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 400),
+)
+chat_output_tokens = registry.histogram(
+    "chat_output_tokens",
+    "Estimated output tokens of completed runs.",
+    buckets=(16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192),
+)
+chat_cancelled_total = registry.counter(
+    "chat_cancelled_total", "Runs cancelled before they completed.", ("reason",)
+)
+chat_cancelled_tokens_total = registry.counter(
+    "chat_cancelled_tokens_total",
+    "Estimated output tokens of cancelled runs, generated before the cancel "
+    "(wasted) and not generated because of it (saved).",
+    ("kind",),
+)
+chat_run_resumes_total = registry.counter(
+    "chat_run_resumes_total", "Clients that reattached to a run's event log."
+)
+hub_events_dropped_total = registry.counter(
+    "hub_events_dropped_total",
+    "Events dropped for conversation viewers that fell behind.",
+)
+hub_subscribers_closed_total = registry.counter(
+    "hub_subscribers_closed_total", "Conversation viewers closed for falling behind."
+)
+persistence_failed_rows_total = registry.counter(
+    "persistence_failed_rows_total", "Queued rows dropped after failed writes."
+)
+stream_events_total = registry.counter(
+    "stream_events_total", "Events emitted by the stream adapter.", ("event",)
+)
+stream_encode_seconds = registry.histogram(
+    "stream_encode_seconds",
+    "Time spent encoding one stream chunk.",
+    ("encoding",),
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01),
+)
+tool_call_seconds = registry.histogram(
+    "tool_call_seconds", "Time from a tool call to its output.", ("tool",)
+)
+scheduler_wait_seconds = registry.histogram(
+    "scheduler_wait_seconds", "Time agent runs waited for a slot."
+)
+scheduler_rejected_total = registry.counter(
+    "scheduler_rejected_total", "Agent runs rejected by the scheduler.", ("reason",)
+)
+response_cache_requests_total = registry.counter(
+    "response_cache_requests_total", "Response cache lookups.", ("result",)
+)
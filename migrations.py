@@ -0,0 +1,143 @@
+"""
+Versioned schema migrations.
+
+`init_db` creates tables that do not exist yet with `create_all`, then applies
+every migration that has not been recorded in the `schema_version` table.
+Migrations only change tables that already exist, so each step has to be a
+no-op on a database freshly created from the current models.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable
+from loguru import logger
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Engine,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    inspect,
+    select,
+)
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateColumn
+from sqlmodel import SQLModel
+import models  # noqa: F401, registers every table on SQLModel.metadata
+from models.search import SEARCH_COLUMNS, create_search_index, drop_search_index
+
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+MIGRATIONS: list[Migration] = []
+
+
+def migration(version: int, description: str):
+    def decorator(fn: Callable[[Connection], None]):
+        if any(m.version == version for m in MIGRATIONS):
+            raise ValueError(f"duplicate migration version: {version}")
+        MIGRATIONS.append(Migration(version, description, fn))
+        return fn
+
+    return decorator
+
+
+def add_column(conn: Connection, table_name: str, column_name: str) -> None:
+    """Add a model column to an existing table if it is missing."""
+    columns = {c["name"] for c in inspect(conn).get_columns(table_name)}
+    if column_name in columns:
+        return
+    column = SQLModel.metadata.tables[table_name].c[column_name]
+    ddl = CreateColumn(column).compile(dialect=conn.dialect)
+    conn.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {ddl}")
+
+
+def create_indexes(conn: Connection, table_name: str) -> None:
+    """Create the indexes declared on a model that the table does not have yet."""
+    for index in SQLModel.metadata.tables[table_name].indexes:
+        index.create(conn, checkfirst=True)
+
+
+@migration(1, "conversation rolling summary columns")
+def add_conversation_summary(conn: Connection) -> None:
+    add_column(conn, "conversation", "summary")
+    add_column(conn, "conversation", "summarized_until")
+
+
+@migration(2, "indexes for message history and listing queries")
+def add_listing_indexes(conn: Connection) -> None:
+    create_indexes(conn, "message")
+    create_indexes(conn, "conversation")
+    create_indexes(conn, "file")
+
+
+@migration(3, "full-text search indexes for messages and conversations")
+def add_search_indexes(conn: Connection) -> None:
+    for table, column in SEARCH_COLUMNS:
+        create_search_index(conn, table, column)
+
+
+@migration(4, "content hash of uploaded files")
+def add_file_hash(conn: Connection) -> None:
+    add_column(conn, "file", "sha256")
+
+
+@migration(5, "tool calls stored with assistant messages")
+def add_message_tool_items(conn: Connection) -> None:
+    add_column(conn, "message", "tool_items")
+
+
+@migration(6, "truncated flag of messages cut off by a disconnect")
+def add_message_truncated(conn: Connection) -> None:
+    add_column(conn, "message", "truncated")
+
+
+@migration(7, "search indexes keyed by a stable integer instead of the implicit rowid")
+def rekey_search_indexes(conn: Connection) -> None:
+    if conn.dialect.name != "sqlite":
+        return
+    for table, column in SEARCH_COLUMNS:
+        drop_search_index(conn, table)
+        create_search_index(conn, table, column)
+
+
+def get_applied_versions(engine: Engine) -> set[int]:
+    with engine.begin() as conn:
+        schema_version.create(conn, checkfirst=True)
+        return set(conn.execute(select(schema_version.c.version)).scalars())
+
+
+def run_migrations(engine: Engine) -> list[int]:
+    """Apply pending migrations in order, each one in its own transaction."""
+    applied = get_applied_versions(engine)
+    done = []
+    for m in sorted(MIGRATIONS, key=lambda m: m.version):
+        if m.version in applied:
+            continue
+        with engine.begin() as conn:
+            logger.info(f"applying migration {m.version}: {m.description}")
+            m.upgrade(conn)
+            conn.execute(
+                schema_version.insert().values(
+                    version=m.version,
+                    description=m.description,
+                    applied_at=datetime.now(timezone.utc),
+                )
+            )
+        done.append(m.version)
+    return done
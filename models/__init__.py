@@ -1,3 +1,9 @@
+from sqlmodel import SQLModel
+from .blob import Blob
 from .file import File
+from .file_chunk import FileChunk
 from .message import Message
 from .conversation import Conversation
+from .search import register_search_ddl
+
+register_search_ddl(SQLModel.metadata)
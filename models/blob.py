@@ -0,0 +1,13 @@
+from sqlmodel import Field, SQLModel, Index
+from models.mixin import TimestampMixin
+
+
+class Blob(SQLModel, TimestampMixin, table=True):
+    """Stored file content, shared by every File row with the same hash."""
+
+    __table_args__ = (Index("ix_blob_refcount_updated_at", "refcount", "updated_at"),)
+
+    sha256: str = Field(primary_key=True, description="content hash")
+    path: str = Field(..., description="save path")
+    size: int = Field(..., description="file size")
+    refcount: int = Field(default=0, description="live File rows using the blob")
@@ -1,5 +1,6 @@
-from sqlmodel import SQLModel, Field
+from sqlmodel import SQLModel, Field, Index
 from typing import Optional
+from datetime import datetime
 from uuid import UUID, uuid4
 import json
 from models.mixin import TimestampMixin, SoftDeleteMixin
@@ -7,9 +8,16 @@ from sqlalchemy.dialects.sqlite import JSON
 
 
 class Conversation(SQLModel, TimestampMixin, SoftDeleteMixin, table=True):
+    __table_args__ = (
+        Index("ix_conversation_is_deleted_updated_at", "is_deleted", "updated_at"),
+        Index("ix_conversation_is_deleted_created_at", "is_deleted", "created_at"),
+    )
+
     id: UUID = Field(default_factory=uuid4, primary_key=True)
     name: str
     state: Optional[dict] = Field(default=None, sa_type=JSON)
+    summary: Optional[str] = Field(default=None)
+    summarized_until: Optional[datetime] = Field(default=None)
 
     def model_dump_json(self) -> str:
         return json.dumps(
@@ -1,4 +1,5 @@
-from sqlmodel import Field, SQLModel
+from typing import Optional
+from sqlmodel import Field, SQLModel, Index
 import uuid
 import pendulum
 from config import settings
@@ -6,6 +7,10 @@ from models.mixin import SoftDeleteMixin, TimestampMixin
 
 
 class File(SQLModel, TimestampMixin, SoftDeleteMixin, table=True):
+    __table_args__ = (
+        Index("ix_file_is_deleted_created_at", "is_deleted", "created_at"),
+    )
+
     id: uuid.UUID = Field(
         default_factory=uuid.uuid4, primary_key=True, description="File Id"
     )
@@ -13,11 +18,15 @@ class File(SQLModel, TimestampMixin, SoftDeleteMixin, table=True):
     path: str = Field(..., description="save path")
     size: int = Field(..., description="file size")
     content_type: str = Field(..., description="mime type")
+    sha256: Optional[str] = Field(default=None, description="content hash")
 
     def dump(self):
         return {
             "id": str(self.id),
             "name": self.name,
+            "size": self.size,
+            "content_type": self.content_type,
+            "sha256": self.sha256,
             "created_at": pendulum.instance(self.created_at)
             .in_timezone(settings.TIMEZONE)
             .to_iso8601_string(),
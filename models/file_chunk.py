@@ -0,0 +1,25 @@
+from typing import Optional
+from uuid import UUID
+from sqlmodel import Field, SQLModel, Index
+
+
+class FileChunk(SQLModel, table=True):
+    """A piece of the text extracted from a file, `start`/`end` are offsets into it."""
+
+    __tablename__ = "file_chunk"
+    __table_args__ = (Index("ix_file_chunk_file_id_seq", "file_id", "seq"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    file_id: UUID = Field(foreign_key="file.id")
+    seq: int
+    start: int
+    end: int
+    content: str
+
+    def to_dict(self):
+        return {
+            "seq": self.seq,
+            "start": self.start,
+            "end": self.end,
+            "content": self.content,
+        }
@@ -1,12 +1,23 @@
-from sqlmodel import SQLModel, Field
+from sqlmodel import SQLModel, Field, Index
 from uuid import UUID, uuid4
 from typing import Optional
 from models.mixin import SoftDeleteMixin, TimestampMixin
+from sqlalchemy import false
 from sqlalchemy.dialects.sqlite import JSON
 import pendulum
 
 
 class Message(SQLModel, TimestampMixin, SoftDeleteMixin, table=True):
+    __table_args__ = (
+        # history loading filters by conversation and walks (created_at, id)
+        Index(
+            "ix_message_conversation_id_created_at",
+            "conversation_id",
+            "created_at",
+            "id",
+        ),
+    )
+
     id: UUID = Field(default_factory=uuid4, primary_key=True)
     content: str
     role: str
@@ -14,6 +25,14 @@ class Message(SQLModel, TimestampMixin, SoftDeleteMixin, table=True):
     think: Optional[str] = Field(default=None)
     conversation_id: UUID = Field(foreign_key="conversation.id")
     file_id: Optional[UUID] = Field(default=None, foreign_key="file.id")
+    # Responses input items of the tool calls, and their outputs, the agent
+    # made in this turn before writing the message
+    tool_items: Optional[list] = Field(default=None, sa_type=JSON)
+    # the client went away before the agent finished writing the message
+    truncated: bool = Field(
+        default=False,
+        sa_column_kwargs={"nullable": False, "server_default": false()},
+    )
 
     def dict(self):
         return {
@@ -21,11 +40,16 @@ class Message(SQLModel, TimestampMixin, SoftDeleteMixin, table=True):
             "content": self.content,
         }
 
+    def input_items(self) -> list[dict]:
+        """Runner input for the message, its tool calls first."""
+        return [*(self.tool_items or []), self.dict()]
+
     def to_dict(self):
         return {
             "id": str(self.id),
             "role": self.role,
             "content": self.content,
             "agent": self.agent,
+            "truncated": self.truncated,
             "created_at": pendulum.instance(self.created_at).timestamp(),
         }
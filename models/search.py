@@ -0,0 +1,172 @@
+"""
+Full-text search indexes.
+
+SQLite gets an external-content FTS5 table per searchable column, kept in
+sync with triggers. The trigram tokenizer keeps the substring semantics the
+old LIKE filters had, CJK text included. Postgres gets a generated tsvector
+column with a GIN index. Other databases fall back to LIKE.
+
+FTS5 finds its rows by an integer key. Tables with a UUID primary key only
+have an implicit rowid, which VACUUM may renumber, so they get a
+`search_rowid` column of their own, assigned on insert.
+"""
+
+import re
+from sqlalchemy import Boolean, event, inspect, literal
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ColumnElement
+
+# (table, column) pairs that are indexed
+SEARCH_COLUMNS = [
+    ("message", "content"),
+    ("conversation", "name"),
+    ("file_chunk", "content"),
+]
+
+# tables whose INTEGER PRIMARY KEY is a stable key already
+SEARCH_KEYS = {"file_chunk": "id"}
+SEARCH_ROWID = "search_rowid"
+
+# trigram needs at least three characters per term
+MIN_TERM_LENGTH = 3
+
+
+def search_key(table: str) -> str:
+    """Column of `table` the rows of its FTS table are keyed by."""
+    return SEARCH_KEYS.get(table, SEARCH_ROWID)
+
+
+def sqlite_ddl(table: str, column: str) -> list[str]:
+    fts = f"{table}_fts"
+    key = search_key(table)
+    insert = f"INSERT INTO {fts}(rowid, {column}) VALUES (new.{key}, new.{column});"
+    if key == SEARCH_ROWID:
+        # the next key is taken from the unique index, the implicit rowid
+        # only finds the new row within this statement
+        insert = (
+            f"UPDATE {table} SET {key} = "
+            f"(SELECT coalesce(max({key}), 0) + 1 FROM {table}) "
+            f"WHERE rowid = new.rowid AND {key} IS NULL; "
+            f"INSERT INTO {fts}(rowid, {column}) "
+            f"SELECT {key}, {column} FROM {table} WHERE rowid = new.rowid;"
+        )
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{column}, content='{table}', content_rowid='{key}', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"{insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column}) "
+        f"VALUES ('delete', old.{key}, old.{column}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column} ON {table} "
+        f"BEGIN INSERT INTO {fts}({fts}, rowid, {column}) "
+        f"VALUES ('delete', old.{key}, old.{column}); "
+        f"INSERT INTO {fts}(rowid, {column}) VALUES (new.{key}, new.{column}); END",
+    ]
+
+
+def add_search_rowid(conn: Connection, table: str) -> None:
+    """Give an existing SQLite table its search key, numbered in rowid order."""
+    columns = {c["name"] for c in inspect(conn).get_columns(table)}
+    if SEARCH_ROWID not in columns:
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {SEARCH_ROWID} INTEGER")
+        conn.exec_driver_sql(f"UPDATE {table} SET {SEARCH_ROWID} = rowid")
+    conn.exec_driver_sql(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS ix_{table}_{SEARCH_ROWID} "
+        f"ON {table} ({SEARCH_ROWID})"
+    )
+
+
+def drop_search_index(conn: Connection, table: str) -> None:
+    """Drop the SQLite FTS table of `table` and its triggers."""
+    fts = f"{table}_fts"
+    for suffix in ("ai", "ad", "au"):
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+    conn.exec_driver_sql(f"DROP TABLE IF EXISTS {fts}")
+
+
+def postgresql_ddl(table: str, column: str) -> list[str]:
+    return [
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS (to_tsvector('simple', coalesce({column}, ''))) STORED",
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_search_vector "
+        f"ON {table} USING GIN (search_vector)",
+    ]
+
+
+def create_search_index(conn: Connection, table: str, column: str) -> None:
+    """Create the index for an existing table and fill it from its rows."""
+    if conn.dialect.name == "sqlite":
+        if search_key(table) == SEARCH_ROWID:
+            add_search_rowid(conn, table)
+        for statement in sqlite_ddl(table, column):
+            conn.exec_driver_sql(statement)
+        conn.exec_driver_sql(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+    elif conn.dialect.name == "postgresql":
+        for statement in postgresql_ddl(table, column):
+            conn.exec_driver_sql(statement)
+
+
+def register_search_ddl(metadata) -> None:
+    """Create the indexes together with their tables in `create_all`."""
+    for table, column in SEARCH_COLUMNS:
+        event.listen(
+            metadata.tables[table],
+            "after_create",
+            lambda target, connection, column=column, **kw: create_search_index(
+                connection, target.name, column
+            ),
+        )
+
+
+def search_terms(q: str) -> list[str]:
+    return [term for term in re.split(r"\s+", q.strip()) if term]
+
+
+def to_fts5_query(q: str, any_term: bool = False) -> str:
+    """Quote every term so user input is never parsed as FTS5 syntax."""
+    separator = " OR " if any_term else " "
+    return separator.join(
+        '"' + term.replace('"', '""') + '"' for term in search_terms(q)
+    )
+
+
+def can_use_fts(q: str) -> bool:
+    terms = search_terms(q)
+    return bool(terms) and all(len(term) >= MIN_TERM_LENGTH for term in terms)
+
+
+class FullTextMatch(ColumnElement):
+    """`column` matches the search query, compiled per dialect."""
+
+    type = Boolean()
+    inherit_cache = False
+
+    def __init__(self, column, q: str) -> None:
+        self.column = column
+        self.q = q
+
+
+@compiles(FullTextMatch)
+def compile_match(element: FullTextMatch, compiler, **kw):
+    return compiler.process(element.column.contains(element.q), **kw)
+
+
+@compiles(FullTextMatch, "sqlite")
+def compile_match_sqlite(element: FullTextMatch, compiler, **kw):
+    if not can_use_fts(element.q):
+        return compiler.process(element.column.contains(element.q), **kw)
+    table = element.column.table.name
+    query = compiler.process(literal(to_fts5_query(element.q)), **kw)
+    return (
+        f"{table}.{search_key(table)} IN (SELECT rowid FROM {table}_fts "
+        f"WHERE {table}_fts MATCH {query})"
+    )
+
+
+@compiles(FullTextMatch, "postgresql")
+def compile_match_postgresql(element: FullTextMatch, compiler, **kw):
+    table = element.column.table.name
+    query = compiler.process(literal(element.q), **kw)
+    return f"{table}.search_vector @@ websearch_to_tsquery('simple', {query})"
@@ -1,9 +1,17 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Optional, Literal
 from uuid import UUID
 
 
-class ChatRequest(BaseModel):
-    conversation_id: UUID
+class ChatTurn(BaseModel):
     file_id: Optional[UUID] = None
     message: str
+    # opt-in stream tuning, the defaults keep the plain ndjson event stream
+    coalesce: bool = False
+    coalesce_ms: Optional[int] = Field(default=None, ge=0)
+    coalesce_bytes: Optional[int] = Field(default=None, ge=1)
+
+
+class ChatRequest(ChatTurn):
+    conversation_id: UUID
+    encoding: Literal["ndjson", "compact", "msgpack", "sse"] = "ndjson"
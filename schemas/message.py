@@ -1,8 +1,25 @@
-from pydantic import BaseModel
+from datetime import datetime
+from pydantic import BaseModel, Field
 from typing import Optional
-from uuid import UUID
+from uuid import UUID, uuid4
 
 
 class MessageFilter(BaseModel):
     q: Optional[str] = None
     id: Optional[UUID] = None
+    conversation_id: Optional[UUID] = None
+
+
+class MessageCreate(BaseModel):
+    """A message of a bulk insert, validated without the ORM model's overhead."""
+
+    id: UUID = Field(default_factory=uuid4)
+    role: str
+    content: str
+    conversation_id: UUID
+    agent: Optional[str] = None
+    think: Optional[str] = None
+    file_id: Optional[UUID] = None
+    tool_items: Optional[list[dict]] = None
+    truncated: bool = False
+    created_at: Optional[datetime] = None
@@ -1,16 +1,39 @@
 from fastapi import FastAPI
-from database import init_db
+from loguru import logger
+from database import init_db, async_engine
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from api.chat import router as chat_router
 from api.conversation import router as conversation_router
 from api.message import router as message_router
+from api.file import router as file_router
+from api.metrics import router as metrics_router
+from services.blob import blob_collector
+from services.persistence import persistence_queue
+from _agents.hub import event_hub
+from _agents.runs import run_registry
+from _agents.scheduler import scheduler
+from config import settings
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    init_db()
+    if settings.INIT_DB_ON_STARTUP:
+        init_db()
+    persistence_queue.start()
+    blob_collector.start()
+    scheduler.start()
     yield
+    # no new runs, the ones still streaming may finish and persist their turn
+    scheduler.close()
+    if not await scheduler.drain(settings.SHUTDOWN_TIMEOUT):
+        logger.warning(f"shutting down with {scheduler.running} runs still active")
+    run_registry.close()
+    event_hub.close()
+    await blob_collector.stop()
+    # flush buffered messages before the engine goes away
+    await persistence_queue.stop()
+    await async_engine.dispose()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -31,3 +54,5 @@ app.add_middleware(
 app.include_router(chat_router)
 app.include_router(conversation_router)
 app.include_router(message_router)
+app.include_router(file_router)
+app.include_router(metrics_router)
@@ -0,0 +1,161 @@
+import asyncio
+from collections import Counter
+from datetime import timedelta
+from typing import Iterable, Optional
+from loguru import logger
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import delete, select, update
+from config import settings
+from database import get_async_session
+from models.blob import Blob
+from models.file import File
+from models.mixin import utc_now
+from services.storage import StoredFile, storage
+
+
+class BlobService:
+    @staticmethod
+    def _get_release_queries(files: Iterable[File]) -> list:
+        """Drop one reference per live file that points at a blob."""
+        refs = Counter(
+            (file.sha256, file.path)
+            for file in files
+            if file.sha256 and not file.is_deleted
+        )
+        # files stored before the blob table keep their own path and are skipped
+        return [
+            update(Blob)
+            .where(Blob.sha256 == sha256, Blob.path == path)
+            .values(refcount=Blob.refcount - count)
+            for (sha256, path), count in refs.items()
+        ]
+
+    @staticmethod
+    def _get_upsert_query(dialect: str, stored: StoredFile):
+        """Create the blob with one reference, or take another on the existing one."""
+        insert = postgresql_insert if dialect == "postgresql" else sqlite_insert
+        now = utc_now()
+        stmt = insert(Blob).values(
+            sha256=stored.sha256,
+            path=storage.blob_path(stored.sha256),
+            size=stored.size,
+            refcount=1,
+            created_at=now,
+            updated_at=now,
+        )
+        return stmt.on_conflict_do_update(
+            index_elements=[Blob.sha256],
+            set_={"refcount": Blob.refcount + 1, "updated_at": now},
+        ).returning(Blob)
+
+    @staticmethod
+    def _get_acquire_query(sha256: str):
+        return (
+            update(Blob)
+            .where(Blob.sha256 == sha256)
+            .values(refcount=Blob.refcount + 1)
+            .returning(Blob)
+        )
+
+
+class AsyncBlobService:
+    @classmethod
+    async def acquire(cls, session, stored: StoredFile) -> Blob:
+        """
+        Take a reference on the blob for `stored`, creating it if needed.
+
+        The caller places `stored` with `storage.place` once the session is
+        committed, a rolled back upload leaves no file without a row.
+        """
+        # a single statement, concurrent first uploads of the same content
+        # both end up with a reference instead of one failing on the insert
+        query = BlobService._get_upsert_query(session.bind.dialect.name, stored)
+        return (await session.exec(query)).scalar_one()
+
+    @classmethod
+    async def acquire_existing(cls, session, sha256: str) -> Optional[Blob]:
+        """Take a reference on a stored blob, None when its content is not on disk."""
+        blob = await session.get(Blob, sha256)
+        if blob is None or not await storage.exists(blob.path):
+            return None
+        return (
+            await session.exec(BlobService._get_acquire_query(sha256))
+        ).scalar_one_or_none()
+
+    @classmethod
+    async def release(cls, session, files: Iterable[File]) -> None:
+        for stmt in BlobService._get_release_queries(files):
+            await session.exec(stmt)
+
+    @classmethod
+    async def get_blob(cls, sha256: str) -> Optional[Blob]:
+        async with get_async_session() as session:
+            return await session.get(Blob, sha256)
+
+    @classmethod
+    async def collect_garbage(cls, grace: float = 0, limit: int = 100) -> int:
+        """Remove blobs nobody referenced for `grace` seconds, returns how many."""
+        cutoff = utc_now() - timedelta(seconds=grace)
+        async with get_async_session() as session:
+            candidates = (
+                await session.exec(
+                    select(Blob.sha256, Blob.path)
+                    .where(Blob.refcount <= 0, Blob.updated_at < cutoff)
+                    .limit(limit)
+                )
+            ).all()
+        removed = 0
+        for sha256, path in candidates:
+            async with get_async_session() as session:
+                # an upload may have taken a reference since the select
+                result = await session.exec(
+                    delete(Blob).where(Blob.sha256 == sha256, Blob.refcount <= 0)
+                )
+                if not result.rowcount:
+                    continue
+                # unlink before commit, a crash leaves a row that the next
+                # upload of the same content repairs
+                await storage.remove(path)
+                await session.commit()
+                removed += 1
+        return removed
+
+
+class BlobCollector:
+    """Background task that runs the blob garbage collection periodically."""
+
+    def __init__(self, interval: float = 600, grace: float = 3600) -> None:
+        self.interval = interval
+        self.grace = grace
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                removed = await AsyncBlobService.collect_garbage(self.grace)
+                if removed:
+                    logger.info(f"removed {removed} unreferenced blobs")
+            except Exception:
+                logger.exception("blob garbage collection failed")
+
+
+blob_collector = BlobCollector(
+    interval=settings.FILE_GC_INTERVAL, grace=settings.FILE_GC_GRACE
+)
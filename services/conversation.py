@@ -1,9 +1,13 @@
 from uuid import UUID
-from database import get_session
+from database import get_session, get_async_session
 from models.conversation import Conversation
+from models.search import FullTextMatch
 from typing import Optional
-from sqlmodel import select, asc, desc, delete, exists, func
+from datetime import datetime
+from sqlmodel import select, asc, desc, delete, exists, func, update
 from schemas.conversation import ConversationFilter
+from services.cache import count_cache, state_cache
+from services.pagination import Page, KEYSET_SORT_FIELDS, get_keyset_query, get_page
 
 
 class ConversationService:
@@ -32,6 +36,33 @@ class ConversationService:
             session.add(conversation)
             session.commit()
             session.refresh(conversation)
+        state_cache.delete(conversation_id)
+        return conversation
+
+    @staticmethod
+    def _get_update_state_query(conversation_id: UUID, state: dict):
+        return (
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(state=state)
+            .returning(Conversation)
+        )
+
+    @classmethod
+    def update_conversation_state(
+        cls, conversation_id: UUID, state: dict
+    ) -> Optional[Conversation]:
+        """Replace the state in a single UPDATE ... RETURNING round trip."""
+        with get_session() as session:
+            conversation = session.exec(
+                cls._get_update_state_query(conversation_id, state)
+            ).scalar_one_or_none()
+            if conversation is not None:
+                # keep the returned row loaded after commit
+                session.expunge(conversation)
+            session.commit()
+        if conversation is not None:
+            state_cache.set(conversation_id, conversation.state)
         return conversation
 
     @classmethod
@@ -40,6 +71,7 @@ class ConversationService:
             conversation = cls.ensure_conversation(conversation_id=conversation_id)
             session.delete(conversation)
             session.commit()
+            state_cache.delete(conversation_id)
             return Conversation
 
     @classmethod
@@ -48,9 +80,12 @@ class ConversationService:
             stmt = delete(Conversation).where(Conversation.id.in_(conversation_ids))
             session.exec(stmt)
             session.commit()
+        for conversation_id in conversation_ids:
+            state_cache.delete(conversation_id)
 
     @staticmethod
     def _get_filter_query(query, filter: Optional[ConversationFilter] = None):
+        query = query.where(Conversation.is_deleted == False)
         if filter is None:
             return query
         if filter.id:
@@ -58,7 +93,7 @@ class ConversationService:
         if filter.name:
             query = query.where(Conversation.name == filter.name)
         if filter.q:
-            query = query.where(Conversation.name.contains(filter.q))
+            query = query.where(FullTextMatch(Conversation.name, filter.q))
         return query
 
     @staticmethod
@@ -100,6 +135,46 @@ class ConversationService:
         with get_session() as session:
             return session.exec(query).all()
 
+    @classmethod
+    def _get_page_query(
+        cls,
+        filter: Optional[ConversationFilter] = None,
+        sort_field: str = "created_at",
+        sort_order: Optional[str] = "desc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        limit: int = 10,
+    ):
+        if sort_field not in KEYSET_SORT_FIELDS:
+            raise ValueError(f"can not paginate by cursor on: {sort_field}")
+        query = cls._get_filter_query(select(Conversation), filter=filter)
+        return get_keyset_query(
+            query,
+            getattr(Conversation, sort_field),
+            Conversation.id,
+            sort_order=sort_order,
+            after=after,
+            before=before,
+            limit=limit,
+        )
+
+    @classmethod
+    def get_conversations_page(
+        cls,
+        filter: Optional[ConversationFilter] = None,
+        sort_field: str = "created_at",
+        sort_order: Optional[str] = "desc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        limit: int = 10,
+    ) -> Page[Conversation]:
+        query = cls._get_page_query(
+            filter, sort_field, sort_order, after=after, before=before, limit=limit
+        )
+        with get_session() as session:
+            rows = session.exec(query).all()
+        return get_page(rows, sort_field, after=after, before=before, limit=limit)
+
     @classmethod
     def get_conversations_count(
         cls,
@@ -119,6 +194,16 @@ class ConversationService:
                 select(Conversation).where(Conversation.id == conversation_id)
             ).one_or_none()
 
+    @classmethod
+    def get_existing_ids(cls, conversation_ids: list[UUID]) -> set[UUID]:
+        """The ids among `conversation_ids` of conversations that exist."""
+        with get_session() as session:
+            return set(
+                session.exec(
+                    select(Conversation.id).where(Conversation.id.in_(conversation_ids))
+                ).all()
+            )
+
     @classmethod
     def ensure_conversation_name(cls, name: str) -> bool:
         with get_session() as session:
@@ -131,3 +216,196 @@ class ConversationService:
         if conversation is None:
             raise ValueError(f"Conversation not found Id:{conversation_id}")
         return conversation
+
+
+class AsyncConversationService:
+    """Non-blocking counterpart of ConversationService used by the routers."""
+
+    @classmethod
+    async def create_conversation(
+        cls, name: str = "Conversation", state: Optional[dict] = None
+    ) -> Conversation:
+        conversation = Conversation(name=name, state=state)
+        async with get_async_session() as session:
+            session.add(conversation)
+            await session.commit()
+            await session.refresh(conversation)
+        count_cache.clear()
+        return conversation
+
+    @classmethod
+    async def update_conversation(
+        cls,
+        conversation_id: UUID,
+        name: Optional[str] = None,
+        state: Optional[dict] = None,
+    ) -> Conversation:
+        async with get_async_session() as session:
+            conversation = await session.get(Conversation, conversation_id)
+            if conversation is None:
+                raise ValueError(f"Conversation not found Id:{conversation_id}")
+            conversation.name = name or conversation.name
+            conversation.state = state or conversation.state
+            session.add(conversation)
+            await session.commit()
+            await session.refresh(conversation)
+        state_cache.set(conversation_id, conversation.state)
+        return conversation
+
+    @classmethod
+    async def update_conversation_state(
+        cls, conversation_id: UUID, state: dict
+    ) -> Optional[Conversation]:
+        """Replace the state in a single UPDATE ... RETURNING round trip."""
+        async with get_async_session() as session:
+            conversation = (
+                await session.exec(
+                    ConversationService._get_update_state_query(conversation_id, state)
+                )
+            ).scalar_one_or_none()
+            await session.commit()
+        if conversation is not None:
+            state_cache.set(conversation_id, conversation.state)
+        return conversation
+
+    @classmethod
+    async def get_state(cls, conversation_id: UUID) -> Optional[dict]:
+        """Conversation state, served from the in-process cache when possible."""
+        state = state_cache.get(conversation_id)
+        if state is not None:
+            return state
+        async with get_async_session() as session:
+            state = (
+                await session.exec(
+                    select(Conversation.state).where(
+                        Conversation.id == conversation_id,
+                        Conversation.is_deleted == False,
+                    )
+                )
+            ).one_or_none()
+        if state is not None:
+            state_cache.set(conversation_id, state)
+        return state
+
+    @classmethod
+    async def delete_conversation(cls, conversation_id: UUID) -> Conversation:
+        async with get_async_session() as session:
+            conversation = await session.get(Conversation, conversation_id)
+            if conversation is None:
+                raise ValueError(f"Conversation not found Id:{conversation_id}")
+            await session.delete(conversation)
+            await session.commit()
+        state_cache.delete(conversation_id)
+        count_cache.clear()
+        return conversation
+
+    @classmethod
+    async def delete_conversations(cls, conversation_ids: list[UUID]) -> None:
+        async with get_async_session() as session:
+            stmt = delete(Conversation).where(Conversation.id.in_(conversation_ids))
+            await session.exec(stmt)
+            await session.commit()
+        for conversation_id in conversation_ids:
+            state_cache.delete(conversation_id)
+        count_cache.clear()
+
+    @classmethod
+    async def update_summary(
+        cls, conversation_id: UUID, summary: str, summarized_until: datetime
+    ) -> None:
+        # keep updated_at untouched, a summary refresh is not user activity
+        stmt = (
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(
+                summary=summary,
+                summarized_until=summarized_until,
+                updated_at=Conversation.updated_at,
+            )
+        )
+        async with get_async_session() as session:
+            await session.exec(stmt)
+            await session.commit()
+
+    @classmethod
+    async def get_conversations(
+        cls,
+        filter: Optional[ConversationFilter] = None,
+        sort_field: Optional[str] = None,
+        sort_order: Optional[str] = "asc",
+        page: int = 1,
+        per_page: int = 10,
+    ) -> list[Conversation]:
+        query = select(Conversation)
+        query = ConversationService._get_filter_query(query, filter=filter)
+        query = ConversationService._get_sort_query(
+            query, sort_field=sort_field, sort_order=sort_order
+        )
+        offset = (page - 1) * per_page
+        query = query.offset(offset).limit(per_page)
+        async with get_async_session() as session:
+            return (await session.exec(query)).all()
+
+    @classmethod
+    async def get_conversations_page(
+        cls,
+        filter: Optional[ConversationFilter] = None,
+        sort_field: str = "created_at",
+        sort_order: Optional[str] = "desc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        limit: int = 10,
+    ) -> Page[Conversation]:
+        query = ConversationService._get_page_query(
+            filter, sort_field, sort_order, after=after, before=before, limit=limit
+        )
+        async with get_async_session() as session:
+            rows = (await session.exec(query)).all()
+        return get_page(rows, sort_field, after=after, before=before, limit=limit)
+
+    @classmethod
+    async def get_conversations_count(
+        cls,
+        filter: Optional[ConversationFilter] = None,
+        cached: bool = False,
+    ) -> int:
+        """Count conversations, `cached` may serve a count up to COUNT_CACHE_TTL old."""
+        key = ("conversation", filter.model_dump_json() if filter else None)
+        count = count_cache.get(key) if cached else None
+        if count is not None:
+            return count
+        query = select(func.count()).select_from(Conversation)
+        query = ConversationService._get_filter_query(query, filter=filter)
+        async with get_async_session() as session:
+            count = (await session.exec(query)).one()
+        count_cache.set(key, count)
+        return count
+
+    @classmethod
+    async def get_conversation(cls, conversation_id: UUID) -> Optional[Conversation]:
+        async with get_async_session() as session:
+            return (
+                await session.exec(
+                    select(Conversation).where(Conversation.id == conversation_id)
+                )
+            ).one_or_none()
+
+    @classmethod
+    async def get_existing_ids(cls, conversation_ids: list[UUID]) -> set[UUID]:
+        async with get_async_session() as session:
+            return set(
+                (
+                    await session.exec(
+                        select(Conversation.id).where(
+                            Conversation.id.in_(conversation_ids)
+                        )
+                    )
+                ).all()
+            )
+
+    @classmethod
+    async def ensure_conversation(cls, conversation_id: UUID) -> Conversation:
+        conversation = await cls.get_conversation(conversation_id=conversation_id)
+        if conversation is None:
+            raise ValueError(f"Conversation not found Id:{conversation_id}")
+        return conversation
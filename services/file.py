@@ -1,19 +1,34 @@
 from uuid import UUID
-from database import get_session
+from database import get_session, get_async_session
 from models.file import File
-from typing import Optional
+from typing import AsyncIterator, Optional
 from sqlmodel import select, asc, desc, delete, exists, func
 from schemas.file import FileFilter
+from models.file_chunk import FileChunk
+from services.blob import AsyncBlobService, BlobService
+from services.ingest import schedule_ingest
+from services.storage import storage
+from services.pagination import Page, KEYSET_SORT_FIELDS, get_keyset_query, get_page
 
 
 class FileService:
     @classmethod
-    def create_file(cls, name: str, path: str, size: int, content_type: str) -> File:
-        file = File(name=name, path=path, size=size, content_type=content_type)
+    def create_file(
+        cls,
+        name: str,
+        path: str,
+        size: int,
+        content_type: str,
+        sha256: Optional[str] = None,
+    ) -> File:
+        file = File(
+            name=name, path=path, size=size, content_type=content_type, sha256=sha256
+        )
         with get_session() as session:
             session.add(file)
             session.commit()
             session.refresh(file)
+        schedule_ingest(file)
         return file
 
     @classmethod
@@ -39,6 +54,9 @@ class FileService:
     def delete_file(cls, file_id: UUID) -> File:
         with get_session() as session:
             file = cls.ensure_file(file_id=file_id)
+            for stmt in BlobService._get_release_queries([file]):
+                session.exec(stmt)
+            session.exec(delete(FileChunk).where(FileChunk.file_id == file.id))
             session.delete(file)
             session.commit()
             return File
@@ -46,12 +64,31 @@ class FileService:
     @classmethod
     def delete_files(cls, file_ids: list[UUID]) -> None:
         with get_session() as session:
+            files = session.exec(select(File).where(File.id.in_(file_ids))).all()
+            for stmt in BlobService._get_release_queries(files):
+                session.exec(stmt)
+            session.exec(delete(FileChunk).where(FileChunk.file_id.in_(file_ids)))
             stmt = delete(File).where(File.id.in_(file_ids))
             session.exec(stmt)
             session.commit()
 
+    @classmethod
+    def soft_delete_file(cls, file_id: UUID) -> File:
+        with get_session() as session:
+            file = session.get(File, file_id)
+            if file is None or file.is_deleted:
+                raise ValueError(f"file not found, id: {file_id}")
+            for stmt in BlobService._get_release_queries([file]):
+                session.exec(stmt)
+            file.is_deleted = True
+            session.add(file)
+            session.commit()
+            session.refresh(file)
+        return file
+
     @staticmethod
     def _get_filter_query(query, filter: Optional[FileFilter] = None):
+        query = query.where(File.is_deleted == False)
         if filter is None:
             return query
         if filter.id:
@@ -98,6 +135,46 @@ class FileService:
         with get_session() as session:
             return session.exec(query).all()
 
+    @classmethod
+    def _get_page_query(
+        cls,
+        filter: Optional[FileFilter] = None,
+        sort_field: str = "created_at",
+        sort_order: Optional[str] = "desc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        limit: int = 10,
+    ):
+        if sort_field not in KEYSET_SORT_FIELDS:
+            raise ValueError(f"can not paginate by cursor on: {sort_field}")
+        query = cls._get_filter_query(select(File), filter=filter)
+        return get_keyset_query(
+            query,
+            getattr(File, sort_field),
+            File.id,
+            sort_order=sort_order,
+            after=after,
+            before=before,
+            limit=limit,
+        )
+
+    @classmethod
+    def get_files_page(
+        cls,
+        filter: Optional[FileFilter] = None,
+        sort_field: str = "created_at",
+        sort_order: Optional[str] = "desc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        limit: int = 10,
+    ) -> Page[File]:
+        query = cls._get_page_query(
+            filter, sort_field, sort_order, after=after, before=before, limit=limit
+        )
+        with get_session() as session:
+            rows = session.exec(query).all()
+        return get_page(rows, sort_field, after=after, before=before, limit=limit)
+
     @classmethod
     def get_files_count(
         cls,
@@ -134,3 +211,197 @@ class FileService:
         if file is None:
             raise ValueError(f"file not found, id: {file_id}")
         return file
+
+
+class AsyncFileService:
+    """Non-blocking counterpart of FileService used by the routers."""
+
+    @classmethod
+    async def create_file(
+        cls,
+        name: str,
+        path: str,
+        size: int,
+        content_type: str,
+        sha256: Optional[str] = None,
+    ) -> File:
+        file = File(
+            name=name, path=path, size=size, content_type=content_type, sha256=sha256
+        )
+        async with get_async_session() as session:
+            session.add(file)
+            await session.commit()
+            await session.refresh(file)
+        schedule_ingest(file)
+        return file
+
+    @classmethod
+    async def update_file(cls, file_id: UUID, name: Optional[str]) -> File:
+        async with get_async_session() as session:
+            file = await session.get(File, file_id)
+            if file is None:
+                raise ValueError(f"file not found, id: {file_id}")
+            file.name = name or file.name
+            session.add(file)
+            await session.commit()
+            await session.refresh(file)
+        return file
+
+    @classmethod
+    async def store_file(
+        cls,
+        name: str,
+        content_type: str,
+        chunks: AsyncIterator[bytes],
+        max_size: Optional[int] = None,
+    ) -> File:
+        """Stream `chunks` into the blob store and record them as a new file."""
+        stored = await storage.save(chunks, max_size=max_size)
+        try:
+            async with get_async_session() as session:
+                blob = await AsyncBlobService.acquire(session, stored)
+                file = File(
+                    name=name,
+                    path=blob.path,
+                    size=stored.size,
+                    content_type=content_type,
+                    sha256=stored.sha256,
+                )
+                session.add(file)
+                await session.commit()
+                await session.refresh(file)
+            # also restores the content of a blob whose file went missing
+            await storage.place(stored)
+        finally:
+            # a no-op once the body has been moved into the store
+            await storage.remove(stored.path)
+        schedule_ingest(file)
+        return file
+
+    @classmethod
+    async def link_file(
+        cls, name: str, content_type: str, sha256: str
+    ) -> Optional[File]:
+        """Record a file for content that is stored already, None if it is not."""
+        async with get_async_session() as session:
+            blob = await AsyncBlobService.acquire_existing(session, sha256)
+            if blob is None:
+                return None
+            file = File(
+                name=name,
+                path=blob.path,
+                size=blob.size,
+                content_type=content_type,
+                sha256=sha256,
+            )
+            session.add(file)
+            await session.commit()
+            await session.refresh(file)
+        schedule_ingest(file)
+        return file
+
+    @classmethod
+    async def delete_file(cls, file_id: UUID) -> File:
+        async with get_async_session() as session:
+            file = await session.get(File, file_id)
+            if file is None:
+                raise ValueError(f"file not found, id: {file_id}")
+            await AsyncBlobService.release(session, [file])
+            await session.exec(delete(FileChunk).where(FileChunk.file_id == file.id))
+            await session.delete(file)
+            await session.commit()
+            return file
+
+    @classmethod
+    async def delete_files(cls, file_ids: list[UUID]) -> None:
+        async with get_async_session() as session:
+            files = (
+                await session.exec(select(File).where(File.id.in_(file_ids)))
+            ).all()
+            await AsyncBlobService.release(session, files)
+            await session.exec(delete(FileChunk).where(FileChunk.file_id.in_(file_ids)))
+            stmt = delete(File).where(File.id.in_(file_ids))
+            await session.exec(stmt)
+            await session.commit()
+
+    @classmethod
+    async def soft_delete_file(cls, file_id: UUID) -> File:
+        async with get_async_session() as session:
+            file = await session.get(File, file_id)
+            if file is None or file.is_deleted:
+                raise ValueError(f"file not found, id: {file_id}")
+            await AsyncBlobService.release(session, [file])
+            file.is_deleted = True
+            session.add(file)
+            await session.commit()
+            await session.refresh(file)
+        return file
+
+    @classmethod
+    async def get_files(
+        cls,
+        filter: Optional[FileFilter] = None,
+        sort_field: Optional[str] = None,
+        sort_order: Optional[str] = "asc",
+        page: int = 1,
+        per_page: int = 10,
+    ) -> list[File]:
+        query = select(File)
+        query = FileService._get_filter_query(query, filter=filter)
+        query = FileService._get_sort_query(
+            query, sort_field=sort_field, sort_order=sort_order
+        )
+        offset = (page - 1) * per_page
+        query = query.offset(offset).limit(per_page)
+        async with get_async_session() as session:
+            return (await session.exec(query)).all()
+
+    @classmethod
+    async def get_files_page(
+        cls,
+        filter: Optional[FileFilter] = None,
+        sort_field: str = "created_at",
+        sort_order: Optional[str] = "desc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        limit: int = 10,
+    ) -> Page[File]:
+        query = FileService._get_page_query(
+            filter, sort_field, sort_order, after=after, before=before, limit=limit
+        )
+        async with get_async_session() as session:
+            rows = (await session.exec(query)).all()
+        return get_page(rows, sort_field, after=after, before=before, limit=limit)
+
+    @classmethod
+    async def get_files_count(
+        cls,
+        filter: Optional[FileFilter] = None,
+    ) -> int:
+        query = select(func.count()).select_from(File)
+        query = FileService._get_filter_query(query, filter=filter)
+        async with get_async_session() as session:
+            return (await session.exec(query)).one()
+
+    @classmethod
+    async def get_file(cls, file_id: UUID) -> Optional[File]:
+        async with get_async_session() as session:
+            return (
+                await session.exec(select(File).where(File.id == file_id))
+            ).one_or_none()
+
+    @classmethod
+    async def get_files_by_file_ids(cls, file_ids: list[UUID]) -> list[File]:
+        async with get_async_session() as session:
+            return (
+                await session.exec(
+                    select(File).where(File.id.in_(file_ids), File.is_deleted == False)
+                )
+            ).all()
+
+    @classmethod
+    async def ensure_file(cls, file_id: UUID) -> File:
+        file = await cls.get_file(file_id=file_id)
+        if file is None:
+            raise ValueError(f"file not found, id: {file_id}")
+        return file
@@ -0,0 +1,353 @@
+"""
+Text extraction for uploaded files.
+
+The text of a file is extracted once, split into overlapping chunks and
+stored in `file_chunk`, so agent tools read a few chunks instead of parsing
+the document on every turn. Files with the same content share the work, the
+chunks of the first one are copied.
+"""
+
+import asyncio
+import os
+import re
+import threading
+from collections import Counter
+from typing import Optional
+from uuid import UUID
+import anyio
+from loguru import logger
+from sqlalchemy import Integer, bindparam, insert, literal, or_
+from sqlalchemy import text as sql_text
+from sqlmodel import func, select
+from config import settings
+from database import get_async_session, get_session
+from models.file import File
+from models.file_chunk import FileChunk
+from models.search import FullTextMatch, can_use_fts, search_terms, to_fts5_query
+
+try:
+    import pypdf
+except ImportError:  # optional, only needed to read PDFs
+    pypdf = None
+
+TEXT_CONTENT_TYPES = {
+    "application/json",
+    "application/xml",
+    "application/javascript",
+    "application/x-yaml",
+    "application/yaml",
+}
+TEXT_EXTENSIONS = {".txt", ".md", ".csv", ".json", ".xml", ".yaml", ".yml", ".log"}
+# tried in order, gb18030 covers legacy Chinese documents
+TEXT_ENCODINGS = ("utf-8", "gb18030")
+
+# best chunks of one file matching any term, ids only, file order is restored after
+SQLITE_CHUNK_SEARCH = """
+SELECT c.id
+FROM file_chunk_fts JOIN file_chunk c ON c.id = file_chunk_fts.rowid
+WHERE file_chunk_fts MATCH :q AND c.file_id = :file_id
+ORDER BY bm25(file_chunk_fts)
+LIMIT :limit
+"""
+
+POSTGRESQL_CHUNK_SEARCH = """
+SELECT c.id
+FROM file_chunk c, websearch_to_tsquery('simple', :q) query
+WHERE c.search_vector @@ query AND c.file_id = :file_id
+ORDER BY ts_rank(c.search_vector, query) DESC
+LIMIT :limit
+"""
+
+_ingesting: set[UUID] = set()
+_ingest_tasks: set[asyncio.Task] = set()
+
+
+def _decode(data: bytes) -> str:
+    for encoding in TEXT_ENCODINGS:
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode("utf-8", errors="replace")
+
+
+def get_text_kind(content_type: str, name: str) -> Optional[str]:
+    """Which extractor handles such a file: "pdf", "text", or None for none."""
+    content_type = content_type.split(";")[0].strip().lower()
+    extension = os.path.splitext(name)[1].lower()
+    if content_type == "application/pdf" or extension == ".pdf":
+        return "pdf"
+    if (
+        content_type.startswith("text/")
+        or content_type in TEXT_CONTENT_TYPES
+        or extension in TEXT_EXTENSIONS
+    ):
+        return "text"
+    return None
+
+
+def extract_text(path: str, content_type: str, name: str = "") -> Optional[str]:
+    """Text of a stored file, None when the type is not supported."""
+    kind = get_text_kind(content_type, name or path)
+    if kind is None or not os.path.isfile(path):
+        return None
+    if kind == "pdf":
+        if pypdf is None:
+            logger.warning("pypdf is not installed, can not extract text from PDFs")
+            return None
+        reader = pypdf.PdfReader(path)
+        return "\n\n".join(page.extract_text() or "" for page in reader.pages)
+    with open(path, "rb") as f:
+        return _decode(f.read())
+
+
+def split_text(
+    text: str, size: int = 2000, overlap: int = 200
+) -> list[tuple[int, int]]:
+    """
+    (start, end) offsets of chunks of at most `size` characters.
+
+    Chunks end at a paragraph break, or else at whitespace, in their second
+    half when there is one, and the next chunk repeats the last `overlap`
+    characters.
+    """
+    chunks = []
+    start, length = 0, len(text)
+    while start < length:
+        end = min(start + size, length)
+        if end < length:
+            window = text[start + size // 2 : end]
+            cut = window.rfind("\n\n")
+            if cut >= 0:
+                cut += 2
+            else:
+                match = re.search(r"\s\S*$", window)
+                cut = match.start() + 1 if match else -1
+            if cut > 0:
+                end = start + size // 2 + cut
+        chunks.append((start, end))
+        if end >= length:
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+def build_chunks(file: File, text: str) -> list[FileChunk]:
+    offsets = split_text(
+        text, settings.FILE_TEXT_CHUNK_SIZE, settings.FILE_TEXT_CHUNK_OVERLAP
+    )
+    return [
+        FileChunk(
+            file_id=file.id, seq=seq, start=start, end=end, content=text[start:end]
+        )
+        for seq, (start, end) in enumerate(offsets)
+        if text[start:end].strip()
+    ]
+
+
+def load_chunks(file: File) -> list[FileChunk]:
+    """Extract the text of a file and split it into chunks, blocking."""
+    text = extract_text(file.path, file.content_type, file.name)
+    return build_chunks(file, text) if text else []
+
+
+class FileChunkService:
+    @staticmethod
+    def _get_count_query(file_id: UUID):
+        return select(func.count()).where(FileChunk.file_id == file_id)
+
+    @staticmethod
+    def _get_source_query(file: File):
+        """Another file with the same content whose chunks can be copied."""
+        return (
+            select(FileChunk.file_id)
+            .join(File, File.id == FileChunk.file_id)
+            .where(File.sha256 == file.sha256, File.id != file.id)
+            .limit(1)
+        )
+
+    @staticmethod
+    def _get_copy_query(source_id: UUID, file_id: UUID):
+        columns = ["file_id", "seq", "start", "end", "content"]
+        return insert(FileChunk).from_select(
+            columns,
+            select(
+                literal(file_id, FileChunk.file_id.type),
+                FileChunk.seq,
+                FileChunk.start,
+                FileChunk.end,
+                FileChunk.content,
+            ).where(FileChunk.file_id == source_id),
+        )
+
+    @staticmethod
+    def _get_search_query(file_id: UUID, q: str, limit: int, dialect: str):
+        """Best matching chunks in file order, ranked by the full-text index."""
+        if dialect == "sqlite" and can_use_fts(q):
+            statement, value = SQLITE_CHUNK_SEARCH, to_fts5_query(q, any_term=True)
+        elif dialect == "postgresql":
+            statement, value = POSTGRESQL_CHUNK_SEARCH, " or ".join(search_terms(q))
+        else:
+            return None
+        ranked = (
+            sql_text(statement)
+            .bindparams(
+                bindparam("file_id", type_=FileChunk.file_id.type),
+                q=value,
+                file_id=file_id,
+                limit=limit,
+            )
+            .columns(id=Integer)
+        )
+        return select(FileChunk).where(FileChunk.id.in_(ranked)).order_by(FileChunk.seq)
+
+    @staticmethod
+    def _get_match_query(file_id: UUID, q: str):
+        """Every chunk matching a term of `q`, for queries the index can not rank."""
+        return select(FileChunk).where(
+            FileChunk.file_id == file_id,
+            or_(*[FullTextMatch(FileChunk.content, term) for term in search_terms(q)]),
+        )
+
+    @staticmethod
+    def _rank(chunks: list[FileChunk], q: str, limit: int) -> list[FileChunk]:
+        """Best `limit` chunks by term occurrences, returned in file order."""
+        terms = [term.lower() for term in search_terms(q)]
+
+        def score(chunk: FileChunk) -> int:
+            content = chunk.content.lower()
+            counts = Counter({term: content.count(term) for term in terms})
+            # chunks matching more of the terms first
+            return sum(1 for c in counts.values() if c) * 1000 + sum(counts.values())
+
+        best = sorted(chunks, key=score, reverse=True)[:limit]
+        return sorted(best, key=lambda chunk: chunk.seq)
+
+    @classmethod
+    def ingest_file(cls, file: File) -> int:
+        if get_text_kind(file.content_type, file.name) is None:
+            return 0
+        count = cls._get_count_query(file.id)
+        with get_session() as session:
+            existing = session.exec(count).one()
+            if existing:
+                return existing
+            if file.sha256:
+                source_id = session.exec(cls._get_source_query(file)).first()
+                if source_id is not None:
+                    session.exec(cls._get_copy_query(source_id, file.id))
+                    session.commit()
+                    return session.exec(count).one()
+        chunks = load_chunks(file)
+        if chunks:
+            with get_session() as session:
+                session.add_all(chunks)
+                session.commit()
+        return len(chunks)
+
+
+class AsyncFileChunkService:
+    @classmethod
+    async def ingest_file(cls, file: File) -> int:
+        """Extract and store the chunks of `file`, returns how many it has."""
+        if get_text_kind(file.content_type, file.name) is None:
+            return 0
+        count = FileChunkService._get_count_query(file.id)
+        async with get_async_session() as session:
+            existing = (await session.exec(count)).one()
+            if existing:
+                return existing
+            if file.sha256:
+                source_id = (
+                    await session.exec(FileChunkService._get_source_query(file))
+                ).first()
+                if source_id is not None:
+                    await session.exec(
+                        FileChunkService._get_copy_query(source_id, file.id)
+                    )
+                    await session.commit()
+                    return (await session.exec(count)).one()
+        # extraction and splitting both run off the event loop
+        chunks = await anyio.to_thread.run_sync(load_chunks, file)
+        if chunks:
+            async with get_async_session() as session:
+                session.add_all(chunks)
+                await session.commit()
+        return len(chunks)
+
+    @classmethod
+    async def get_chunks(
+        cls, file_id: UUID, start: int = 0, limit: int = 3
+    ) -> list[FileChunk]:
+        query = (
+            select(FileChunk)
+            .where(FileChunk.file_id == file_id, FileChunk.seq >= start)
+            .order_by(FileChunk.seq)
+            .limit(limit)
+        )
+        async with get_async_session() as session:
+            return (await session.exec(query)).all()
+
+    @classmethod
+    async def count_chunks(cls, file_id: UUID) -> int:
+        query = FileChunkService._get_count_query(file_id)
+        async with get_async_session() as session:
+            return (await session.exec(query)).one()
+
+    @classmethod
+    async def search_chunks(
+        cls, file_id: UUID, q: str, limit: int = 3
+    ) -> list[FileChunk]:
+        """Chunks of a file matching any term of `q`, the best ones in file order."""
+        if not search_terms(q):
+            return []
+        async with get_async_session() as session:
+            dialect = session.bind.dialect.name
+            query = FileChunkService._get_search_query(file_id, q, limit, dialect)
+            if query is not None:
+                return (await session.exec(query)).all()
+            # short terms can not use the trigram index, every match is scored
+            query = FileChunkService._get_match_query(file_id, q)
+            chunks = (await session.exec(query)).all()
+        return FileChunkService._rank(chunks, q, limit)
+
+
+def schedule_ingest(file: File) -> None:
+    """Ingest a new file in the background, uploads do not wait for it."""
+    if file.id in _ingesting or not os.path.isfile(file.path):
+        return
+    if get_text_kind(file.content_type, file.name) is None:
+        return
+    _ingesting.add(file.id)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        # called off the event loop, e.g. by the sync services
+        threading.Thread(target=_ingest_in_thread, args=(file,), daemon=True).start()
+        return
+
+    async def run():
+        try:
+            await AsyncFileChunkService.ingest_file(file)
+        except Exception:
+            logger.exception(f"file ingestion failed, file: {file.id}")
+        finally:
+            _ingesting.discard(file.id)
+
+    task = asyncio.create_task(run())
+    _ingest_tasks.add(task)
+    task.add_done_callback(_ingest_tasks.discard)
+
+
+def _ingest_in_thread(file: File) -> None:
+    try:
+        FileChunkService.ingest_file(file)
+    except Exception:
+        logger.exception(f"file ingestion failed, file: {file.id}")
+    finally:
+        _ingesting.discard(file.id)
+
+
+async def wait_for_ingest() -> None:
+    """Wait for the ingestions scheduled on this event loop so far."""
+    await asyncio.gather(*_ingest_tasks, return_exceptions=True)
@@ -1,9 +1,15 @@
+import anyio
 from uuid import UUID
-from database import get_session
+from database import get_session, get_async_session
 from models.message import Message
-from typing import Optional
-from sqlmodel import select, asc, desc, delete, func
-from schemas.message import MessageFilter
+from models.search import FullTextMatch
+from typing import Iterable, Optional
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select, asc, desc, delete, func, or_, and_
+from schemas.message import MessageCreate, MessageFilter
+from services.pagination import Page, KEYSET_SORT_FIELDS, get_keyset_query, get_page
 
 
 class MessageService:
@@ -31,6 +37,43 @@ class MessageService:
             session.refresh(message)
         return message
 
+    @staticmethod
+    def _get_insert_rows(messages: Iterable[dict]) -> list[dict]:
+        """
+        Validated rows for a bulk insert, ValueError on an invalid message.
+
+        Messages without `created_at` are a microsecond apart in input order,
+        so history keeps their order.
+        """
+        # stdlib datetimes, pendulum arithmetic is slow per row
+        now = datetime.now(timezone.utc)
+        rows = []
+        for i, data in enumerate(messages):
+            row = MessageCreate.model_validate(data).model_dump()
+            if row["created_at"] is None:
+                row["created_at"] = now + timedelta(microseconds=i)
+            elif row["created_at"].tzinfo is not None:
+                # stored without a zone, like the timestamps the app writes
+                row["created_at"] = row["created_at"].astimezone(timezone.utc)
+            row["updated_at"] = row["created_at"]
+            row["is_deleted"] = False
+            rows.append(row)
+        return rows
+
+    @classmethod
+    def create_messages(cls, messages: Iterable[dict]) -> int:
+        """Insert many messages in one transaction, returns how many."""
+        rows = cls._get_insert_rows(messages)
+        if not rows:
+            return 0
+        with get_session() as session:
+            try:
+                session.exec(insert(Message.__table__), params=rows)
+                session.commit()
+            except IntegrityError as e:
+                raise ValueError(f"rows rejected by the database: {e.orig}")
+        return len(rows)
+
     @classmethod
     def update_message(cls, message_id: UUID, content: Optional[str]) -> Message:
         message = cls.ensure_message(message_id=message_id)
@@ -62,8 +105,12 @@ class MessageService:
             return query
         if filter.id:
             query = query.where(Message.id == UUID(str(filter.id)))
+        if filter.conversation_id:
+            query = query.where(
+                Message.conversation_id == UUID(str(filter.conversation_id))
+            )
         if filter.q:
-            query = query.where(Message.content.contains(filter.q))
+            query = query.where(FullTextMatch(Message.content, filter.q))
         return query
 
     @staticmethod
@@ -102,6 +149,46 @@ class MessageService:
         with get_session() as session:
             return session.exec(query).all()
 
+    @classmethod
+    def _get_page_query(
+        cls,
+        filter: Optional[MessageFilter] = None,
+        sort_field: str = "created_at",
+        sort_order: Optional[str] = "desc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        limit: int = 10,
+    ):
+        if sort_field not in KEYSET_SORT_FIELDS:
+            raise ValueError(f"can not paginate by cursor on: {sort_field}")
+        query = cls._get_filter_query(select(Message), filter=filter)
+        return get_keyset_query(
+            query,
+            getattr(Message, sort_field),
+            Message.id,
+            sort_order=sort_order,
+            after=after,
+            before=before,
+            limit=limit,
+        )
+
+    @classmethod
+    def get_messages_page(
+        cls,
+        filter: Optional[MessageFilter] = None,
+        sort_field: str = "created_at",
+        sort_order: Optional[str] = "desc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        limit: int = 10,
+    ) -> Page[Message]:
+        query = cls._get_page_query(
+            filter, sort_field, sort_order, after=after, before=before, limit=limit
+        )
+        with get_session() as session:
+            rows = session.exec(query).all()
+        return get_page(rows, sort_field, after=after, before=before, limit=limit)
+
     @classmethod
     def get_messages_count(
         cls,
@@ -121,6 +208,15 @@ class MessageService:
                 select(Message).where(Message.id == message_id)
             ).one_or_none()
 
+    @classmethod
+    def get_messages_by_ids(cls, message_ids: list[UUID]) -> list[Message]:
+        with get_session() as session:
+            return session.exec(
+                select(Message)
+                .where(Message.id.in_(message_ids), Message.is_deleted == False)
+                .order_by(asc(Message.created_at))
+            ).all()
+
     @classmethod
     def get_messages_by_conversation_id(cls, conversation_id: UUID) -> list[Message]:
         with get_session() as session:
@@ -130,9 +226,259 @@ class MessageService:
                 .order_by(asc(Message.created_at))
             ).all()
 
+    @staticmethod
+    def _get_recent_query(
+        conversation_id: UUID,
+        limit: int,
+        before: Optional[tuple[datetime, UUID]] = None,
+    ):
+        """Newest-first keyset query over (created_at, id)."""
+        query = select(Message).where(Message.conversation_id == conversation_id)
+        if before is not None:
+            created_at, message_id = before
+            query = query.where(
+                or_(
+                    Message.created_at < created_at,
+                    and_(Message.created_at == created_at, Message.id < message_id),
+                )
+            )
+        return query.order_by(desc(Message.created_at), desc(Message.id)).limit(limit)
+
+    @staticmethod
+    def _get_between_query(
+        conversation_id: UUID,
+        after: Optional[datetime],
+        before: tuple[datetime, UUID],
+        limit: int,
+    ):
+        """Oldest-first messages in (after, before), used to build summaries."""
+        created_at, message_id = before
+        query = select(Message).where(
+            Message.conversation_id == conversation_id,
+            or_(
+                Message.created_at < created_at,
+                and_(Message.created_at == created_at, Message.id < message_id),
+            ),
+        )
+        if after is not None:
+            query = query.where(Message.created_at > after)
+        return query.order_by(asc(Message.created_at), asc(Message.id)).limit(limit)
+
+    @classmethod
+    def get_recent_messages(
+        cls,
+        conversation_id: UUID,
+        limit: int,
+        before: Optional[tuple[datetime, UUID]] = None,
+    ) -> list[Message]:
+        with get_session() as session:
+            return session.exec(
+                cls._get_recent_query(conversation_id, limit=limit, before=before)
+            ).all()
+
+    @classmethod
+    def get_messages_between(
+        cls,
+        conversation_id: UUID,
+        after: Optional[datetime],
+        before: tuple[datetime, UUID],
+        limit: int,
+    ) -> list[Message]:
+        with get_session() as session:
+            return session.exec(
+                cls._get_between_query(
+                    conversation_id, after=after, before=before, limit=limit
+                )
+            ).all()
+
     @classmethod
     def ensure_message(cls, message_id: UUID) -> Message:
         message = cls.get_message(message_id=message_id)
         if message is None:
             raise ValueError(f"Message not found Id:{message_id}")
         return message
+
+
+class AsyncMessageService:
+    """Non-blocking counterpart of MessageService used by the routers."""
+
+    @classmethod
+    async def create_message(
+        cls,
+        role: str,
+        content: str,
+        conversation_id: str,
+        agent: Optional[str] = None,
+        file_id: Optional[str] = None,
+        think: Optional[str] = None,
+    ) -> Message:
+        message = Message(
+            role=role,
+            content=content,
+            conversation_id=conversation_id,
+            agent=agent,
+            file_id=file_id,
+            think=think,
+        )
+        async with get_async_session() as session:
+            session.add(message)
+            await session.commit()
+            await session.refresh(message)
+        return message
+
+    @classmethod
+    async def create_messages(cls, messages: Iterable[dict]) -> int:
+        # validating thousands of rows would stall the event loop
+        rows = await anyio.to_thread.run_sync(
+            MessageService._get_insert_rows, list(messages)
+        )
+        if not rows:
+            return 0
+        async with get_async_session() as session:
+            try:
+                await session.exec(insert(Message.__table__), params=rows)
+                await session.commit()
+            except IntegrityError as e:
+                # an id that exists already, e.g. an import run again
+                raise ValueError(f"rows rejected by the database: {e.orig}")
+        return len(rows)
+
+    @classmethod
+    async def update_message(cls, message_id: UUID, content: Optional[str]) -> Message:
+        async with get_async_session() as session:
+            message = await session.get(Message, message_id)
+            if message is None:
+                raise ValueError(f"Message not found Id:{message_id}")
+            message.content = content or message.content
+            session.add(message)
+            await session.commit()
+            await session.refresh(message)
+        return message
+
+    @classmethod
+    async def delete_message(cls, message_id: UUID) -> Message:
+        async with get_async_session() as session:
+            message = await session.get(Message, message_id)
+            if message is None:
+                raise ValueError(f"Message not found Id:{message_id}")
+            await session.delete(message)
+            await session.commit()
+            return message
+
+    @classmethod
+    async def delete_messages(cls, message_ids: list[UUID]) -> None:
+        async with get_async_session() as session:
+            stmt = delete(Message).where(Message.id.in_(message_ids))
+            await session.exec(stmt)
+            await session.commit()
+
+    @classmethod
+    async def get_messages(
+        cls,
+        filter: Optional[MessageFilter] = None,
+        sort_field: Optional[str] = None,
+        sort_order: Optional[str] = "asc",
+        page: int = 1,
+        per_page: int = 10,
+    ) -> list[Message]:
+        query = select(Message)
+        query = MessageService._get_filter_query(query, filter=filter)
+        query = MessageService._get_sort_query(
+            query, sort_field=sort_field, sort_order=sort_order
+        )
+        offset = (page - 1) * per_page
+        query = query.offset(offset).limit(per_page)
+        async with get_async_session() as session:
+            return (await session.exec(query)).all()
+
+    @classmethod
+    async def get_messages_page(
+        cls,
+        filter: Optional[MessageFilter] = None,
+        sort_field: str = "created_at",
+        sort_order: Optional[str] = "desc",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        limit: int = 10,
+    ) -> Page[Message]:
+        query = MessageService._get_page_query(
+            filter, sort_field, sort_order, after=after, before=before, limit=limit
+        )
+        async with get_async_session() as session:
+            rows = (await session.exec(query)).all()
+        return get_page(rows, sort_field, after=after, before=before, limit=limit)
+
+    @classmethod
+    async def get_messages_count(
+        cls,
+        filter: Optional[MessageFilter] = None,
+    ) -> int:
+        query = select(func.count()).select_from(Message)
+        query = MessageService._get_filter_query(query, filter=filter)
+        async with get_async_session() as session:
+            return (await session.exec(query)).one()
+
+    @classmethod
+    async def get_message(cls, message_id: UUID) -> Optional[Message]:
+        async with get_async_session() as session:
+            return (
+                await session.exec(select(Message).where(Message.id == message_id))
+            ).one_or_none()
+
+    @classmethod
+    async def get_messages_by_ids(cls, message_ids: list[UUID]) -> list[Message]:
+        async with get_async_session() as session:
+            return (
+                await session.exec(
+                    select(Message)
+                    .where(Message.id.in_(message_ids), Message.is_deleted == False)
+                    .order_by(asc(Message.created_at))
+                )
+            ).all()
+
+    @classmethod
+    async def get_messages_by_conversation_id(
+        cls, conversation_id: UUID
+    ) -> list[Message]:
+        async with get_async_session() as session:
+            return (
+                await session.exec(
+                    select(Message)
+                    .where(Message.conversation_id == conversation_id)
+                    .order_by(asc(Message.created_at))
+                )
+            ).all()
+
+    @classmethod
+    async def get_recent_messages(
+        cls,
+        conversation_id: UUID,
+        limit: int,
+        before: Optional[tuple[datetime, UUID]] = None,
+    ) -> list[Message]:
+        query = MessageService._get_recent_query(
+            conversation_id, limit=limit, before=before
+        )
+        async with get_async_session() as session:
+            return (await session.exec(query)).all()
+
+    @classmethod
+    async def get_messages_between(
+        cls,
+        conversation_id: UUID,
+        after: Optional[datetime],
+        before: tuple[datetime, UUID],
+        limit: int,
+    ) -> list[Message]:
+        query = MessageService._get_between_query(
+            conversation_id, after=after, before=before, limit=limit
+        )
+        async with get_async_session() as session:
+            return (await session.exec(query)).all()
+
+    @classmethod
+    async def ensure_message(cls, message_id: UUID) -> Message:
+        message = await cls.get_message(message_id=message_id)
+        if message is None:
+            raise ValueError(f"Message not found Id:{message_id}")
+        return message
@@ -0,0 +1,102 @@
+import base64
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Generic, Optional, TypeVar
+from uuid import UUID
+from sqlmodel import and_, asc, desc, or_
+
+T = TypeVar("T")
+
+# timestamp columns that can back a cursor, together with the primary key
+KEYSET_SORT_FIELDS = ("created_at", "updated_at")
+
+
+@dataclass
+class Page(Generic[T]):
+    items: list[T] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
+
+def encode_cursor(value: datetime, id: UUID) -> str:
+    raw = json.dumps([value.isoformat(), id.hex], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(value), UUID(id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"invalid cursor: {cursor}") from e
+
+
+def _after(sort_col, id_col, cursor: tuple[datetime, UUID], descending: bool):
+    value, id = cursor
+    if descending:
+        return or_(sort_col < value, and_(sort_col == value, id_col < id))
+    return or_(sort_col > value, and_(sort_col == value, id_col > id))
+
+
+def get_keyset_query(
+    query,
+    sort_col,
+    id_col,
+    sort_order: Optional[str] = "desc",
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = 10,
+):
+    """
+    Apply keyset pagination over (sort_col, id_col).
+
+    `after` continues past the last row of a page, `before` goes back from the
+    first one. One extra row is fetched to tell whether more rows exist.
+    """
+    descending = not sort_order or sort_order.lower() == "desc"
+    if before is not None:
+        query = query.where(
+            _after(sort_col, id_col, decode_cursor(before), not descending)
+        )
+        # walk backwards, the page is reversed again in get_page
+        order = asc if descending else desc
+    else:
+        if after is not None:
+            query = query.where(
+                _after(sort_col, id_col, decode_cursor(after), descending)
+            )
+        order = desc if descending else asc
+    return query.order_by(order(sort_col), order(id_col)).limit(limit + 1)
+
+
+def get_page(
+    rows: list[T],
+    sort_field: str,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = 10,
+) -> Page[T]:
+    rows = list(rows)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        rows.reverse()
+
+    def cursor(row) -> str:
+        return encode_cursor(getattr(row, sort_field), row.id)
+
+    if not rows:
+        return Page(items=[])
+    if before is not None:
+        return Page(
+            items=rows,
+            next_cursor=cursor(rows[-1]),
+            prev_cursor=cursor(rows[0]) if has_more else None,
+        )
+    return Page(
+        items=rows,
+        next_cursor=cursor(rows[-1]) if has_more else None,
+        prev_cursor=cursor(rows[0]) if after is not None else None,
+    )
@@ -0,0 +1,223 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Optional, Union
+from uuid import UUID
+from loguru import logger
+from sqlmodel import update
+from config import settings
+from database import get_async_session
+from models.conversation import Conversation
+from models.message import Message
+from metrics import persistence_failed_rows_total
+from services.cache import state_cache
+
+
+class PersistenceFailed(Exception):
+    """Raised by flush() when rows queued before it could not be written."""
+
+
+@dataclass
+class StateUpdate:
+    conversation_id: UUID
+    state: dict
+
+
+@dataclass
+class Barrier:
+    future: asyncio.Future
+    # answers for the rows of this conversation only, for every row when None
+    conversation_id: Optional[UUID] = None
+
+
+QueueItem = Union[Message, StateUpdate, Barrier]
+
+
+class PersistenceQueue:
+    """
+    Write-behind queue for rows produced while a response is streaming.
+
+    Items are written by a single background task, everything that is queued
+    when the task wakes up is committed in one transaction. The queue is
+    bounded, producers wait when the writer falls behind.
+
+    A batch that fails is retried, then written row by row so one bad row
+    does not take the others with it. Rows that still fail are dropped and
+    the next flush of their conversation raises PersistenceFailed, other
+    conversations' flushes are not affected.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1000,
+        batch_size: int = 100,
+        retries: int = 1,
+        retry_delay: float = 0.5,
+    ) -> None:
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._queue: Optional[asyncio.Queue[QueueItem]] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # rows dropped since the last flush that answered for them
+        self._failures: dict[UUID, int] = {}
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._worker is not None and not self._worker.done() and self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._worker = loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is None:
+            return
+        try:
+            await self.flush()
+        except PersistenceFailed:
+            # already logged by the writer, shutdown goes on
+            pass
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        self._queue = None
+
+    async def put(self, item: QueueItem) -> None:
+        self.start()
+        await self._queue.put(item)
+
+    async def put_message(
+        self,
+        role: str,
+        content: str,
+        conversation_id: UUID,
+        agent: Optional[str] = None,
+        file_id: Optional[UUID] = None,
+        think: Optional[str] = None,
+        tool_items: Optional[list[dict]] = None,
+        truncated: bool = False,
+    ) -> Message:
+        message = Message(
+            role=role,
+            content=content,
+            conversation_id=conversation_id,
+            agent=agent,
+            file_id=file_id,
+            think=think,
+            tool_items=tool_items,
+            truncated=truncated,
+        )
+        await self.put(message)
+        return message
+
+    async def put_state(self, conversation_id: UUID, state: dict) -> None:
+        await self.put(StateUpdate(conversation_id=conversation_id, state=state))
+
+    async def flush(self, conversation_id: Optional[UUID] = None) -> None:
+        """
+        Wait until everything queued before this call has been written.
+
+        Raises PersistenceFailed when rows of `conversation_id`, or of any
+        conversation without one, could not be.
+        """
+        if self._worker is None or self._worker.done():
+            return
+        barrier = Barrier(
+            future=self._loop.create_future(), conversation_id=conversation_id
+        )
+        await self.put(barrier)
+        await barrier.future
+
+    @property
+    def size(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _run(self) -> None:
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            failed = set()
+            try:
+                failed = {id(item) for item in await self._write_batch(batch)}
+            finally:
+                for item in batch:
+                    if id(item) in failed:
+                        self._failures[item.conversation_id] = (
+                            self._failures.get(item.conversation_id, 0) + 1
+                        )
+                    elif isinstance(item, Barrier) and not item.future.done():
+                        self._release(item)
+                    queue.task_done()
+
+    def _release(self, barrier: Barrier) -> None:
+        """A barrier fails with the rows of its conversation queued before it."""
+        if barrier.conversation_id is None:
+            failures = sum(self._failures.values())
+            self._failures.clear()
+        else:
+            failures = self._failures.pop(barrier.conversation_id, 0)
+        if failures:
+            barrier.future.set_exception(
+                PersistenceFailed(f"{failures} queued rows not written")
+            )
+        else:
+            barrier.future.set_result(None)
+
+    async def _write_batch(self, batch: list[QueueItem]) -> list[QueueItem]:
+        """Write `batch`, returns the items that could not be written."""
+        for attempt in range(self.retries + 1):
+            try:
+                await self._write(batch)
+                return []
+            except Exception:
+                logger.exception(
+                    f"failed to persist {len(batch)} queued rows, attempt {attempt + 1}"
+                )
+            await asyncio.sleep(self.retry_delay)
+        failed = []
+        for item in batch:
+            if isinstance(item, Barrier):
+                continue
+            try:
+                await self._write([item])
+            except Exception:
+                logger.exception(f"dropping queued row {item!r}")
+                persistence_failed_rows_total.inc()
+                failed.append(item)
+        return failed
+
+    @staticmethod
+    async def _write(batch: list[QueueItem]) -> None:
+        messages = [item for item in batch if isinstance(item, Message)]
+        # only the last state of a conversation in the batch matters
+        states = {
+            item.conversation_id: item.state
+            for item in batch
+            if isinstance(item, StateUpdate)
+        }
+        if not messages and not states:
+            return
+        async with get_async_session() as session:
+            session.add_all(messages)
+            for conversation_id, state in states.items():
+                await session.exec(
+                    update(Conversation)
+                    .where(Conversation.id == conversation_id)
+                    .values(state=state)
+                )
+            await session.commit()
+        for conversation_id, state in states.items():
+            state_cache.set(conversation_id, state)
+
+
+persistence_queue = PersistenceQueue(
+    maxsize=settings.PERSISTENCE_QUEUE_SIZE,
+    batch_size=settings.PERSISTENCE_BATCH_SIZE,
+)
@@ -0,0 +1,106 @@
+from typing import Optional
+from uuid import UUID
+from sqlalchemy import bindparam, text
+from database import get_async_session
+from models.message import Message
+from models.search import can_use_fts, to_fts5_query
+
+HIGHLIGHT_OPEN = "<mark>"
+HIGHLIGHT_CLOSE = "</mark>"
+
+SQLITE_MESSAGE_SEARCH = """
+SELECT m.id, m.conversation_id, m.role, m.created_at,
+    snippet(message_fts, 0, :open, :close, '…', 24) AS highlight,
+    bm25(message_fts) AS rank
+FROM message_fts JOIN message m ON m.search_rowid = message_fts.rowid
+WHERE message_fts MATCH :q AND m.is_deleted = 0 {conversation_filter}
+ORDER BY rank
+LIMIT :limit
+"""
+
+POSTGRESQL_MESSAGE_SEARCH = """
+SELECT m.id, m.conversation_id, m.role, m.created_at,
+    ts_headline('simple', m.content, query,
+        'StartSel=' || :open || ', StopSel=' || :close || ', MaxFragments=2'
+    ) AS highlight,
+    -ts_rank(m.search_vector, query) AS rank
+FROM message m, websearch_to_tsquery('simple', :q) query
+WHERE m.search_vector @@ query AND m.is_deleted = false {conversation_filter}
+ORDER BY rank
+LIMIT :limit
+"""
+
+LIKE_MESSAGE_SEARCH = """
+SELECT m.id, m.conversation_id, m.role, m.created_at, m.content AS highlight,
+    0 AS rank
+FROM message m
+WHERE m.content LIKE '%' || :q || '%' AND m.is_deleted = false {conversation_filter}
+ORDER BY m.created_at DESC
+LIMIT :limit
+"""
+
+
+def _highlight_like(content: str, q: str) -> str:
+    start = content.lower().find(q.lower())
+    if start < 0:
+        return content
+    end = start + len(q)
+    return (
+        content[:start]
+        + HIGHLIGHT_OPEN
+        + content[start:end]
+        + HIGHLIGHT_CLOSE
+        + content[end:]
+    )
+
+
+class SearchService:
+    @classmethod
+    async def search_messages(
+        cls,
+        q: str,
+        conversation_id: Optional[UUID] = None,
+        limit: int = 20,
+    ) -> list[dict]:
+        """Ranked message hits, best first, with the matches highlighted."""
+        if not q.strip():
+            return []
+        async with get_async_session() as session:
+            dialect = session.bind.dialect.name
+            use_like = False
+            if dialect == "sqlite" and can_use_fts(q):
+                query, value = SQLITE_MESSAGE_SEARCH, to_fts5_query(q)
+            elif dialect == "postgresql":
+                query, value = POSTGRESQL_MESSAGE_SEARCH, q
+            else:
+                # short terms can not use the trigram index
+                query, value, use_like = LIKE_MESSAGE_SEARCH, q, True
+            conversation_filter = ""
+            if conversation_id is not None:
+                conversation_filter = "AND m.conversation_id = :conversation_id"
+            stmt = text(query.format(conversation_filter=conversation_filter))
+            params = {
+                "q": value,
+                "limit": limit,
+                "open": HIGHLIGHT_OPEN,
+                "close": HIGHLIGHT_CLOSE,
+            }
+            if conversation_id is not None:
+                stmt = stmt.bindparams(
+                    bindparam("conversation_id", type_=Message.conversation_id.type)
+                )
+                params["conversation_id"] = conversation_id
+            rows = (await session.exec(stmt, params=params)).all()
+        return [
+            {
+                "message_id": str(UUID(str(row.id))),
+                "conversation_id": str(UUID(str(row.conversation_id))),
+                "role": row.role,
+                "created_at": row.created_at,
+                "rank": -float(row.rank),
+                "highlight": _highlight_like(row.highlight, q)
+                if use_like
+                else row.highlight,
+            }
+            for row in rows
+        ]
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+import anyio
+from config import settings
+
+
+class FileTooLarge(ValueError):
+    pass
+
+
+@dataclass
+class StoredFile:
+    path: str
+    size: int
+    sha256: str
+
+
+def _write_chunk(f, hasher, data: bytes) -> None:
+    # hashlib drops the GIL for large buffers, so both run off the event loop
+    hasher.update(data)
+    f.write(data)
+
+
+class FileStorage:
+    """
+    Content-addressed files on local disk.
+
+    Bodies are written in `chunk_size` blocks as they arrive and hashed on the
+    way, so an upload never sits in memory as a whole. `save` leaves the body
+    in a temporary file, `place` moves it to `<root>/ab/cd/<sha256>` unless
+    that blob exists already. Reference counting lives in BlobService.
+    """
+
+    def __init__(self, root: str, chunk_size: int = 1024 * 1024) -> None:
+        self.root = root
+        self.chunk_size = chunk_size
+
+    @property
+    def tmp_dir(self) -> str:
+        return os.path.join(self.root, "tmp")
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    async def save(
+        self,
+        chunks: AsyncIterator[bytes],
+        max_size: Optional[int] = None,
+    ) -> StoredFile:
+        await anyio.to_thread.run_sync(lambda: os.makedirs(self.tmp_dir, exist_ok=True))
+        tmp_path = os.path.join(self.tmp_dir, f"{uuid.uuid4().hex}.part")
+        hasher = hashlib.sha256()
+        size = 0
+        buffer = bytearray()
+        f = await anyio.to_thread.run_sync(open, tmp_path, "wb")
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise FileTooLarge(f"file is larger than {max_size} bytes")
+                buffer += chunk
+                while len(buffer) >= self.chunk_size:
+                    data = bytes(buffer[: self.chunk_size])
+                    del buffer[: self.chunk_size]
+                    await anyio.to_thread.run_sync(_write_chunk, f, hasher, data)
+            if buffer:
+                await anyio.to_thread.run_sync(_write_chunk, f, hasher, bytes(buffer))
+            await anyio.to_thread.run_sync(f.close)
+        except BaseException:
+            with anyio.CancelScope(shield=True):
+                await anyio.to_thread.run_sync(f.close)
+                await self.remove(tmp_path)
+            raise
+        return StoredFile(path=tmp_path, size=size, sha256=hasher.hexdigest())
+
+    async def place(self, stored: StoredFile) -> str:
+        """Move a saved body to its blob path, dropping it if the blob exists."""
+        path = self.blob_path(stored.sha256)
+        await anyio.to_thread.run_sync(_place, stored.path, path)
+        return path
+
+    async def remove(self, path: str) -> None:
+        await anyio.to_thread.run_sync(_remove, path)
+
+    async def exists(self, path: str) -> bool:
+        return await anyio.to_thread.run_sync(os.path.isfile, path)
+
+
+def _place(tmp_path: str, path: str) -> None:
+    if os.path.isfile(path):
+        _remove(tmp_path)
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(tmp_path, path)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+storage = FileStorage(settings.FILE_STORAGE_DIR, chunk_size=settings.FILE_CHUNK_SIZE)
@@ -1,6 +1,8 @@
 # test/conftest.py
 import pytest
 from sqlmodel import create_engine, SQLModel
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
 
 
 @pytest.fixture()
@@ -15,3 +17,22 @@ def test_engine():
 @pytest.fixture()
 def patch_engine(monkeypatch, test_engine):
     monkeypatch.setattr("database.engine", test_engine)
+
+
+@pytest.fixture()
+async def test_async_engine():
+    # StaticPool keeps a single connection so the in-memory db survives
+    engine = create_async_engine(
+        "sqlite+aiosqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture()
+def patch_async_engine(monkeypatch, test_async_engine):
+    monkeypatch.setattr("database.async_engine", test_async_engine)
@@ -0,0 +1,177 @@
+import asyncio
+from _agents.adapter import StreamEventAdapter
+from _agents.runs import RunLog, RunRegistry
+from agents import Agent, MessageOutputItem, RawResponsesStreamEvent, RunItemStreamEvent
+from openai.types.responses import (
+    ResponseOutputMessage,
+    ResponseOutputText,
+    ResponseTextDeltaEvent,
+)
+from _agents.events import (
+    AgentChangedEvent,
+    MessageDeltaEvent,
+    NewMessageEvent,
+    ThinkDeltaEvent,
+)
+from metrics import chat_cancelled_tokens_total, chat_cancelled_total
+
+
+class FakeRun:
+    """Streams queued events until cancelled, like `RunResultStreaming`."""
+
+    def __init__(self, *events) -> None:
+        self.queue: asyncio.Queue = asyncio.Queue()
+        for event in events:
+            self.queue.put_nowait(event)
+        self.cancels = 0
+
+    def cancel(self) -> None:
+        self.cancels += 1
+        self.queue.put_nowait(None)
+
+    async def stream_events(self):
+        while (event := await self.queue.get()) is not None:
+            yield event
+
+
+def partial_answer() -> FakeRun:
+    return FakeRun(
+        AgentChangedEvent(current_agent="Triage Agent"),
+        NewMessageEvent(content="first", think=None, agent="Triage Agent"),
+        ThinkDeltaEvent(delta="hmm"),
+        MessageDeltaEvent(delta="Par"),
+        MessageDeltaEvent(delta="tial"),
+    )
+
+
+def start_run(adapter: StreamEventAdapter, registry: RunRegistry) -> RunLog:
+    """Adapter events into a run log, like `/chat/streaming`."""
+    run = registry.create(on_cancel=adapter.cancel)
+
+    async def produce():
+        async for event in adapter.events():
+            run.append(event)
+        registry.finish(run)
+
+    run.task = asyncio.create_task(produce())
+    return run
+
+
+async def test_disconnect_cancels_run():
+    model = partial_answer()
+    disconnected = asyncio.Event()
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    adapter = StreamEventAdapter(model.stream_events(), on_cancel=model.cancel)
+    registry = RunRegistry(resume_timeout=0, ttl=0)
+    run = start_run(adapter, registry)
+    cancelled = chat_cancelled_total.get(reason="disconnect")
+    wasted = chat_cancelled_tokens_total.get(kind="wasted")
+
+    events = []
+    async for _, event in registry.stream(run, receive=receive):
+        events.append(event)
+        if len(events) == 5:
+            # the run is waiting for the model when the client goes away
+            disconnected.set()
+    await run.task
+
+    assert model.cancels == 1
+    assert adapter.cancelled and not adapter.completed
+    assert chat_cancelled_total.get(reason="disconnect") == cancelled + 1
+    assert chat_cancelled_tokens_total.get(kind="wasted") > wasted
+    partial = adapter.partial_message("Other Agent")
+    assert partial.content == "Partial"
+    assert partial.think == "hmm"
+    assert partial.agent == "Triage Agent"
+
+
+async def test_closing_stream_cancels_run():
+    model = partial_answer()
+    adapter = StreamEventAdapter(model.stream_events(), on_cancel=model.cancel)
+    registry = RunRegistry(resume_timeout=0, ttl=0)
+    run = start_run(adapter, registry)
+    stream = registry.stream(run)
+    await stream.__anext__()
+    await stream.aclose()
+    await run.task
+    assert model.cancels == 1
+    adapter.cancel()
+    assert model.cancels == 1
+
+
+async def test_completed_run_is_not_cancelled():
+    model = FakeRun(
+        ThinkDeltaEvent(delta="still"),
+        ThinkDeltaEvent(delta=" thinking"),
+        None,
+    )
+    adapter = StreamEventAdapter(model.stream_events(), on_cancel=model.cancel)
+    registry = RunRegistry(resume_timeout=0, ttl=0)
+    run = start_run(adapter, registry)
+    async for _ in registry.stream(run):
+        pass
+    await run.task
+    adapter.cancel()
+    assert adapter.completed and not adapter.cancelled
+    assert model.cancels == 0
+    partial = adapter.partial_message("Triage Agent")
+    assert partial.content == ""
+    assert partial.think == "still thinking"
+
+
+def text_delta(delta: str) -> RawResponsesStreamEvent:
+    return RawResponsesStreamEvent(
+        data=ResponseTextDeltaEvent(
+            type="response.output_text.delta",
+            item_id="m",
+            output_index=0,
+            content_index=0,
+            delta=delta,
+            sequence_number=0,
+            logprobs=[],
+        )
+    )
+
+
+def message_output(text: str) -> RunItemStreamEvent:
+    raw_item = ResponseOutputMessage(
+        id="m",
+        type="message",
+        role="assistant",
+        status="completed",
+        content=[ResponseOutputText(type="output_text", text=text, annotations=[])],
+    )
+    return RunItemStreamEvent(
+        name="message_output_created",
+        item=MessageOutputItem(agent=Agent(name="Triage Agent"), raw_item=raw_item),
+    )
+
+
+async def test_think_is_split_from_streamed_text():
+    text = "<think>let me see</think>Hello"
+    run = FakeRun(
+        *(text_delta(text[i : i + 3]) for i in range(0, len(text), 3)),
+        message_output(text),
+        None,
+    )
+    adapter = StreamEventAdapter(run.stream_events())
+    events = [event async for event in adapter.events()]
+
+    thinking = [e.delta for e in events if isinstance(e, ThinkDeltaEvent)]
+    answer = [e.delta for e in events if isinstance(e, MessageDeltaEvent)]
+    assert "".join(thinking) == "let me see"
+    assert "".join(answer) == "Hello"
+    message = events[-1]
+    assert isinstance(message, NewMessageEvent)
+    assert (message.content, message.think) == ("Hello", "let me see")
+
+
+async def test_message_without_deltas_is_split():
+    run = FakeRun(message_output("<think>hmm</think>Hi"), None)
+    adapter = StreamEventAdapter(run.stream_events())
+    [message] = [event async for event in adapter.events()]
+    assert (message.content, message.think) == ("Hi", "hmm")
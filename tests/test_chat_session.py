@@ -0,0 +1,137 @@
+import asyncio
+from uuid import uuid4
+from agents import Agent
+from _agents.context import AgentContext, ConversationState
+from _agents.events import MessageDeltaEvent, RunEndedEvent
+from _agents.runs import RunLog, run_registry
+from _agents.scheduler import scheduler
+from api.chat import ChatSession, _start_run
+from models.message import Message
+from schemas.chat import ChatTurn
+
+
+class FakeWebSocket:
+    def __init__(self) -> None:
+        self.sent: list[dict] = []
+
+    async def send_json(self, data: dict) -> None:
+        self.sent.append(data)
+
+
+def make_session() -> tuple[ChatSession, FakeWebSocket]:
+    websocket = FakeWebSocket()
+    state = ConversationState(context=AgentContext(), current_agent=None)
+    return ChatSession(websocket, uuid4(), state, history=[]), websocket
+
+
+async def test_rejects_unknown_and_invalid_messages():
+    session, websocket = make_session()
+    await session.handle({"type": "bogus"})
+    await session.handle([1, 2])
+    await session.handle({"type": "message"})
+    assert [m["status"] for m in websocket.sent] == [400, 400, 422]
+
+
+async def test_one_turn_at_a_time():
+    session, websocket = make_session()
+    session._turn = asyncio.create_task(asyncio.sleep(1))
+    await session.handle({"type": "message", "message": "hi"})
+    assert websocket.sent == [
+        {"type": "error", "status": 409, "data": "A turn is already running"}
+    ]
+    await session.close()
+    assert session._turn.cancelled()
+
+
+async def test_cancel_without_turn_is_ignored():
+    session, websocket = make_session()
+    await session.handle({"type": "cancel"})
+    assert websocket.sent == []
+
+
+async def test_failed_prepare_answers_with_an_error(monkeypatch):
+    async def put_message(**fields):
+        raise RuntimeError("database is gone")
+
+    monkeypatch.setattr("api.chat.persistence_queue.put_message", put_message)
+    session, websocket = make_session()
+    await session._run_turn(ChatTurn(message="hi"))
+    assert websocket.sent == [
+        {"type": "error", "status": 500, "data": "Internal server error"}
+    ]
+    assert scheduler.running == 0
+
+
+class FakeAdapter:
+    cancelled = False
+    reason = None
+
+    def cancel(self, reason: str = "disconnect") -> None:
+        self.cancelled, self.reason = True, reason
+
+
+async def test_cancel_while_preparing_stops_the_run(monkeypatch):
+    preparing, proceed = asyncio.Event(), asyncio.Event()
+    adapter = FakeAdapter()
+
+    async def put_message(**fields):
+        preparing.set()
+        await proceed.wait()
+        return Message(**fields)
+
+    def start_run(conversation_id, state, agent, history, slot, *args, **kwargs):
+        slot.release()
+        run = RunLog("run", buffer_size=10)
+        run.close()
+        return run, adapter
+
+    monkeypatch.setattr("api.chat.persistence_queue.put_message", put_message)
+    monkeypatch.setattr("api.chat._start_run", start_run)
+    session, websocket = make_session()
+    await session.handle({"type": "message", "message": "hi"})
+    await preparing.wait()
+    await session.handle({"type": "cancel"})
+    proceed.set()
+    await session._turn
+    assert adapter.reason == "client"
+    assert websocket.sent[-1] == {
+        "type": "done",
+        "run_id": "run",
+        "cancelled": True,
+        "saved": True,
+    }
+
+
+class FailingRun:
+    def __init__(self) -> None:
+        self.cancels = 0
+
+    def cancel(self) -> None:
+        self.cancels += 1
+
+    async def stream_events(self):
+        raise RuntimeError("model is gone")
+        yield
+
+
+async def test_failed_run_ends_with_the_error(monkeypatch):
+    monkeypatch.setattr(
+        "api.chat.Runner.run_streamed", lambda *args, **kwargs: FailingRun()
+    )
+    ended = []
+    slot = await scheduler.acquire("model")
+    run, _ = _start_run(
+        uuid4(),
+        ConversationState(context=AgentContext(), current_agent=None),
+        Agent(name="Triage Agent"),
+        [],
+        slot,
+        "hi",
+        on_end=ended.append,
+    )
+    events = [event async for _, event in run_registry.stream(run)]
+    assert not any(isinstance(e, MessageDeltaEvent) for e in events)
+    assert events[-1] == ended[0]
+    assert isinstance(ended[0], RunEndedEvent)
+    assert (ended[0].saved, ended[0].error) == (False, "RuntimeError")
+    assert scheduler.running == 0
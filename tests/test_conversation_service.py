@@ -1,5 +1,6 @@
 import pytest
-from services.conversation import ConversationService
+from services.conversation import ConversationService, AsyncConversationService
+from services.cache import state_cache
 
 
 @pytest.fixture
@@ -39,3 +40,97 @@ def test_update_conversation(test_conversation, name, expected_name):
 def test_delete_conversation(test_conversation):
     ConversationService.delete_conversation(test_conversation.id)
     assert ConversationService.get_conversation(test_conversation.id) == None
+
+
+@pytest.fixture
+async def async_test_conversation(patch_async_engine):
+    return await AsyncConversationService.create_conversation(
+        "test_conversation", {"file_id": "1234"}
+    )
+
+
+async def test_async_get_conversations(patch_async_engine):
+    for i in range(10):
+        await AsyncConversationService.create_conversation(f"Name-{i}", {})
+    conversations = await AsyncConversationService.get_conversations(per_page=5)
+    assert len(conversations) == 5
+    assert await AsyncConversationService.get_conversations_count() == 10
+
+
+async def test_async_update_conversation(async_test_conversation):
+    conversation = await AsyncConversationService.update_conversation(
+        async_test_conversation.id, "updated_name"
+    )
+    assert conversation.name == "updated_name"
+    assert conversation.state == {"file_id": "1234"}
+
+
+async def test_async_delete_conversation(async_test_conversation):
+    await AsyncConversationService.delete_conversation(async_test_conversation.id)
+    assert (
+        await AsyncConversationService.get_conversation(async_test_conversation.id)
+        is None
+    )
+
+
+def test_get_conversations_page_walks_both_directions(test_conversations):
+    first = ConversationService.get_conversations_page(sort_field="updated_at", limit=4)
+    assert [c.name for c in first.items] == ["Name-9", "Name-8", "Name-7", "Name-6"]
+    assert first.prev_cursor is None
+
+    second = ConversationService.get_conversations_page(
+        sort_field="updated_at", after=first.next_cursor, limit=4
+    )
+    assert [c.name for c in second.items] == ["Name-5", "Name-4", "Name-3", "Name-2"]
+
+    last = ConversationService.get_conversations_page(
+        sort_field="updated_at", after=second.next_cursor, limit=4
+    )
+    assert [c.name for c in last.items] == ["Name-1", "Name-0"]
+    assert last.next_cursor is None
+
+    back = ConversationService.get_conversations_page(
+        sort_field="updated_at", before=last.prev_cursor, limit=4
+    )
+    assert [c.name for c in back.items] == [c.name for c in second.items]
+
+
+def test_get_conversations_page_rejects_bad_cursor(test_conversations):
+    with pytest.raises(ValueError):
+        ConversationService.get_conversations_page(after="not-a-cursor")
+
+
+async def test_async_cached_count(patch_async_engine):
+    await AsyncConversationService.create_conversation("a", {})
+    assert await AsyncConversationService.get_conversations_count(cached=True) == 1
+    await AsyncConversationService.create_conversation("b", {})
+    assert await AsyncConversationService.get_conversations_count(cached=True) == 2
+
+
+def test_update_conversation_state(test_conversation):
+    conversation = ConversationService.update_conversation_state(
+        test_conversation.id, {"current_agent": "a"}
+    )
+    assert conversation.state == {"current_agent": "a"}
+    assert conversation.name == "test_conversation"
+    assert state_cache.get(test_conversation.id) == {"current_agent": "a"}
+
+
+async def test_async_state_cache(async_test_conversation):
+    conversation_id = async_test_conversation.id
+    state_cache.clear()
+    assert await AsyncConversationService.get_state(conversation_id) == {
+        "file_id": "1234"
+    }
+    assert state_cache.get(conversation_id) == {"file_id": "1234"}
+
+    await AsyncConversationService.update_conversation_state(
+        conversation_id, {"current_agent": "b"}
+    )
+    assert await AsyncConversationService.get_state(conversation_id) == {
+        "current_agent": "b"
+    }
+
+    await AsyncConversationService.delete_conversation(conversation_id)
+    assert state_cache.get(conversation_id) is None
+    assert await AsyncConversationService.get_state(conversation_id) is None
@@ -0,0 +1,70 @@
+import pytest
+from sqlalchemy import create_engine, text
+from config import settings
+from database import (
+    TimedQueuePool,
+    configure_engine,
+    get_async_database_url,
+    get_engine_options,
+    is_memory_database,
+)
+from metrics import db_pool_checkout_seconds
+
+
+def test_sqlite_connections_get_pragmas(tmp_path):
+    engine = configure_engine(create_engine(f"sqlite:///{tmp_path}/db.sqlite"))
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        # NORMAL
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1
+        assert conn.execute(text("PRAGMA cache_size")).scalar() == -64000
+    engine.dispose()
+
+
+def test_unknown_pragma_value_is_rejected(monkeypatch):
+    monkeypatch.setattr(settings, "SQLITE_SYNCHRONOUS", "normal; DROP TABLE x")
+    with pytest.raises(ValueError):
+        configure_engine(create_engine("sqlite://"))
+
+
+def test_pool_options_skip_memory_databases():
+    assert is_memory_database("sqlite://")
+    assert is_memory_database("sqlite+aiosqlite:///:memory:")
+    assert not is_memory_database("sqlite:///data.db")
+    options = get_engine_options("sqlite:///:memory:")
+    assert "pool_size" not in options
+    assert options["echo"] is False
+    options = get_engine_options("postgresql://localhost/app")
+    assert options["pool_size"] == 5
+    assert options["max_overflow"] == 10
+    assert options["pool_timeout"] == 30
+    assert options["poolclass"] is TimedQueuePool
+
+
+def test_pool_checkouts_are_timed(tmp_path):
+    url = f"sqlite:///{tmp_path}/db.sqlite"
+    engine = create_engine(url, **get_engine_options(url))
+    before = db_pool_checkout_seconds.count(kind="sync")
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        assert engine.pool.checkedout() == 1
+    assert db_pool_checkout_seconds.count(kind="sync") == before + 1
+    engine.dispose()
+
+
+def test_async_database_url():
+    assert get_async_database_url("sqlite:///a.db") == "sqlite+aiosqlite:///a.db"
+    assert (
+        get_async_database_url("postgresql+psycopg2://u@h/db")
+        == "postgresql+asyncpg://u@h/db"
+    )
+    assert (
+        get_async_database_url("postgresql://u@h/db") == "postgresql+asyncpg://u@h/db"
+    )
+    assert (
+        get_async_database_url("postgresql+psycopg://u@h/db")
+        == "postgresql+psycopg://u@h/db"
+    )
+    with pytest.raises(ValueError):
+        get_async_database_url("mysql+pymysql://u@h/db")
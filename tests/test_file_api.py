@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import os
+import httpx
+import pytest
+from fastapi import FastAPI
+from database import get_async_session
+from api.file import router
+from services.blob import AsyncBlobService
+from services.storage import FileTooLarge, storage as file_storage
+
+DATA = bytes(range(256)) * 40
+SHA256 = hashlib.sha256(DATA).hexdigest()
+
+
+@pytest.fixture
+def storage(monkeypatch, tmp_path):
+    monkeypatch.setattr(file_storage, "root", str(tmp_path / "files"))
+    monkeypatch.setattr(file_storage, "chunk_size", 1000)
+    return file_storage
+
+
+@pytest.fixture
+async def client(patch_async_engine, storage):
+    app = FastAPI()
+    app.include_router(router)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        yield c
+
+
+async def body(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i : i + size]
+
+
+async def test_save_hashes_while_writing(storage):
+    stored = await storage.save(body(DATA, 333))
+    assert stored.size == len(DATA)
+    assert stored.sha256 == SHA256
+    with open(stored.path, "rb") as f:
+        assert f.read() == DATA
+
+    path = await storage.place(stored)
+    assert path.endswith(f"{SHA256[:2]}/{SHA256[2:4]}/{SHA256}")
+
+
+async def test_save_rejects_large_body(storage, tmp_path):
+    with pytest.raises(FileTooLarge):
+        await storage.save(body(DATA, 333), max_size=1000)
+    assert list((tmp_path / "files" / "tmp").iterdir()) == []
+
+
+async def test_upload_and_download(client):
+    r = await client.post(
+        "/file/upload",
+        params={"name": "../data.bin"},
+        content=body(DATA, 777),
+        headers={"content-type": "application/pdf"},
+    )
+    assert r.status_code == 200
+    file = r.json()
+    assert file["name"] == "data.bin"
+    assert file["size"] == len(DATA)
+    assert file["content_type"] == "application/pdf"
+    assert file["sha256"] == SHA256
+
+    r = await client.get(f"/file/{file['id']}/download")
+    assert r.content == DATA
+    assert r.headers["etag"] == f'"{file["sha256"]}"'
+    assert r.headers["accept-ranges"] == "bytes"
+
+    r = await client.get(
+        f"/file/{file['id']}/download", headers={"range": "bytes=100-199"}
+    )
+    assert r.status_code == 206
+    assert r.content == DATA[100:200]
+    assert r.headers["content-range"] == f"bytes 100-199/{len(DATA)}"
+
+    r = await client.get(
+        f"/file/{file['id']}/download", headers={"range": f"bytes={len(DATA)}-"}
+    )
+    assert r.status_code == 416
+
+
+async def upload(client, data: bytes = DATA, **params) -> dict:
+    r = await client.post(
+        "/file/upload", params={"name": "data.bin", **params}, content=data
+    )
+    assert r.status_code == 200
+    return r.json()
+
+
+async def test_repeat_upload_shares_blob(client, storage):
+    first = await upload(client)
+    second = await upload(client)
+    assert first["id"] != second["id"]
+    blob = await AsyncBlobService.get_blob(SHA256)
+    assert blob.refcount == 2
+    assert blob.path == storage.blob_path(SHA256)
+    assert os.listdir(storage.tmp_dir) == []
+
+    # the hash alone is enough once the content is stored
+    third = await upload(client, data=b"", sha256=SHA256)
+    assert third["size"] == len(DATA)
+    assert (await AsyncBlobService.get_blob(SHA256)).refcount == 3
+
+    r = await client.get(f"/file/{third['id']}/download")
+    assert r.content == DATA
+
+
+async def test_unknown_hash_reads_body(client):
+    file = await upload(client, sha256=SHA256)
+    assert file["sha256"] == SHA256
+
+
+async def test_soft_delete_and_collect_garbage(client, storage):
+    first = await upload(client)
+    second = await upload(client)
+
+    r = await client.delete(f"/file/{first['id']}")
+    assert r.status_code == 200
+    assert (await client.get(f"/file/{first['id']}")).status_code == 404
+    assert (await client.delete(f"/file/{first['id']}")).status_code == 404
+    assert (await AsyncBlobService.get_blob(SHA256)).refcount == 1
+
+    assert await AsyncBlobService.collect_garbage() == 0
+    await client.delete(f"/file/{second['id']}")
+    assert await AsyncBlobService.collect_garbage(grace=60) == 0
+    assert await AsyncBlobService.collect_garbage() == 1
+    assert await AsyncBlobService.get_blob(SHA256) is None
+    assert not os.path.exists(storage.blob_path(SHA256))
+
+    # uploading the content again brings the blob back
+    file = await upload(client)
+    r = await client.get(f"/file/{file['id']}/download")
+    assert r.content == DATA
+
+
+async def test_download_missing_file(client):
+    r = await client.get("/file/00000000-0000-0000-0000-000000000000/download")
+    assert r.status_code == 404
+
+
+async def test_concurrent_first_uploads_share_the_blob(patch_async_engine, storage):
+    # the sessions share the in-memory database's one connection, so nothing
+    # serializes them: both look for the blob before either has written it
+    async def upload():
+        stored = await storage.save(body(DATA, 500))
+        async with get_async_session() as session:
+            await AsyncBlobService.acquire(session, stored)
+            await asyncio.sleep(0.01)
+            await session.commit()
+
+    await asyncio.gather(upload(), upload(), upload())
+    assert (await AsyncBlobService.get_blob(SHA256)).refcount == 3
+
+
+async def test_rolled_back_upload_leaves_no_blob_file(patch_async_engine, storage):
+    stored = await storage.save(body(DATA, 500))
+    async with get_async_session() as session:
+        await AsyncBlobService.acquire(session, stored)
+        await session.rollback()
+    assert await AsyncBlobService.get_blob(SHA256) is None
+    assert not os.path.exists(storage.blob_path(SHA256))
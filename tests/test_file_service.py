@@ -1,5 +1,7 @@
 import pytest
-from services.file import FileService
+from sqlmodel import Session
+from models.blob import Blob
+from services.file import FileService, AsyncFileService
 
 
 @pytest.fixture
@@ -41,3 +43,45 @@ def test_update_file(test_file, name, expected_name):
 def test_delete_file(test_file):
     FileService.delete_file(test_file.id)
     assert FileService.get_file(test_file.id) == None
+
+
+async def test_async_get_files_by_file_ids(patch_async_engine):
+    file = await AsyncFileService.create_file(
+        "test_file", path="test.pdf", size=10, content_type="application/pdf"
+    )
+    other = await AsyncFileService.create_file(
+        "other_file", path="other.pdf", size=10, content_type="application/pdf"
+    )
+    files = await AsyncFileService.get_files_by_file_ids([file.id])
+    assert [f.id for f in files] == [file.id]
+    await AsyncFileService.delete_file(other.id)
+    assert await AsyncFileService.get_file(other.id) is None
+
+
+def test_get_files_page(test_files):
+    page = FileService.get_files_page(limit=5)
+    assert len(page.items) == 5
+    rest = FileService.get_files_page(after=page.next_cursor, limit=5)
+    assert len(rest.items) == 5
+    assert {f.id for f in page.items}.isdisjoint(f.id for f in rest.items)
+
+
+def test_soft_delete_file_releases_blob(test_engine, patch_engine):
+    with Session(test_engine) as session:
+        session.add(Blob(sha256="ab" * 32, path="blob", size=10, refcount=2))
+        session.commit()
+    file = FileService.create_file(
+        "blob_file", path="blob", size=10, content_type="text/plain", sha256="ab" * 32
+    )
+    legacy = FileService.create_file(
+        "legacy_file", path="own", size=10, content_type="text/plain", sha256="ab" * 32
+    )
+
+    FileService.soft_delete_file(file.id)
+    FileService.soft_delete_file(legacy.id)
+    with pytest.raises(ValueError):
+        FileService.soft_delete_file(file.id)
+
+    assert FileService.get_file(file.id).is_deleted
+    with Session(test_engine) as session:
+        assert session.get(Blob, "ab" * 32).refcount == 1
@@ -0,0 +1,142 @@
+import pytest
+from _agents import history
+from _agents.events import ToolCalledEvent, ToolCallOutputEvent
+from _agents.history import (
+    fits_window,
+    get_tool_items,
+    load_window,
+    load_history,
+    refresh_summary,
+)
+from services.conversation import AsyncConversationService
+from services.message import AsyncMessageService
+
+
+@pytest.fixture
+async def long_conversation(patch_async_engine):
+    conversation = await AsyncConversationService.create_conversation("name", {})
+    for i in range(20):
+        await AsyncMessageService.create_message(
+            role="user" if i % 2 == 0 else "assistant",
+            content=f"message-{i:02d} " + "x" * 36,
+            conversation_id=conversation.id,
+        )
+    return conversation
+
+
+async def test_load_window_max_messages(long_conversation):
+    window, truncated = await load_window(long_conversation.id, max_messages=5)
+    assert truncated
+    assert [m.content[:10] for m in window] == [
+        f"message-{i:02d}" for i in range(15, 20)
+    ]
+
+
+async def test_load_window_token_budget(long_conversation):
+    # every message is estimated at 12 tokens
+    window, truncated = await load_window(long_conversation.id, token_budget=50)
+    assert truncated
+    assert len(window) == 4
+    assert window[-1].content.startswith("message-19")
+
+
+async def test_load_window_fits_everything(long_conversation):
+    window, truncated = await load_window(long_conversation.id, max_messages=100)
+    assert not truncated
+    assert len(window) == 20
+
+
+async def test_refresh_summary(long_conversation):
+    window, _ = await load_window(long_conversation.id, max_messages=5)
+    summarized = []
+
+    async def summarize(previous, messages):
+        summarized.extend(messages)
+        return f"{previous or ''}|{len(messages)}"
+
+    await refresh_summary(long_conversation.id, window[0], summarize=summarize)
+    await refresh_summary(long_conversation.id, window[0], summarize=summarize)
+
+    conversation = await AsyncConversationService.get_conversation(long_conversation.id)
+    assert len(summarized) == 15
+    assert conversation.summary == "|15"
+    assert conversation.updated_at == long_conversation.updated_at
+
+
+async def test_load_history_prepends_summary(long_conversation, monkeypatch):
+    monkeypatch.setattr(history.settings, "HISTORY_MAX_MESSAGES", 5)
+    monkeypatch.setattr(history, "schedule_summary_refresh", lambda *args: None)
+    await AsyncConversationService.update_summary(
+        long_conversation.id,
+        summary="earlier turns",
+        summarized_until=long_conversation.created_at,
+    )
+    items = await load_history(long_conversation.id)
+    assert len(items) == 6
+    assert items[0]["role"] == "system"
+    assert items[0]["content"].endswith("earlier turns")
+
+
+def test_fits_window(monkeypatch):
+    items = [
+        {"role": "system", "content": "summary " * 100},
+        {"role": "user", "content": "a" * 40},
+        {"type": "function_call", "call_id": "c1", "arguments": "{}"},
+        {"type": "function_call_output", "call_id": "c1", "output": "b" * 40},
+        {"role": "assistant", "content": "c" * 40},
+    ]
+    assert fits_window(items)
+    monkeypatch.setattr(history.settings, "HISTORY_MAX_MESSAGES", 2)
+    assert fits_window(items)
+    monkeypatch.setattr(history.settings, "HISTORY_MAX_MESSAGES", 1)
+    assert not fits_window(items)
+    monkeypatch.setattr(history.settings, "HISTORY_MAX_MESSAGES", None)
+    # the summary does not count against the budget
+    monkeypatch.setattr(history.settings, "HISTORY_TOKEN_BUDGET", 40)
+    assert fits_window(items)
+    monkeypatch.setattr(history.settings, "HISTORY_TOKEN_BUDGET", 20)
+    assert not fits_window(items)
+
+
+def test_get_tool_items_skips_unanswered_calls():
+    events = [
+        ToolCalledEvent(tool_name="get_context", tool_call_id="a", args="{}"),
+        ToolCalledEvent(tool_name="search_file", tool_call_id="b", args='{"q": 1}'),
+        ToolCallOutputEvent(call_id="a", output="{}"),
+    ]
+    assert get_tool_items(events) == [
+        {
+            "type": "function_call",
+            "call_id": "a",
+            "name": "get_context",
+            "arguments": "{}",
+        },
+        {"type": "function_call_output", "call_id": "a", "output": "{}"},
+    ]
+
+
+async def test_load_history_replays_tool_calls(patch_async_engine):
+    conversation = await AsyncConversationService.create_conversation("name", {})
+    tool_items = get_tool_items(
+        [
+            ToolCalledEvent(tool_name="get_context", tool_call_id="a", args="{}"),
+            ToolCallOutputEvent(call_id="a", output="{'user_id': 1}"),
+        ]
+    )
+    await AsyncMessageService.create_messages(
+        [
+            {"role": "user", "content": "hi", "conversation_id": conversation.id},
+            {
+                "role": "assistant",
+                "content": "hello",
+                "conversation_id": conversation.id,
+                "tool_items": tool_items,
+            },
+        ]
+    )
+    items = await load_history(conversation.id)
+    assert items == [
+        {"role": "user", "content": "hi"},
+        *tool_items,
+        {"role": "assistant", "content": "hello"},
+    ]
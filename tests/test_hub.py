@@ -0,0 +1,90 @@
+import asyncio
+import pytest
+from uuid import uuid4
+from _agents.events import EventsDroppedEvent, MessageDeltaEvent
+from _agents.hub import Broker, EventHub, LocalBroker, Subscription, get_broker
+
+
+def deltas(n: int) -> list[MessageDeltaEvent]:
+    return [MessageDeltaEvent(delta=str(i)) for i in range(n)]
+
+
+def drain(subscription: Subscription) -> list:
+    events = list(subscription._events)
+    subscription._events.clear()
+    return events
+
+
+async def test_every_subscriber_gets_the_events():
+    hub = EventHub()
+    conversation_id = uuid4()
+    first = await hub.subscribe(conversation_id)
+    second = await hub.subscribe(conversation_id)
+    other = await hub.subscribe(uuid4())
+    assert hub.subscriber_count == 3
+
+    reader = asyncio.create_task(anext(aiter(first)))
+    await asyncio.sleep(0)
+    for event in deltas(2):
+        await hub.publish(conversation_id, event)
+    assert (await reader).delta == "0"
+    assert [e.delta for e in drain(first)] == ["1"]
+    assert [e.delta for e in drain(second)] == ["0", "1"]
+    assert drain(other) == []
+
+    await hub.unsubscribe(first)
+    await hub.unsubscribe(second)
+    assert hub.subscriber_count == 1
+    assert [e async for e in first] == []
+
+
+async def test_slow_subscriber_is_told_how_many_events_it_missed():
+    subscription = Subscription(uuid4(), maxsize=2)
+    for event in deltas(5):
+        subscription.put(event)
+    assert [e.delta for e in drain(subscription)] == ["0", "1"]
+    assert subscription.dropped == 3
+
+    subscription.put(MessageDeltaEvent(delta="5"))
+    gap, event = drain(subscription)
+    assert isinstance(gap, EventsDroppedEvent) and gap.count == 3
+    assert event.delta == "5"
+    assert subscription.dropped == 0
+
+
+async def test_slow_subscriber_is_closed():
+    subscription = Subscription(uuid4(), maxsize=2, slow_policy="close")
+    for event in deltas(3):
+        subscription.put(event)
+    assert subscription.closed
+    assert [e async for e in subscription] == []
+
+
+async def test_broker_reaches_every_worker():
+    broker = LocalBroker()
+    workers = [EventHub(broker=broker), EventHub(broker=broker)]
+    conversation_id = uuid4()
+    subscriptions = [await hub.subscribe(conversation_id) for hub in workers]
+
+    await workers[0].publish(conversation_id, MessageDeltaEvent(delta="a"))
+    for subscription in subscriptions:
+        (event,) = drain(subscription)
+        assert isinstance(event, MessageDeltaEvent) and event.delta == "a"
+
+    for hub, subscription in zip(workers, subscriptions):
+        await hub.unsubscribe(subscription)
+    assert broker._callbacks == {}
+
+
+class PublishOnlyBroker(Broker):
+    async def publish(self, channel: str, message: bytes) -> None:
+        pass
+
+
+def test_incomplete_broker_fails_when_built():
+    assert get_broker("") is None
+    assert isinstance(get_broker("_agents.hub:LocalBroker"), LocalBroker)
+    with pytest.raises(TypeError):
+        get_broker("tests.test_hub:PublishOnlyBroker")
+    with pytest.raises(ValueError):
+        get_broker("_agents.hub:EventHub")
@@ -0,0 +1,133 @@
+import json
+import pytest
+from agents.tool_context import ToolContext
+from _agents.context import AgentContext
+from _agents.file_tools import read_file_chunks, search_file
+from services.file import AsyncFileService
+from services.ingest import AsyncFileChunkService, split_text, wait_for_ingest
+
+PARAGRAPHS = [
+    "Revenue grew in the third quarter.",
+    "The board approved the budget for the new warehouse.",
+    "Warehouse costs are expected to fall next year.",
+    "Nothing else happened.",
+]
+TEXT = "\n\n".join(p * 3 for p in PARAGRAPHS)
+
+
+def test_split_text_covers_text():
+    chunks = split_text(TEXT, size=120, overlap=20)
+    assert chunks[0][0] == 0
+    assert chunks[-1][1] == len(TEXT)
+    for (start, end), (next_start, _) in zip(chunks, chunks[1:]):
+        assert end - start <= 120
+        assert next_start < end
+    # cut at a paragraph break when there is one in the second half
+    assert TEXT[chunks[0][1] - 2 : chunks[0][1]] == "\n\n"
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr("services.ingest.settings.FILE_TEXT_CHUNK_SIZE", 120)
+    monkeypatch.setattr("services.ingest.settings.FILE_TEXT_CHUNK_OVERLAP", 0)
+
+
+@pytest.fixture
+async def text_file(patch_async_engine, small_chunks, tmp_path):
+    path = tmp_path / "report.txt"
+    path.write_text(TEXT, encoding="utf-8")
+    file = await AsyncFileService.create_file(
+        "report.txt",
+        path=str(path),
+        size=path.stat().st_size,
+        content_type="text/plain",
+        sha256="cd" * 32,
+    )
+    # chunked in the background once the file is recorded
+    await wait_for_ingest()
+    return file
+
+
+async def test_ingest_stores_chunks_with_offsets(text_file):
+    total = await AsyncFileChunkService.count_chunks(text_file.id)
+    assert total > 1
+    chunks = await AsyncFileChunkService.get_chunks(text_file.id, limit=total)
+    assert [c.seq for c in chunks] == list(range(total))
+    for chunk in chunks:
+        assert TEXT[chunk.start : chunk.end] == chunk.content
+    # ingesting again does not duplicate
+    assert await AsyncFileChunkService.ingest_file(text_file) == total
+
+
+async def test_same_content_reuses_chunks(text_file):
+    copy = await AsyncFileService.create_file(
+        "copy.txt",
+        path="missing.txt",
+        size=text_file.size,
+        content_type="text/plain",
+        sha256=text_file.sha256,
+    )
+    total = await AsyncFileChunkService.count_chunks(text_file.id)
+    assert await AsyncFileChunkService.ingest_file(copy) == total
+
+
+async def test_search_chunks(text_file):
+    chunks = await AsyncFileChunkService.search_chunks(
+        text_file.id, "warehouse budget", limit=1
+    )
+    assert len(chunks) == 1
+    assert "budget" in chunks[0].content
+    assert await AsyncFileChunkService.search_chunks(text_file.id, "zebra") == []
+
+
+async def invoke(tool, context: AgentContext, **arguments):
+    ctx = ToolContext(
+        context=context,
+        tool_name=tool.name,
+        tool_call_id="call",
+        tool_arguments=json.dumps(arguments),
+    )
+    return await tool.on_invoke_tool(ctx, json.dumps(arguments))
+
+
+async def test_file_tools(text_file):
+    context = AgentContext(current_file_id=str(text_file.id))
+
+    result = await invoke(read_file_chunks, context, start=0, limit=2)
+    assert result["file_name"] == "report.txt"
+    assert [c["seq"] for c in result["chunks"]] == [0, 1]
+    assert result["next_start"] == 2
+
+    result = await invoke(search_file, context, query="revenue")
+    assert all("Revenue" in c["content"] for c in result["chunks"])
+
+    result = await invoke(read_file_chunks, AgentContext())
+    assert "error" in result
+
+
+async def test_search_ranks_every_matching_chunk(
+    patch_async_engine, small_chunks, tmp_path
+):
+    # many weak matches before the one chunk that matches every term
+    paragraphs = [f"Note {i} mentions the warehouse once." for i in range(60)]
+    paragraphs.insert(50, "Q3 warehouse budget: warehouse rent and budget cuts.")
+    path = tmp_path / "notes.txt"
+    path.write_text("\n\n".join(paragraphs), encoding="utf-8")
+    file = await AsyncFileService.create_file(
+        "notes.txt",
+        path=str(path),
+        size=path.stat().st_size,
+        content_type="text/plain",
+    )
+    await wait_for_ingest()
+    assert await AsyncFileChunkService.count_chunks(file.id) > 10
+
+    (chunk,) = await AsyncFileChunkService.search_chunks(
+        file.id, "warehouse budget", limit=1
+    )
+    assert "budget" in chunk.content
+    # short terms are scored in Python, over every match as well
+    (chunk,) = await AsyncFileChunkService.search_chunks(
+        file.id, "Q3 warehouse", limit=1
+    )
+    assert chunk.content.startswith("Q3")
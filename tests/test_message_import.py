@@ -0,0 +1,80 @@
+import json
+import uuid
+import httpx
+import pytest
+from fastapi import FastAPI
+from api.message import router
+from config import settings
+from services.conversation import AsyncConversationService
+from services.message import AsyncMessageService
+
+
+@pytest.fixture
+async def client(patch_async_engine, monkeypatch):
+    monkeypatch.setattr(settings, "MESSAGE_IMPORT_BATCH_SIZE", 3)
+    app = FastAPI()
+    app.include_router(router)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        yield c
+
+
+def ndjson(messages: list[dict]) -> bytes:
+    return "".join(json.dumps(m) + "\n" for m in messages).encode()
+
+
+async def chunked(data: bytes, size: int = 7):
+    for i in range(0, len(data), size):
+        yield data[i : i + size]
+
+
+async def test_import_streams_batches(client):
+    conversation = await AsyncConversationService.create_conversation("c", {})
+    lines = [{"role": "user", "content": f"m{i}"} for i in range(8)]
+    lines[2]["created_at"] = "2020-01-01T00:00:00Z"
+    r = await client.post(
+        "/message/import",
+        params={"conversation_id": str(conversation.id)},
+        content=chunked(ndjson(lines) + b"\n"),
+    )
+    assert r.status_code == 200
+    assert r.json() == {"imported": 8}
+    messages = await AsyncMessageService.get_messages_by_conversation_id(
+        conversation.id
+    )
+    assert [m.content for m in messages] == ["m2"] + [
+        f"m{i}" for i in range(8) if i != 2
+    ]
+
+
+async def test_import_stops_at_bad_batch(client):
+    conversation = await AsyncConversationService.create_conversation("c", {})
+    lines = [
+        {"role": "user", "content": "a", "conversation_id": str(conversation.id)}
+        for _ in range(4)
+    ]
+    lines[3]["conversation_id"] = str(uuid.uuid4())
+    r = await client.post("/message/import", content=ndjson(lines))
+    assert r.status_code == 400
+    assert "lines 4-4" in r.json()["detail"]
+    assert "(3 messages imported)" in r.json()["detail"]
+
+    r = await client.post("/message/import", content=b'{"role": "user"}\nnot json\n')
+    assert r.status_code == 400
+    assert r.json()["detail"].startswith("line 2: invalid JSON")
+
+
+async def test_import_reports_existing_ids(client):
+    conversation = await AsyncConversationService.create_conversation("c", {})
+    lines = [
+        {"id": str(uuid.uuid4()), "role": "user", "content": f"m{i}"} for i in range(5)
+    ]
+    params = {"conversation_id": str(conversation.id)}
+    r = await client.post("/message/import", params=params, content=ndjson(lines[:3]))
+    assert r.json() == {"imported": 3}
+
+    # run again after a partial import, the first batch is there already
+    r = await client.post("/message/import", params=params, content=ndjson(lines))
+    assert r.status_code == 400
+    assert r.json()["detail"].startswith("lines 1-3: rows rejected by the database")
+    assert "(0 messages imported)" in r.json()["detail"]
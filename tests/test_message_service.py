@@ -1,9 +1,7 @@
 import pytest
-from services.message import MessageService
-from services.conversation import ConversationService
-from services.file import (
-    FileService,
-)  # Do not delete, it has to initialize File model in the db
+from services.message import MessageService, AsyncMessageService
+from schemas.message import MessageFilter
+from services.conversation import ConversationService, AsyncConversationService
 
 
 @pytest.fixture
@@ -50,3 +48,60 @@ def test_update_message(test_message, content, expected_content):
 def test_delete_message(test_message):
     MessageService.delete_message(test_message.id)
     assert MessageService.get_message(test_message.id) == None
+
+
+@pytest.fixture
+async def async_test_conversation(patch_async_engine):
+    return await AsyncConversationService.create_conversation("name", {})
+
+
+async def test_async_get_messages_by_conversation_id(async_test_conversation):
+    for i in range(3):
+        await AsyncMessageService.create_message(
+            role="user", content=f"Name-{i}", conversation_id=async_test_conversation.id
+        )
+    messages = await AsyncMessageService.get_messages_by_conversation_id(
+        async_test_conversation.id
+    )
+    assert [m.content for m in messages] == ["Name-0", "Name-1", "Name-2"]
+
+
+async def test_async_update_and_delete_message(async_test_conversation):
+    message = await AsyncMessageService.create_message(
+        role="user", content="test_message", conversation_id=async_test_conversation.id
+    )
+    message = await AsyncMessageService.update_message(message.id, "updated")
+    assert message.content == "updated"
+    await AsyncMessageService.delete_message(message.id)
+    assert await AsyncMessageService.get_message(message.id) is None
+
+
+def test_get_messages_page_by_conversation(test_messages, test_conversation):
+    filter = MessageFilter(conversation_id=test_conversation.id)
+    page = MessageService.get_messages_page(filter=filter, sort_order="asc", limit=6)
+    assert [m.content for m in page.items] == [f"Name-{i}" for i in range(6)]
+    page = MessageService.get_messages_page(
+        filter=filter, sort_order="asc", after=page.next_cursor, limit=6
+    )
+    assert [m.content for m in page.items] == [f"Name-{i}" for i in range(6, 10)]
+    assert page.next_cursor is None
+
+
+def test_create_messages_keeps_order(test_conversation):
+    count = MessageService.create_messages(
+        {
+            "role": "user",
+            "content": f"Bulk-{i}",
+            "conversation_id": test_conversation.id,
+        }
+        for i in range(5)
+    )
+    assert count == 5
+    messages = MessageService.get_messages_by_conversation_id(test_conversation.id)
+    assert [m.content for m in messages] == [f"Bulk-{i}" for i in range(5)]
+
+
+def test_create_messages_rejects_invalid(test_conversation):
+    with pytest.raises(ValueError):
+        MessageService.create_messages([{"role": "user"}])
+    assert MessageService.get_messages_by_conversation_id(test_conversation.id) == []
@@ -0,0 +1,66 @@
+from _agents.adapter import StreamEventAdapter
+from _agents.events import MessageDeltaEvent, ToolCalledEvent, ToolCallOutputEvent
+from metrics import (
+    Registry,
+    chat_ttft_seconds,
+    stream_events_total,
+    tool_call_seconds,
+)
+
+
+def test_render_counter_and_histogram():
+    registry = Registry()
+    counter = registry.counter("events_total", "Events.", ("event",))
+    histogram = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1))
+    registry.gauge("depth", "Depth.", lambda: 3)
+
+    counter.inc(event='say "hi"')
+    counter.inc(2, event='say "hi"')
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    text = registry.render()
+    assert "# TYPE events_total counter" in text
+    assert 'events_total{event="say \\"hi\\""} 3' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_count 3" in text
+    assert "latency_seconds_sum 5.55" in text
+    assert "depth 3" in text
+
+
+def test_scrape_sees_a_snapshot():
+    registry = Registry()
+    histogram = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1))
+    histogram.observe(0.05)
+    samples = histogram.samples()
+    assert next(samples) == 'latency_seconds_bucket{le="0.1"} 1'
+    # observed while the scrape is half way through
+    histogram.observe(0.5)
+    assert list(samples)[-1] == "latency_seconds_count 1"
+    assert histogram.count() == 2
+
+
+async def test_adapter_records_stage_metrics():
+    async def no_events():
+        return
+        yield
+
+    adapter = StreamEventAdapter(event_interator=no_events())
+    ttft_count = chat_ttft_seconds.count()
+    deltas = stream_events_total.get(event="MessageDeltaEvent")
+    tools = tool_call_seconds.count(tool="get_context")
+
+    await adapter.handle_event(MessageDeltaEvent(delta="hello"))
+    await adapter.handle_event(MessageDeltaEvent(delta=" world"))
+    await adapter.handle_event(
+        ToolCalledEvent(tool_name="get_context", tool_call_id="c1", args="{}")
+    )
+    await adapter.handle_event(ToolCallOutputEvent(output="{}", call_id="c1"))
+
+    assert chat_ttft_seconds.count() == ttft_count + 1
+    assert stream_events_total.get(event="MessageDeltaEvent") == deltas + 2
+    assert tool_call_seconds.count(tool="get_context") == tools + 1
+    assert adapter.output_chars == len("hello world")
@@ -0,0 +1,72 @@
+import pytest
+from sqlalchemy import inspect
+from sqlmodel import SQLModel, create_engine
+from migrations import MIGRATIONS, run_migrations
+
+# conversation and message tables as they were before the summary and index changes
+LEGACY_SCHEMA = [
+    """CREATE TABLE conversation (
+        id CHAR(32) NOT NULL PRIMARY KEY,
+        name VARCHAR NOT NULL,
+        state JSON,
+        created_at DATETIME NOT NULL,
+        updated_at DATETIME NOT NULL,
+        is_deleted BOOLEAN NOT NULL
+    )""",
+    """CREATE TABLE file (
+        id CHAR(32) NOT NULL PRIMARY KEY,
+        name VARCHAR NOT NULL,
+        path VARCHAR NOT NULL,
+        size INTEGER NOT NULL,
+        content_type VARCHAR NOT NULL,
+        created_at DATETIME NOT NULL,
+        updated_at DATETIME NOT NULL,
+        is_deleted BOOLEAN NOT NULL
+    )""",
+    """CREATE TABLE message (
+        id CHAR(32) NOT NULL PRIMARY KEY,
+        content VARCHAR NOT NULL,
+        role VARCHAR NOT NULL,
+        agent VARCHAR,
+        think VARCHAR,
+        conversation_id CHAR(32) NOT NULL REFERENCES conversation (id),
+        file_id CHAR(32) REFERENCES file (id),
+        created_at DATETIME NOT NULL,
+        updated_at DATETIME NOT NULL,
+        is_deleted BOOLEAN NOT NULL
+    )""",
+]
+
+
+@pytest.fixture
+def legacy_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.exec_driver_sql(statement)
+    return engine
+
+
+def test_migrations_upgrade_legacy_database(legacy_engine):
+    SQLModel.metadata.create_all(legacy_engine)
+    applied = run_migrations(legacy_engine)
+    assert applied == sorted(m.version for m in MIGRATIONS)
+
+    inspector = inspect(legacy_engine)
+    columns = {c["name"] for c in inspector.get_columns("conversation")}
+    assert {"summary", "summarized_until"} <= columns
+    assert {"tool_items", "truncated", "search_rowid"} <= {
+        c["name"] for c in inspector.get_columns("message")
+    }
+    indexes = {i["name"] for i in inspector.get_indexes("message")}
+    assert "ix_message_conversation_id_created_at" in indexes
+    assert {"message_fts", "conversation_fts"} <= set(inspector.get_table_names())
+
+    assert run_migrations(legacy_engine) == []
+
+
+def test_migrations_are_noop_on_fresh_database(test_engine):
+    applied = run_migrations(test_engine)
+    assert applied == sorted(m.version for m in MIGRATIONS)
+    indexes = {i["name"] for i in inspect(test_engine).get_indexes("conversation")}
+    assert "ix_conversation_is_deleted_updated_at" in indexes
@@ -0,0 +1,95 @@
+import asyncio
+import pytest
+from models.message import Message
+from services.conversation import AsyncConversationService
+from services.message import AsyncMessageService
+from services.persistence import PersistenceFailed, PersistenceQueue
+
+
+@pytest.fixture
+async def test_conversation(patch_async_engine):
+    return await AsyncConversationService.create_conversation("name", {})
+
+
+@pytest.fixture
+async def queue(patch_async_engine):
+    queue = PersistenceQueue(maxsize=10, batch_size=5)
+    queue.start()
+    yield queue
+    await queue.stop()
+
+
+async def test_flush_writes_queued_messages(queue, test_conversation):
+    for i in range(12):
+        await queue.put_message(
+            role="assistant", content=f"m-{i}", conversation_id=test_conversation.id
+        )
+    await queue.flush()
+    messages = await AsyncMessageService.get_messages_by_conversation_id(
+        test_conversation.id
+    )
+    assert [m.content for m in messages] == [f"m-{i}" for i in range(12)]
+
+
+async def test_state_updates_are_coalesced(queue, test_conversation):
+    await queue.put_state(test_conversation.id, {"current_agent": "a"})
+    await queue.put_state(test_conversation.id, {"current_agent": "b"})
+    await queue.flush()
+    conversation = await AsyncConversationService.get_conversation(test_conversation.id)
+    assert conversation.state == {"current_agent": "b"}
+
+
+async def test_stop_drains_queue(patch_async_engine, test_conversation):
+    queue = PersistenceQueue()
+    await queue.put_message(
+        role="user", content="late", conversation_id=test_conversation.id
+    )
+    await queue.stop()
+    messages = await AsyncMessageService.get_messages_by_conversation_id(
+        test_conversation.id
+    )
+    assert [m.content for m in messages] == ["late"]
+
+
+async def test_bad_row_fails_flush_but_not_the_batch(
+    patch_async_engine, test_conversation
+):
+    queue = PersistenceQueue(retry_delay=0)
+    await queue.put_message(
+        role="assistant", content="before", conversation_id=test_conversation.id
+    )
+    # content is NOT NULL
+    await queue.put(Message(role="assistant", conversation_id=test_conversation.id))
+    await queue.put_state(test_conversation.id, {"current_agent": "b"})
+    with pytest.raises(PersistenceFailed):
+        await queue.flush()
+
+    messages = await AsyncMessageService.get_messages_by_conversation_id(
+        test_conversation.id
+    )
+    assert [m.content for m in messages] == ["before"]
+    conversation = await AsyncConversationService.get_conversation(test_conversation.id)
+    assert conversation.state == {"current_agent": "b"}
+    # later flushes only answer for the rows queued after the failure
+    await queue.flush()
+    await queue.stop()
+
+
+async def test_bad_row_only_fails_its_own_conversation(
+    patch_async_engine, test_conversation
+):
+    other = await AsyncConversationService.create_conversation("other", {})
+    queue = PersistenceQueue(retry_delay=0)
+    await queue.put(Message(role="assistant", conversation_id=test_conversation.id))
+    await queue.put_message(role="assistant", content="ok", conversation_id=other.id)
+    # both flushes wait on the same batch
+    failed, written = await asyncio.gather(
+        queue.flush(test_conversation.id),
+        queue.flush(other.id),
+        return_exceptions=True,
+    )
+    assert isinstance(failed, PersistenceFailed)
+    assert written is None
+    messages = await AsyncMessageService.get_messages_by_conversation_id(other.id)
+    assert [m.content for m in messages] == ["ok"]
+    await queue.stop()
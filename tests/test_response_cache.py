@@ -0,0 +1,95 @@
+import time
+from agents import Agent
+from _agents.adapter import StreamEventAdapter
+from _agents.events import (
+    AgentChangedEvent,
+    EventName,
+    MessageDeltaEvent,
+    NewMessageEvent,
+    ToolCalledEvent,
+)
+from _agents.response_cache import (
+    dump_turn,
+    get_cache_key,
+    is_cacheable,
+    replay_events,
+)
+from services.cache import DiskCache, TieredCache, TTLCache
+
+
+def test_disk_cache_evicts_least_recently_read(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.db"), max_bytes=30)
+    cache.set("a", "x" * 10)
+    cache.set("b", "y" * 10)
+    assert cache.get("a") == "x" * 10
+    cache.set("c", "z" * 10)
+    assert cache.get("b") is None
+    assert cache.get("a") == "x" * 10
+    assert cache.get("c") == "z" * 10
+
+
+def test_disk_cache_expires(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.db"))
+    cache.set("a", {"v": 1}, ttl=-1)
+    cache.set("b", {"v": 2})
+    assert cache.get("a") is None
+    assert cache.get("b") == {"v": 2}
+
+    reopened = DiskCache(str(tmp_path / "cache.db"))
+    assert reopened.get("b") == {"v": 2}
+
+
+async def test_tiered_cache_promotes_disk_hits(tmp_path):
+    disk = DiskCache(str(tmp_path / "cache.db"))
+    disk.set("a", [1, 2])
+    cache = TieredCache(TTLCache(maxsize=4, ttl=60), disk)
+    assert "a" not in cache.memory
+    assert await cache.get("a") == [1, 2]
+    assert cache.memory.get("a") == [1, 2]
+    assert await cache.get("missing") is None
+
+
+def test_cache_key():
+    agent = Agent(name="triage", instructions="Be brief.")
+    history = [{"role": "user", "content": "hello   world\n"}]
+    key = get_cache_key(agent, "gpt", history, {"user": 1})
+    same = [{"role": "user", "content": " hello world"}]
+    assert get_cache_key(agent, "gpt", same, {"user": 1}) == key
+    assert get_cache_key(agent, "other", history, {"user": 1}) != key
+    assert get_cache_key(agent, "gpt", history, {"user": 2}) != key
+    changed = Agent(name="triage", instructions="Be verbose.")
+    assert get_cache_key(changed, "gpt", history, {"user": 1}) != key
+
+    dynamic = Agent(name="triage", instructions=lambda ctx, agent: "now")
+    assert get_cache_key(dynamic, "gpt", history, {}) is None
+
+
+def test_is_cacheable():
+    read = ToolCalledEvent(tool_name="search_file", tool_call_id="1", args="{}")
+    write = ToolCalledEvent(tool_name="update_seat", tool_call_id="2", args="{}")
+    assert is_cacheable([MessageDeltaEvent(delta="a"), read])
+    assert not is_cacheable([read, write])
+
+
+async def test_replay_through_adapter():
+    live = [
+        AgentChangedEvent(current_agent="faq"),
+        MessageDeltaEvent(delta="Hi"),
+        NewMessageEvent(content="Hi", think=None, agent="faq"),
+    ]
+    turn = dump_turn(live, "faq")
+    adapter = StreamEventAdapter(replay_events(turn), record=True)
+    saved = []
+
+    async def handle(event):
+        saved.append(event.content)
+
+    adapter.register_handler(EventName.NEW_MESSAGE_EVENT, handle)
+    started = time.time()
+    replayed = [event async for event in adapter.events()]
+
+    assert [type(e) for e in replayed] == [type(e) for e in live]
+    assert replayed[1].delta == "Hi"
+    assert all(e.timestamp >= started for e in replayed)
+    assert saved == ["Hi"]
+    assert adapter.recorded == replayed
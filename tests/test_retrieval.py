@@ -0,0 +1,151 @@
+import threading
+import uuid
+import numpy as np
+import pytest
+from _agents.embedding import Embedder, HashingEmbedder, get_embedder, tokenize
+from _agents.history import load_window
+from _agents.retrieval import RETRIEVAL_PREFIX, HistoryRetriever
+from _agents.vector_index import VectorIndex
+from services.conversation import AsyncConversationService
+from services.message import AsyncMessageService
+
+TOPICS = [
+    "the invoice for the warehouse lease is overdue",
+    "please book a flight to Berlin next Monday",
+    "our cat refuses to eat the new food",
+    "deploy the backend after the database migration",
+]
+
+
+def test_hashing_embedder():
+    embedder = HashingEmbedder(dim=128)
+    vectors = embedder.embed(TOPICS + ["when is the warehouse invoice due"])
+    assert vectors.shape == (5, 128)
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1)
+    assert np.array_equal(vectors[:4], embedder.embed(TOPICS))
+    scores = vectors[:4] @ vectors[4]
+    assert int(np.argmax(scores)) == 0
+
+
+def test_tokenize_cjk_bigrams():
+    assert tokenize("发票 ok") == ["发", "票", "ok", "发票"]
+
+
+class DimOnlyEmbedder(Embedder):
+    dim = 8
+
+
+def test_incomplete_embedder_fails_when_built():
+    assert isinstance(get_embedder("hashing", 16), HashingEmbedder)
+    with pytest.raises(TypeError):
+        get_embedder("tests.test_retrieval:DimOnlyEmbedder", 8)
+    with pytest.raises(ValueError):
+        get_embedder("collections:OrderedDict", 8)
+
+
+def test_vector_index_persists(tmp_path):
+    embedder = HashingEmbedder(dim=64)
+    keys = [uuid.uuid4() for _ in TOPICS]
+    group, other = uuid.uuid4(), uuid.uuid4()
+    index = VectorIndex(str(tmp_path), dim=64)
+    index.add(keys[:2], group, embedder.embed(TOPICS[:2]), watermark=["t", "id"])
+    index.add(keys[2:], other, embedder.embed(TOPICS[2:]))
+
+    reopened = VectorIndex(str(tmp_path), dim=64)
+    assert len(reopened) == 4
+    assert reopened.get_watermark(group) == ["t", "id"]
+    query = embedder.embed(["flight to Berlin"])[0]
+    assert reopened.search(query, k=1)[0][0] == keys[1]
+    assert {key for key, _ in reopened.search(query, k=5, group=other)} == set(keys[2:])
+
+
+def test_vector_index_ivf(tmp_path):
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(600, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    keys = [uuid.uuid4() for _ in range(600)]
+    index = VectorIndex(str(tmp_path), dim=16, nprobe=4, ivf_min_size=500)
+    group = uuid.uuid4()
+    index.add(keys[:300], group, vectors[:300])
+    assert index.centroids is None
+    index.add(keys[300:], group, vectors[300:])
+    assert index.centroids is not None
+    assert index.trained_size == 600
+
+    hits = index.search(vectors[42], k=3, group=group)
+    assert hits[0][0] == keys[42]
+    assert hits[0][1] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_vector_index_trains_without_blocking_search(tmp_path):
+    rng = np.random.default_rng(2)
+    vectors = rng.normal(size=(400, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    keys = [uuid.uuid4() for _ in range(400)]
+    group = uuid.uuid4()
+    index = VectorIndex(str(tmp_path), dim=16, nprobe=4, ivf_min_size=10_000)
+    index.add(keys[:300], group, vectors[:300])
+
+    fitting, release = threading.Event(), threading.Event()
+    fit = index._fit
+
+    def slow_fit(*args):
+        fitting.set()
+        release.wait(5)
+        return fit(*args)
+
+    index._fit = slow_fit
+    trainer = threading.Thread(target=index.train)
+    trainer.start()
+    assert fitting.wait(5)
+    # neither waits for the clustering
+    assert index.search(vectors[7], k=1)[0][0] == keys[7]
+    index.add(keys[300:], group, vectors[300:])
+    release.set()
+    trainer.join(5)
+
+    assert index.trained_size == 400
+    assert (index.lists[:400] >= 0).all()
+    assert index.search(vectors[350], k=1, group=group)[0][0] == keys[350]
+
+
+@pytest.fixture
+async def conversation(patch_async_engine):
+    conversation = await AsyncConversationService.create_conversation("name", {})
+    for i, topic in enumerate(TOPICS * 3):
+        await AsyncMessageService.create_message(
+            role="user" if i % 2 == 0 else "assistant",
+            content=f"{i}: {topic}",
+            conversation_id=conversation.id,
+        )
+    return conversation
+
+
+async def test_retriever_recalls_old_messages(conversation, tmp_path):
+    retriever = HistoryRetriever(str(tmp_path), dim=256, top_k=2, min_score=0.1)
+    window, truncated = await load_window(conversation.id, max_messages=4)
+    assert truncated
+
+    assert await retriever.retrieve(conversation.id, "warehouse invoice") == []
+    assert await retriever.index_until(conversation.id, window[0]) == 8
+    # nothing new below the window
+    assert await retriever.index_until(conversation.id, window[0]) == 0
+
+    messages = await retriever.retrieve(conversation.id, "warehouse invoice")
+    assert [m.content for m in messages] == [f"{i}: {TOPICS[0]}" for i in (0, 4)]
+
+    history = [{"role": "system", "content": "summary"}] + [m.dict() for m in window]
+    history = await retriever.add_relevant_history(
+        conversation.id, "warehouse invoice", history
+    )
+    assert history[0]["content"] == "summary"
+    assert history[1]["content"].startswith(RETRIEVAL_PREFIX)
+    assert len(history) == 6
+
+
+async def test_retriever_disabled(conversation, tmp_path):
+    retriever = HistoryRetriever(str(tmp_path), top_k=0)
+    history = [{"role": "user", "content": "hi"}]
+    assert (
+        await retriever.add_relevant_history(conversation.id, "hi", history) == history
+    )
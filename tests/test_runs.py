@@ -0,0 +1,121 @@
+import asyncio
+from _agents.events import MessageDeltaEvent
+from _agents.runs import RunLog, RunRegistry
+
+
+def deltas(n: int) -> list[MessageDeltaEvent]:
+    return [MessageDeltaEvent(delta=str(i)) for i in range(n)]
+
+
+async def read_all(run: RunLog, offset: int = 0) -> list[tuple[int, str]]:
+    return [(i, event.delta) async for i, event in run.read(offset)]
+
+
+async def test_read_from_offset_waits_for_new_events():
+    run = RunLog("r", buffer_size=10)
+    for event in deltas(3):
+        run.append(event)
+    reader = asyncio.create_task(read_all(run, 1))
+    await asyncio.sleep(0)
+    run.append(MessageDeltaEvent(delta="3"))
+    run.close()
+    assert await reader == [(1, "1"), (2, "2"), (3, "3")]
+
+
+async def test_spilled_events_are_read_back(tmp_path):
+    run = RunLog("r", buffer_size=4, spill_path=tmp_path / "r.ndjson")
+    for event in deltas(10):
+        run.append(event)
+    run.close()
+    assert len(run) == 10
+    assert run.available_from == 0
+    assert await read_all(run, 2) == [(i, str(i)) for i in range(2, 10)]
+    run.discard()
+    assert not (tmp_path / "r.ndjson").exists()
+
+
+async def test_spill_is_written_off_the_event_loop(tmp_path):
+    run = RunLog("r", buffer_size=4, spill_path=tmp_path / "r.ndjson")
+    for event in deltas(10):
+        run.append(event)
+    # evicted events are readable before they reach the disk
+    assert not (tmp_path / "r.ndjson").exists()
+    reader = run.read(0)
+    assert await reader.__anext__() == (0, run._spilling[0])
+    await run._spiller
+    assert len((tmp_path / "r.ndjson").read_text().splitlines()) == 6
+    run.close()
+    assert [event.delta async for _, event in reader] == [str(i) for i in range(1, 10)]
+
+
+async def test_discard_stops_readers(tmp_path):
+    run = RunLog("r", buffer_size=4, spill_path=tmp_path / "r.ndjson")
+    for event in deltas(10):
+        run.append(event)
+    await run._spiller
+    waiting = asyncio.create_task(read_all(run))
+    await asyncio.sleep(0.01)
+    # a reader catching up from the spill file when the log is dropped
+    behind = run.read(0)
+    offset, event = await behind.__anext__()
+    assert (offset, event.delta) == (0, "0")
+    run.discard()
+    assert len(await asyncio.wait_for(waiting, 1)) == 10
+    assert [item async for item in behind] == []
+    assert not (tmp_path / "r.ndjson").exists()
+
+
+async def test_without_spill_old_events_are_dropped():
+    run = RunLog("r", buffer_size=4)
+    for event in deltas(10):
+        run.append(event)
+    run.close()
+    assert run.available_from == 6
+    assert await read_all(run, 6) == [(i, str(i)) for i in range(6, 10)]
+
+
+async def test_run_without_readers_is_cancelled():
+    cancels = []
+    registry = RunRegistry(resume_timeout=0.05, ttl=0.05)
+    run = registry.create(on_cancel=lambda: cancels.append(1))
+    run.append(MessageDeltaEvent(delta="a"))
+
+    stream = registry.stream(run)
+    await stream.__anext__()
+    await stream.aclose()
+    # a reader that reattaches in time keeps the run going
+    await asyncio.sleep(0.01)
+    stream = registry.stream(run, 1)
+    reader = asyncio.create_task(stream.__anext__())
+    await asyncio.sleep(0.1)
+    assert cancels == []
+
+    reader.cancel()
+    await asyncio.gather(reader, return_exceptions=True)
+    await asyncio.sleep(0.1)
+    assert cancels == [1]
+
+    registry.finish(run)
+    await asyncio.sleep(0.1)
+    assert registry.get(run.run_id) is None
+
+
+async def test_disconnect_leaves_run():
+    cancels = []
+    registry = RunRegistry(resume_timeout=0)
+    run = registry.create(on_cancel=lambda: cancels.append(1))
+    disconnected = asyncio.Event()
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    stream = registry.stream(run, receive=receive)
+    reader = asyncio.create_task(stream.__anext__())
+    await asyncio.sleep(0)
+    disconnected.set()
+    await asyncio.sleep(0.01)
+    # noticed while the reader is still waiting for the next event
+    assert cancels == [1]
+    reader.cancel()
+    await asyncio.gather(reader, return_exceptions=True)
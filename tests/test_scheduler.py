@@ -0,0 +1,93 @@
+import asyncio
+import pytest
+from _agents.scheduler import RunScheduler, SchedulerClosed, SchedulerFull
+
+
+async def test_global_limit_queues_runs():
+    scheduler = RunScheduler(max_concurrency=1, max_waiting=5)
+    first = await scheduler.acquire("m")
+    waiter = asyncio.create_task(scheduler.acquire("m"))
+    await asyncio.sleep(0)
+    assert not waiter.done()
+    assert scheduler.stats()["waiting"] == 1
+
+    first.release()
+    second = await waiter
+    assert scheduler.stats()["running"] == 1
+    second.release()
+    assert scheduler.stats()["running"] == 0
+
+
+async def test_full_queue_is_rejected_at_once():
+    scheduler = RunScheduler(max_concurrency=1, max_waiting=1)
+    slot = await scheduler.acquire("m")
+    waiter = asyncio.create_task(scheduler.acquire("m"))
+    await asyncio.sleep(0)
+
+    with pytest.raises(SchedulerFull):
+        await scheduler.acquire("m")
+    assert scheduler.stats()["rejected"] == 1
+
+    slot.release()
+    (await waiter).release()
+
+
+async def test_wait_timeout():
+    scheduler = RunScheduler(max_concurrency=1, wait_timeout=0.01)
+    slot = await scheduler.acquire("m")
+    with pytest.raises(SchedulerFull):
+        await scheduler.acquire("m")
+    slot.release()
+    assert scheduler.stats()["waiting"] == 0
+    (await scheduler.acquire("m")).release()
+
+
+async def test_model_limit_is_per_model():
+    scheduler = RunScheduler(max_concurrency=4, model_concurrency=1, wait_timeout=0.01)
+    slot = await scheduler.acquire("a")
+    other = await scheduler.acquire("b")
+    with pytest.raises(SchedulerFull):
+        await scheduler.acquire("a")
+    assert scheduler.stats()["models"] == {"a": 1, "b": 1}
+    slot.release()
+    other.release()
+
+
+async def test_conversation_turns_are_serialized():
+    scheduler = RunScheduler(max_concurrency=4)
+    order = []
+
+    async def turn(name: str):
+        slot = await scheduler.acquire("m", conversation_id="c")
+        order.append(f"{name}-start")
+        await asyncio.sleep(0.01)
+        order.append(f"{name}-end")
+        slot.release()
+
+    await asyncio.gather(turn("a"), turn("b"), scheduler_other(scheduler, order))
+    assert order.index("a-end") < order.index("b-start")
+    assert order.index("other") < order.index("a-end")
+    assert scheduler._conversations == {}
+
+
+async def scheduler_other(scheduler: RunScheduler, order: list):
+    # a different conversation is not held up
+    slot = await scheduler.acquire("m", conversation_id="other")
+    order.append("other")
+    slot.release()
+
+
+async def test_close_rejects_new_runs_and_drain_waits_for_running():
+    scheduler = RunScheduler(max_concurrency=1, max_waiting=5)
+    slot = await scheduler.acquire("m")
+    waiter = asyncio.create_task(scheduler.acquire("m"))
+    await asyncio.sleep(0)
+
+    scheduler.close()
+    with pytest.raises(SchedulerClosed):
+        await scheduler.acquire("m")
+    assert not await scheduler.drain(timeout=0.01)
+
+    slot.release()
+    (await waiter).release()
+    assert await scheduler.drain(timeout=1)
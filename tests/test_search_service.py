@@ -0,0 +1,88 @@
+import pytest
+from sqlmodel import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+import database
+from database import init_db
+from schemas.conversation import ConversationFilter
+from services.conversation import ConversationService
+from services.message import MessageService
+from services.search import SearchService
+
+
+@pytest.fixture
+async def search_db(tmp_path, monkeypatch):
+    url = f"sqlite:///{tmp_path / 'search.db'}"
+    engine = create_engine(url)
+    async_engine = create_async_engine(url.replace("sqlite", "sqlite+aiosqlite"))
+    monkeypatch.setattr("database.engine", engine)
+    monkeypatch.setattr("database.async_engine", async_engine)
+    init_db()
+    yield
+    await async_engine.dispose()
+
+
+@pytest.fixture
+def conversations(search_db):
+    travel = ConversationService.create_conversation("Trip to Kyoto", {})
+    work = ConversationService.create_conversation("季度报告 draft", {})
+    MessageService.create_message(
+        role="user",
+        content="Which temples in Kyoto open early?",
+        conversation_id=travel.id,
+    )
+    MessageService.create_message(
+        role="assistant",
+        content="Kyoto temples such as Kiyomizu-dera open at 6am.",
+        conversation_id=travel.id,
+    )
+    MessageService.create_message(
+        role="user", content="Summarise the quarterly report", conversation_id=work.id
+    )
+    return travel, work
+
+
+async def test_search_messages_ranked_and_highlighted(conversations):
+    travel, _ = conversations
+    hits = await SearchService.search_messages("kyoto temples")
+    assert len(hits) == 2
+    assert {hit["conversation_id"] for hit in hits} == {str(travel.id)}
+    assert all("<mark>" in hit["highlight"] for hit in hits)
+    assert hits[0]["rank"] >= hits[1]["rank"]
+
+
+async def test_search_messages_in_conversation(conversations):
+    _, work = conversations
+    hits = await SearchService.search_messages("report", conversation_id=work.id)
+    assert [hit["conversation_id"] for hit in hits] == [str(work.id)]
+    assert await SearchService.search_messages("Kyoto", conversation_id=work.id) == []
+
+
+async def test_search_index_follows_updates_and_deletes(conversations):
+    travel, _ = conversations
+    message = MessageService.create_message(
+        role="user", content="pack an umbrella", conversation_id=travel.id
+    )
+    MessageService.update_message(message.id, "pack sunscreen")
+    assert await SearchService.search_messages("umbrella") == []
+    assert len(await SearchService.search_messages("sunscreen")) == 1
+    MessageService.delete_message(message.id)
+    assert await SearchService.search_messages("sunscreen") == []
+
+
+def test_conversation_filter_uses_index(conversations):
+    travel, work = conversations
+    found = ConversationService.get_conversations(filter=ConversationFilter(q="kyoto"))
+    assert [c.id for c in found] == [travel.id]
+    # short and CJK queries keep the old substring semantics
+    found = ConversationService.get_conversations(filter=ConversationFilter(q="报告"))
+    assert [c.id for c in found] == [work.id]
+
+
+async def test_search_survives_renumbered_rowids(conversations):
+    _, work = conversations
+    # what VACUUM may do to tables without an INTEGER PRIMARY KEY
+    with database.engine.begin() as conn:
+        conn.exec_driver_sql("UPDATE message SET rowid = rowid + 1000")
+    (hit,) = await SearchService.search_messages("quarterly")
+    assert hit["conversation_id"] == str(work.id)
+    assert hit["highlight"].startswith("Summarise the <mark>quarterly</mark>")
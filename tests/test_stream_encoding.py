@@ -0,0 +1,88 @@
+import asyncio
+import json
+import pytest
+from _agents.adapter import coalesce_deltas
+from _agents.encoding import CompactEncoder, SSEEncoder, StreamEncoder, get_encoder
+from _agents.events import AgentChangedEvent, MessageDeltaEvent, ThinkDeltaEvent
+
+
+async def scripted(items):
+    for item in items:
+        if isinstance(item, float):
+            await asyncio.sleep(item)
+            continue
+        yield item
+
+
+async def collect(events):
+    return [event async for event in events]
+
+
+async def test_coalesce_merges_until_other_event():
+    events = scripted(
+        [
+            MessageDeltaEvent(delta="Hel"),
+            MessageDeltaEvent(delta="lo"),
+            AgentChangedEvent(current_agent="a"),
+            MessageDeltaEvent(delta="!"),
+        ]
+    )
+    result = await collect(coalesce_deltas(events, window=1, max_bytes=1024))
+    assert [type(e) for e in result] == [
+        MessageDeltaEvent,
+        AgentChangedEvent,
+        MessageDeltaEvent,
+    ]
+    assert result[0].delta == "Hello"
+    assert result[2].delta == "!"
+
+
+async def test_coalesce_keeps_think_and_answer_apart():
+    events = scripted(
+        [
+            ThinkDeltaEvent(delta="hm"),
+            ThinkDeltaEvent(delta="m"),
+            MessageDeltaEvent(delta="Hi"),
+            MessageDeltaEvent(delta="!"),
+        ]
+    )
+    result = await collect(coalesce_deltas(events, window=1, max_bytes=1024))
+    assert [(type(e), e.delta) for e in result] == [
+        (ThinkDeltaEvent, "hmm"),
+        (MessageDeltaEvent, "Hi!"),
+    ]
+
+
+async def test_coalesce_flushes_on_size():
+    events = scripted([MessageDeltaEvent(delta="ab") for _ in range(5)])
+    result = await collect(coalesce_deltas(events, window=1, max_bytes=4))
+    assert [e.delta for e in result] == ["abab", "abab", "ab"]
+
+
+async def test_coalesce_flushes_on_window_while_source_is_quiet():
+    events = scripted(
+        [MessageDeltaEvent(delta="a"), MessageDeltaEvent(delta="b"), 0.2]
+        + [MessageDeltaEvent(delta="c")]
+    )
+    result = await collect(coalesce_deltas(events, window=0.02, max_bytes=1024))
+    assert [e.delta for e in result] == ["ab", "c"]
+
+
+def test_compact_encoding_is_smaller():
+    event = MessageDeltaEvent(delta="hi")
+    compact = CompactEncoder().encode(event)
+    assert json.loads(compact) == {"e": "d", "ts": round(event.timestamp, 3), "d": "hi"}
+    assert len(compact) < len(StreamEncoder().encode(event))
+
+
+def test_sse_event_id_is_resume_offset():
+    event = MessageDeltaEvent(delta="hi")
+    chunk = SSEEncoder().encode_at(event, 4)
+    assert chunk.startswith("id: 5\ndata: {")
+    assert chunk.endswith("}\n\n")
+    assert StreamEncoder().encode_at(event, 4) == event.serialize()
+
+
+def test_unknown_encoding():
+    with pytest.raises(ValueError):
+        get_encoder("xml")
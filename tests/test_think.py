@@ -0,0 +1,44 @@
+from _agents.events import ThinkDeltaEvent
+from _agents.think import ThinkParser, split_think
+
+
+def feed_all(deltas: list[str]) -> list[tuple[str, str]]:
+    parser = ThinkParser()
+    events = [event for delta in deltas for event in parser.feed(delta)]
+    events += parser.flush()
+    return [
+        ("think" if isinstance(e, ThinkDeltaEvent) else "text", e.delta) for e in events
+    ]
+
+
+def test_tags_within_one_delta():
+    assert feed_all(["<think>a</think>b"]) == [("think", "a"), ("text", "b")]
+
+
+def test_tags_cut_across_deltas():
+    deltas = ["<th", "ink>a", "b</", "thi", "nk>c"]
+    assert feed_all(deltas) == [
+        ("think", "a"),
+        ("think", "b"),
+        ("text", "c"),
+    ]
+
+
+def test_every_split_point_gives_the_same_text():
+    text = "x<think>why < because</think>answer <b>"
+    for i in range(len(text) + 1):
+        parts = feed_all([text[:i], text[i:]])
+        think = "".join(d for kind, d in parts if kind == "think")
+        answer = "".join(d for kind, d in parts if kind == "text")
+        assert (think, answer) == ("why < because", "xanswer <b>"), i
+
+
+def test_fragment_that_is_not_a_tag_is_flushed():
+    assert feed_all(["a <thi"]) == [("text", "a "), ("text", "<thi")]
+
+
+def test_split_think():
+    assert split_think("<think>a</think>b<think>c</think>") == ("b", "ac")
+    assert split_think("plain") == ("plain", None)
+    # cut off while thinking
+    assert split_think("<think>still") == ("", "still")